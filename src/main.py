@@ -1,10 +1,21 @@
 from flask import Flask, jsonify, request
+from utils.metrics import request_metrics
+from utils.profiling import request_profiler
 import os
 
 # إنشاء التطبيق
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'housing_secret_2025'
 
+# قياس الاستعلامات وزمن الطلبات (/metrics)
+request_metrics.init_app(app)
+
+# تحليل الأداء عند الطلب (?_profile=cprofile|sample) وسجل أبطأ الطلبات — معطلان افتراضياً
+app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED') == '1'
+app.config['PROFILING_SAMPLER'] = os.environ.get('PROFILING_SAMPLER') == '1'
+app.config['PROFILING_DIR'] = os.environ.get('PROFILING_DIR')
+request_profiler.init_app(app)
+
 # بيانات النظام
 system_data = {
     'buildings': ['K6', 'K7'],
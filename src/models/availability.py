@@ -0,0 +1,187 @@
+"""
+فهرس توفر الأسرة داخل العملية: أقنعة بتات (bitsets) على خانات الأسرة للبحث الفوري عن الأسرة الشاغرة
+"""
+
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from models.user import db
+from models.core import Building, Room, Bed
+from models.events import register_commit_listener
+
+BedSlot = namedtuple('BedSlot', [
+    'bed_id', 'bed_code', 'building_code', 'building_name',
+    'room_id', 'room_number', 'bed_number', 'price'
+])
+
+DEFAULT_MAX_AGE_SECONDS = 300
+
+def iter_slots(mask):
+    """أرقام الخانات المفعلة في القناع بالترتيب التصاعدي"""
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+class BedAvailabilityIndex:
+    """فهرس توفر الأسرة
+
+    كل سرير له خانة (bit) بترتيب (المبنى، الغرفة، السرير)، فالأسرة الشاغرة قناع واحد،
+    ولكل مبنى وغرفة قناع لخاناتهما، ولكل حد سعر قناع تراكمي للأسرة الأرخص منه.
+    تغير حالة سرير يقلب خانة واحدة بعد الـ commit؛ أي تغيير هيكلي (سرير جديد أو محذوف،
+    نقل، سعر، بيانات غرفة أو مبنى) أو مرور max_age يؤدي لإعادة البناء عند أول استعلام،
+    وهذا يغطي أيضاً التغييرات من عمليات أخرى أو من SQL مباشر.
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE_SECONDS):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._stale = True
+        self._built_at = 0.0
+        self._version = 0
+        self._slots = []
+        self._slot_of = {}
+        self._available = 0
+        self._building_masks = {}
+        self._room_masks = {}
+        self._prices = []
+        self._price_masks = [0]
+
+    def invalidate(self):
+        """طلب إعادة البناء عند الاستعلام التالي"""
+        with self._lock:
+            self._stale = True
+
+    def rebuild(self):
+        """بناء الفهرس من قاعدة البيانات باستعلام واحد"""
+        version = self._version
+        rows = db.session.execute(
+            db.select(
+                Bed.id, Bed.bed_code, Building.building_code, Building.building_name,
+                Room.id, Room.room_number, Bed.bed_number, Bed.price, Bed.status
+            )
+            .join(Room, Bed.room_id == Room.id)
+            .join(Building, Bed.building_id == Building.id)
+            .order_by(Building.building_code, Room.room_number, Bed.bed_number, Bed.id)
+        ).all()
+
+        slots = []
+        slot_of = {}
+        available = 0
+        building_masks = {}
+        room_masks = {}
+        for slot, row in enumerate(rows):
+            bed_slot = BedSlot(*row[:8])
+            bit = 1 << slot
+            slots.append(bed_slot)
+            slot_of[bed_slot.bed_id] = slot
+            building_masks[bed_slot.building_code] = building_masks.get(bed_slot.building_code, 0) | bit
+            room_masks[bed_slot.room_id] = room_masks.get(bed_slot.room_id, 0) | bit
+            if row.status == 'available':
+                available |= bit
+
+        # price_masks[i]: قناع أرخص i سرير، فيكفي bisect للحصول على قناع "السعر <= X"
+        by_price = sorted(range(len(slots)), key=lambda slot: slots[slot].price)
+        prices = [slots[slot].price for slot in by_price]
+        price_masks = [0]
+        for slot in by_price:
+            price_masks.append(price_masks[-1] | (1 << slot))
+
+        with self._lock:
+            self._slots = slots
+            self._slot_of = slot_of
+            self._available = available
+            self._building_masks = building_masks
+            self._room_masks = room_masks
+            self._prices = prices
+            self._price_masks = price_masks
+            self._built_at = time.monotonic()
+            # تغييرات تأكدت أثناء القراءة قد لا تظهر في الصفوف المقروءة
+            self._stale = version != self._version
+
+    def ensure_fresh(self):
+        """إعادة البناء إذا كان الفهرس قديماً"""
+        if self._stale or time.monotonic() - self._built_at > self.max_age:
+            self.rebuild()
+
+    def apply_changes(self, changes):
+        """تحديث الفهرس من التغييرات المؤكدة (مستمع بعد الـ commit)"""
+        with self._lock:
+            self._version += 1
+            if self._stale:
+                return
+            for change in changes:
+                if change.action == 'counters':
+                    # عدادات الإشغال في الغرف والمباني لا تغير بنية الفهرس
+                    continue
+                slot = self._slot_of.get(change.id) if change.model == 'Bed' else None
+                if slot is None or change.action != 'update' or not self._is_status_only(slot, change.values):
+                    self._stale = True
+                    return
+                if 'status' in change.values:
+                    bit = 1 << slot
+                    if change.values['status'] == 'available':
+                        self._available |= bit
+                    else:
+                        self._available &= ~bit
+
+    def _is_status_only(self, slot, values):
+        """هل التغيير لا يمس موقع السرير أو سعره (يكفي قلب خانة الحالة)"""
+        bed_slot = self._slots[slot]
+        return (
+            values.get('room_id', bed_slot.room_id) == bed_slot.room_id
+            and values.get('price', bed_slot.price) == bed_slot.price
+            and values.get('bed_code', bed_slot.bed_code) == bed_slot.bed_code
+        )
+
+    def _mask(self, building_code=None, room_id=None, max_price=None):
+        """قناع الأسرة الشاغرة ضمن النطاق المطلوب"""
+        mask = self._available
+        if building_code is not None:
+            mask &= self._building_masks.get(building_code, 0)
+        if room_id is not None:
+            mask &= self._room_masks.get(room_id, 0)
+        if max_price is not None:
+            mask &= self._price_masks[bisect_right(self._prices, max_price)]
+        return mask
+
+    def free_beds(self, building_code=None, room_id=None, max_price=None, limit=None):
+        """الأسرة الشاغرة بترتيب المبنى والغرفة والسرير (أول N سرير عند تحديد limit)"""
+        self.ensure_fresh()
+        with self._lock:
+            beds = []
+            for slot in iter_slots(self._mask(building_code, room_id, max_price)):
+                if limit is not None and len(beds) >= limit:
+                    break
+                beds.append(self._slots[slot])
+            return beds
+
+    def count_free(self, building_code=None, room_id=None, max_price=None):
+        """عدد الأسرة الشاغرة ضمن النطاق"""
+        self.ensure_fresh()
+        with self._lock:
+            return bin(self._mask(building_code, room_id, max_price)).count('1')
+
+    def rooms_with_free_beds(self, min_free=1, building_code=None, max_price=None):
+        """الغرف التي فيها min_free سرير شاغر على الأقل مع عدد الشاغر في كل منها"""
+        self.ensure_fresh()
+        with self._lock:
+            scope = self._mask(building_code, None, max_price)
+            rooms = []
+            for room_id, room_mask in self._room_masks.items():
+                free = bin(scope & room_mask).count('1')
+                if free >= min_free:
+                    first_bed = self._slots[next(iter_slots(room_mask))]
+                    rooms.append({
+                        'room_id': room_id,
+                        'building_code': first_bed.building_code,
+                        'building_name': first_bed.building_name,
+                        'room_number': first_bed.room_number,
+                        'free_beds': free
+                    })
+            rooms.sort(key=lambda room: (room['building_code'], room['room_number']))
+            return rooms
+
+bed_availability = BedAvailabilityIndex()
+register_commit_listener(bed_availability.apply_changes, models=[Bed, Room, Building])
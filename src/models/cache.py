@@ -0,0 +1,159 @@
+"""
+ذاكرة مؤقتة للبيانات المرجعية (المباني والغرف والأسرة): حفظ لكل طلب + ذاكرة TTL/LRU على مستوى العملية
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from flask import g, has_app_context
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+from models.user import db
+from models.core import Building, Room, Bed
+from models.events import register_commit_listener
+
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_MAX_ENTRIES = 2048
+
+class ReferenceCache:
+    """ذاكرة مؤقتة للبحث بالمفتاح الأساسي
+
+    المستوى الأول قاموس في flask.g يعيد نفس الكائن طوال الطلب، والثاني قيم الأعمدة
+    على مستوى العملية (TTL + LRU) تُدمج في الجلسة بـ merge(load=False) دون أي استعلام.
+    يُلغى المدخل بعد أي commit يغير السجل، وTTL يحد من قِدم التغييرات القادمة من عمليات أخرى.
+    السجل الموجود في الجلسة يُعاد كما هو (بتعديلاته غير المحفوظة)، والدمج فقط لما ليس فيها.
+    """
+
+    def __init__(self, models, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.models = {model.__name__: model for model in models}
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = dict.fromkeys(self.models, 0)
+        self.request_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, model, object_id):
+        """جلب سجل بالمفتاح الأساسي من الذاكرة أو من قاعدة البيانات"""
+        if object_id is None:
+            return None
+
+        key = (model.__name__, object_id)
+        memo = self._request_memo()
+        if memo is not None and key in memo:
+            self.request_hits += 1
+            return memo[key]
+
+        obj = self._get_cached(model, key)
+        if obj is None:
+            obj = self._load(model, key)
+
+        if memo is not None and obj is not None:
+            memo[key] = obj
+        return obj
+
+    def _request_memo(self):
+        """قاموس الطلب الحالي (إن وُجد سياق تطبيق)"""
+        if not has_app_context():
+            return None
+        if '_reference_cache' not in g:
+            g._reference_cache = {}
+        return g._reference_cache
+
+    def _get_cached(self, model, key):
+        """إعادة بناء الكائن من القيم المحفوظة ودمجه في الجلسة دون استعلام"""
+        # merge يستبدل تعديلات السجل غير المحفوظة بالقيم المحفوظة، فالموجود في الجلسة يُعاد كما هو
+        existing = db.session.identity_map.get(identity_key(model, key[1]))
+        if existing is not None:
+            return existing
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        obj = model(**values)
+        make_transient_to_detached(obj)
+        return db.session.merge(obj, load=False)
+
+    def _load(self, model, key):
+        """جلب السجل من قاعدة البيانات وحفظ قيم أعمدته"""
+        with self._lock:
+            self.misses += 1
+            generation = self._generations[key[0]]
+
+        obj = db.session.get(model, key[1])
+        if obj is None:
+            return None
+
+        values = {attr.key: getattr(obj, attr.key) for attr in inspect(model).column_attrs}
+        with self._lock:
+            # تغيير تأكد أثناء القراءة: لا نحفظ قيماً قد تكون قديمة
+            if self._generations[key[0]] == generation:
+                self._entries[key] = (time.monotonic() + self.ttl, values)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return obj
+
+    def invalidate(self, changes):
+        """إلغاء المدخلات التي غيرتها المعاملة المؤكدة (مستمع بعد الـ commit)"""
+        with self._lock:
+            for change in changes:
+                self._generations[change.model] += 1
+                self.invalidations += 1
+                if change.id is None:
+                    for key in [key for key in self._entries if key[0] == change.model]:
+                        del self._entries[key]
+                else:
+                    self._entries.pop((change.model, change.id), None)
+
+    def clear(self):
+        """تفريغ الذاكرة بالكامل"""
+        with self._lock:
+            self._entries.clear()
+            for name in self._generations:
+                self._generations[name] += 1
+
+    def stats(self):
+        """عدادات الإصابة والإخفاق وحجم الذاكرة"""
+        with self._lock:
+            lookups = self.request_hits + self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'request_hits': self.request_hits,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': ((self.request_hits + self.hits) / lookups * 100) if lookups > 0 else 0
+            }
+
+reference_cache = ReferenceCache([Building, Room, Bed])
+register_commit_listener(reference_cache.invalidate, models=[Building, Room, Bed])
+
+def get_building(building_id):
+    """مبنى بالمعرف عبر الذاكرة المؤقتة"""
+    return reference_cache.get(Building, building_id)
+
+def get_room(room_id):
+    """غرفة بالمعرف عبر الذاكرة المؤقتة"""
+    return reference_cache.get(Room, room_id)
+
+def get_bed(bed_id):
+    """سرير بالمعرف عبر الذاكرة المؤقتة"""
+    return reference_cache.get(Bed, bed_id)
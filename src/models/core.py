@@ -1,6 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, date
+from sqlalchemy import func, case, event, inspect
+from sqlalchemy.orm import Session
 from models.user import db
+from models.events import mark_changed
+from models.search import create_search_indexes, create_search_index_for_table
 
 class Building(db.Model):
     __tablename__ = 'buildings'
@@ -9,7 +13,9 @@ class Building(db.Model):
     building_code = db.Column(db.String(10), unique=True, nullable=False)  # K6, K7
     building_name = db.Column(db.String(100), nullable=True)
     total_rooms = db.Column(db.Integer, nullable=False, default=13)
-    total_beds = db.Column(db.Integer, nullable=False, default=26)
+    total_beds = db.Column(db.Integer, nullable=False, default=0)  # يُحدَّث تلقائياً مع إضافة الأسرة وحذفها
+    occupied_beds = db.Column(db.Integer, nullable=False, default=0)  # يُحدَّث تلقائياً مع حالة الأسرة
+    available_beds = db.Column(db.Integer, nullable=False, default=0)  # يُحدَّث تلقائياً مع حالة الأسرة
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # العلاقات
@@ -23,39 +29,39 @@ class Room(db.Model):
     building_id = db.Column(db.Integer, db.ForeignKey('buildings.id'), nullable=False)
     room_number = db.Column(db.Integer, nullable=False)  # 1, 2, 3, ..., 13
     room_type = db.Column(db.String(20), nullable=False, default='double')  # single, double, triple, quad
-    total_beds = db.Column(db.Integer, nullable=False, default=2)  # مرونة في عدد الأسرة
+    total_beds = db.Column(db.Integer, nullable=False, default=0)  # مرونة في عدد الأسرة؛ يُحدَّث تلقائياً مع إضافة الأسرة وحذفها
     price_per_bed = db.Column(db.Float, nullable=False, default=55.0)
     monthly_revenue = db.Column(db.Float, nullable=False)
     room_code = db.Column(db.String(20), unique=True, nullable=False)  # K601, K602, K701, K702
     status = db.Column(db.String(20), default='available')  # available, partially_occupied, fully_occupied
+    occupied_beds = db.Column(db.Integer, nullable=False, default=0)  # يُحدَّث تلقائياً مع حالة الأسرة
+    available_beds = db.Column(db.Integer, nullable=False, default=0)  # يُحدَّث تلقائياً مع حالة الأسرة
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # العلاقات
     beds = db.relationship('Bed', backref='room', lazy=True, cascade='all, delete-orphan')
     bed_assignments = db.relationship('BedAssignment', backref='room', lazy=True, cascade='all, delete-orphan')
     
-    @property
-    def occupied_beds(self):
-        return Bed.query.filter_by(room_id=self.id, status='occupied').count()
-    
-    @property
-    def available_beds(self):
-        return Bed.query.filter_by(room_id=self.id, status='available').count()
-    
     def update_monthly_revenue(self):
         """تحديث الإيرادات الشهرية بناءً على عدد الأسرة والسعر"""
         self.monthly_revenue = self.total_beds * self.price_per_bed
 
 class Bed(db.Model):
     __tablename__ = 'beds'
+    __table_args__ = (
+        db.Index('ix_beds_status', 'status'),
+        db.Index('ix_beds_building_status', 'building_id', 'status'),
+        db.Index('ix_beds_room_status', 'room_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     bed_code = db.Column(db.String(10), unique=True, nullable=False)  # K6111, K6112, K7111, K7112
-    building_id = db.Column(db.Integer, db.ForeignKey('buildings.id'), nullable=False)
-    room_id = db.Column(db.Integer, db.ForeignKey('rooms.id'), nullable=False)
+    # active_history: القيمة القديمة مطلوبة عند الحفظ لتحديث عدادات الإشغال
+    building_id = db.column_property(db.Column(db.Integer, db.ForeignKey('buildings.id'), nullable=False), active_history=True)
+    room_id = db.column_property(db.Column(db.Integer, db.ForeignKey('rooms.id'), nullable=False), active_history=True)
     bed_number = db.Column(db.Integer, nullable=False)  # 1, 2, 3, 4 (حسب عدد الأسرة في الغرفة)
     price = db.Column(db.Float, nullable=False, default=55.0)
-    status = db.Column(db.String(20), default='available')  # available, occupied, maintenance
+    status = db.column_property(db.Column(db.String(20), default='available'), active_history=True)  # available, occupied, maintenance
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # العلاقات
@@ -109,6 +115,10 @@ class Student(db.Model):
 
 class BedAssignment(db.Model):
     __tablename__ = 'bed_assignments'
+    __table_args__ = (
+        db.Index('ix_bed_assignments_student_status', 'student_id', 'status'),
+        db.Index('ix_bed_assignments_bed_status', 'bed_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
@@ -121,6 +131,11 @@ class BedAssignment(db.Model):
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('ix_payments_month_status', 'month_year', 'status'),
+        db.Index('ix_payments_student_type_status', 'student_id', 'payment_type', 'status'),
+        db.Index('ix_payments_payment_date', 'payment_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
@@ -135,6 +150,9 @@ class Payment(db.Model):
 
 class Expense(db.Model):
     __tablename__ = 'expenses'
+    __table_args__ = (
+        db.Index('ix_expenses_expense_date', 'expense_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(200), nullable=False)
@@ -149,6 +167,10 @@ class Expense(db.Model):
 
 class OverduePayment(db.Model):
     __tablename__ = 'overdue_payments'
+    __table_args__ = (
+        db.Index('ix_overdue_payments_student_status', 'student_id', 'follow_up_status'),
+        db.Index('ix_overdue_payments_month_student', 'month_due', 'student_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
@@ -161,8 +183,12 @@ class OverduePayment(db.Model):
 
 class Archive(db.Model):
     __tablename__ = 'archive'
+    __table_args__ = (
+        db.Index('ix_archive_archived_at', 'archived_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=True)
     student_name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20), nullable=True)
     national_id = db.Column(db.String(20), nullable=True)
@@ -174,65 +200,467 @@ class Archive(db.Model):
     security_deposit = db.Column(db.Float, default=0.0)
     deposit_returned = db.Column(db.Boolean, default=False)
     reason_for_leaving = db.Column(db.String(100), nullable=True)
+    refund_amount = db.Column(db.Float, default=0.0)
     notes = db.Column(db.Text, nullable=True)
+    archived_by = db.Column(db.String(50), nullable=True)
     archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # أسماء الحقول المستخدمة في مسارات الأرشيف
+    departure_reason = db.synonym('reason_for_leaving')
+    total_payments = db.synonym('total_paid')
+    total_rent_due = db.synonym('total_due')
+
+class DashboardSnapshot(db.Model):
+    __tablename__ = 'dashboard_snapshots'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    data = db.Column(db.Text, nullable=False)  # JSON
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+# فهارس البحث النصي (FTS5) تُنشأ مع جداولها في create_all
+for searchable_table in (Student.__table__, Archive.__table__):
+    event.listen(searchable_table, 'after_create', create_search_index_for_table)
+
+# عدادات الإشغال المخزنة في الغرف والمباني
+
+OCCUPANCY_COUNTERS = {'occupied': 'occupied_beds', 'available': 'available_beds'}
+
+def bed_occupancy_keys(room_id, building_id, status):
+    """العدادات التي يساهم فيها سرير بحالة معينة: [(الجدول، المعرف، العمود)]"""
+    column = OCCUPANCY_COUNTERS.get(status)
+    if column is None:
+        return []
+    return [(Room, room_id, column), (Building, building_id, column)]
+
+def bed_counter_keys(room_id, building_id, status):
+    """كل العدادات التي يساهم فيها سرير: إجمالي الأسرة في غرفته ومبناه وعداد حالته"""
+    return [(Room, room_id, 'total_beds'), (Building, building_id, 'total_beds')] + bed_occupancy_keys(room_id, building_id, status)
+
+def attribute_values(state, key):
+    """(القيمة القديمة، القيمة الجديدة) لخاصية من تاريخ التغيير في الجلسة"""
+    history = state.attrs[key].history
+    current = getattr(state.obj(), key)
+    old = history.deleted[0] if history.deleted else current
+    return old, current
+
+@event.listens_for(Session, 'after_flush')
+def update_occupancy_counters(session, flush_context):
+    """تحديث عدادات الأسرة والإشغال بزيادة/نقصان ذري في SQL ضمن نفس المعاملة لكل سرير أُضيف أو حُذف أو تغير"""
+    deltas = {}
+    
+    def add(keys, delta):
+        for key in keys:
+            deltas[key] = deltas.get(key, 0) + delta
+    
+    for obj in session.new:
+        if isinstance(obj, Bed):
+            add(bed_counter_keys(obj.room_id, obj.building_id, obj.status), 1)
+    
+    for obj in session.deleted:
+        if isinstance(obj, Bed):
+            state = inspect(obj)
+            old_values = [attribute_values(state, key)[0] for key in ('room_id', 'building_id', 'status')]
+            add(bed_counter_keys(*old_values), -1)
+    
+    for obj in session.dirty:
+        if isinstance(obj, Bed) and session.is_modified(obj, include_collections=False):
+            state = inspect(obj)
+            values = [attribute_values(state, key) for key in ('room_id', 'building_id', 'status')]
+            old_values = [old for old, _ in values]
+            new_values = [new for _, new in values]
+            if old_values != new_values:
+                add(bed_counter_keys(*old_values), -1)
+                add(bed_counter_keys(*new_values), 1)
+    
+    deltas = {key: delta for key, delta in deltas.items() if delta and key[1] is not None}
+    if not deltas:
+        return
+    
+    connection = session.connection()
+    stale = set(deltas)
+    for (model, object_id, column), delta in deltas.items():
+        table = model.__table__
+        values = {column: table.c[column] + delta}
+        if model is Room and column == 'total_beds':
+            # الإيرادات الشهرية للغرفة تتبع عدد أسرتها (كما في Room.update_monthly_revenue)
+            values['monthly_revenue'] = (table.c.total_beds + delta) * table.c.price_per_bed
+            stale.add((Room, object_id, 'monthly_revenue'))
+        connection.execute(table.update().where(table.c.id == object_id).values(values))
+    
+    # القيم المحملة في الذاكرة أصبحت قديمة؛ تُلغى بعد انتهاء الحفظ لتُقرأ من جديد
+    session.info.setdefault('stale_occupancy_counters', set()).update(stale)
+    for model in (Room, Building):
+        mark_changed(session, model, {object_id for owner, object_id, _ in deltas if owner is model}, action='counters')
+
+@event.listens_for(Session, 'after_flush_postexec')
+def expire_occupancy_counters(session, flush_context):
+    """إلغاء قيم العدادات المحدثة في الكائنات المحملة في الجلسة"""
+    stale = session.info.pop('stale_occupancy_counters', None)
+    if not stale:
+        return
+    
+    for model, object_id, column in stale:
+        identity_key = inspect(model).identity_key_from_primary_key((object_id,))
+        obj = session.identity_map.get(identity_key)
+        if obj is not None:
+            session.expire(obj, [column])
+
+def reconcile_occupancy_counters(repair=True):
+    """إعادة حساب عدادات الغرف والمباني (وإجمالي الأسرة) من جدول الأسرة وإصلاح أي انحراف
+    
+    العدادات لا تتحدث مع العمليات التي تتجاوز الـ ORM (bulk أو SQL مباشر)، وهذه الدالة تعالج ذلك.
+    """
+    drift = []
+    
+    for model, group_column in ((Room, Bed.room_id), (Building, Bed.building_id)):
+        counts = db.select(
+            group_column.label('owner_id'),
+            func.count(Bed.id).label('total_beds'),
+            func.sum(case((Bed.status == 'occupied', 1), else_=0)).label('occupied_beds'),
+            func.sum(case((Bed.status == 'available', 1), else_=0)).label('available_beds')
+        ).group_by(group_column).subquery()
+        
+        rows = db.session.execute(
+            db.select(
+                model.id,
+                model.total_beds, model.occupied_beds, model.available_beds,
+                func.coalesce(counts.c.total_beds, 0),
+                func.coalesce(counts.c.occupied_beds, 0),
+                func.coalesce(counts.c.available_beds, 0)
+            ).outerjoin(counts, counts.c.owner_id == model.id)
+        ).all()
+        
+        for object_id, *values in rows:
+            stored, actual = values[:3], values[3:]
+            if stored != actual:
+                drift.append({
+                    'table': model.__tablename__,
+                    'id': object_id,
+                    'stored': dict(zip(('total_beds', 'occupied_beds', 'available_beds'), stored)),
+                    'actual': dict(zip(('total_beds', 'occupied_beds', 'available_beds'), actual))
+                })
+                if repair:
+                    values = dict(total_beds=actual[0], occupied_beds=actual[1], available_beds=actual[2])
+                    if model is Room:
+                        values['monthly_revenue'] = actual[0] * Room.__table__.c.price_per_bed
+                    db.session.execute(
+                        model.__table__.update().where(model.__table__.c.id == object_id).values(values)
+                    )
+    
+    if repair and drift:
+        for model in (Room, Building):
+            mark_changed(db.session, model, [item['id'] for item in drift if item['table'] == model.__tablename__], action='counters')
+        db.session.commit()
+        db.session.expire_all()
+    
+    return drift
 
 # دوال مساعدة لإدارة النظام
 
+# تخطيط المباني الافتراضي: مبنيان في كل منهما 13 غرفة بسريرين
+DEFAULT_LAYOUT = [
+    {'building_code': 'K6', 'building_name': 'مبنى K6', 'rooms': 13, 'beds_per_room': 2, 'price_per_bed': 55.0},
+    {'building_code': 'K7', 'building_name': 'مبنى K7', 'rooms': 13, 'beds_per_room': 2, 'price_per_bed': 55.0}
+]
+
+ROOM_TYPES = {1: 'single', 2: 'double', 3: 'triple', 4: 'quad'}
+
 def setup_initial_data():
     """إعداد البيانات الأولية للمباني والغرف والأسرة"""
+    provision_layout(DEFAULT_LAYOUT, reconcile=False)
+    print("تم إعداد البيانات الأولية بنجاح!")
+
+def expand_layout(spec):
+    """تحويل مواصفات المباني إلى {رمز المبنى: (بيانات المبنى، {رقم الغرفة: (عدد الأسرة، السعر، النوع)})}
+
+    كل مبنى: building_code، building_name، rooms (عدد الغرف)، beds_per_room، price_per_bed،
+    room_type (اختياري)، و room_overrides اختيارياً {رقم الغرفة: {'beds', 'price_per_bed', 'room_type'}}.
+    """
+    layout = {}
+    for building in spec:
+        code = building['building_code']
+        beds_per_room = building.get('beds_per_room', 2)
+        price = float(building.get('price_per_bed', 55.0))
+        overrides = building.get('room_overrides', {})
+        rooms = {}
+        for room_number in range(1, building['rooms'] + 1):
+            override = overrides.get(room_number, {})
+            beds = override.get('beds', beds_per_room)
+            rooms[room_number] = (
+                beds,
+                float(override.get('price_per_bed', price)),
+                override.get('room_type', building.get('room_type', ROOM_TYPES.get(beds, 'quad')))
+            )
+        layout[code] = ({
+            'building_code': code,
+            'building_name': building.get('building_name', f'مبنى {code}')
+        }, rooms)
+    return layout
+
+def provision_layout(spec, reconcile=True):
+    """إنشاء أو مطابقة المباني والغرف والأسرة لتخطيط كامل في معاملة واحدة
+
+    القراءة استعلام واحد لكل جدول، والإدراج والتحديث والحذف دفعات executemany، ثم تُحسب
+    الإجماليات والعدادات للمباني المعنية بتحديثين. reconcile=False ينشئ الناقص فقط؛
+    reconcile=True يحدث الأسعار وأنواع الغرف أيضاً ويحذف الأسرة الزائدة غير المستخدمة
+    (المتاحة التي لا تخصيصات لها)، وما عداها يبقى ويُذكر في النتيجة.
+    """
+    layout = expand_layout(spec)
+    summary = dict.fromkeys((
+        'buildings_created', 'rooms_created', 'rooms_updated',
+        'beds_created', 'beds_updated', 'beds_removed', 'beds_kept'
+    ), 0)
+    
+    # المباني
+    building_ids = dict(db.session.execute(
+        db.select(Building.building_code, Building.id).where(Building.building_code.in_(layout))
+    ).all())
+    new_buildings = [data for code, (data, _) in layout.items() if code not in building_ids]
+    if new_buildings:
+        building_ids.update(db.session.execute(
+            db.insert(Building).returning(Building.building_code, Building.id), new_buildings
+        ).all())
+        summary['buildings_created'] = len(new_buildings)
+    codes_by_id = {building_id: code for code, building_id in building_ids.items()}
+    
+    # الغرف
+    existing_rooms = {}
+    for room in db.session.execute(
+        db.select(Room.id, Room.building_id, Room.room_number, Room.price_per_bed, Room.room_type)
+        .where(Room.building_id.in_(codes_by_id))
+    ):
+        existing_rooms[(codes_by_id[room.building_id], room.room_number)] = room
+    
+    new_rooms = []
+    room_updates = []
+    for code, (_, rooms) in layout.items():
+        for room_number, (beds, price, room_type) in rooms.items():
+            room = existing_rooms.get((code, room_number))
+            if room is None:
+                new_rooms.append({
+                    'building_id': building_ids[code],
+                    'room_number': room_number,
+                    'room_type': room_type,
+                    'total_beds': beds,
+                    'price_per_bed': price,
+                    'monthly_revenue': beds * price,
+                    'room_code': f"{code}{room_number:02d}"
+                })
+            elif reconcile and (room.price_per_bed != price or room.room_type != room_type):
+                room_updates.append({'id': room.id, 'price_per_bed': price, 'room_type': room_type})
+    
+    room_ids = {key: room.id for key, room in existing_rooms.items()}
+    if new_rooms:
+        for room_id, building_id, room_number in db.session.execute(
+            db.insert(Room).returning(Room.id, Room.building_id, Room.room_number), new_rooms
+        ):
+            room_ids[(codes_by_id[building_id], room_number)] = room_id
+        summary['rooms_created'] = len(new_rooms)
+    if room_updates:
+        db.session.execute(db.update(Room), room_updates)
+        summary['rooms_updated'] = len(room_updates)
+    
+    # الأسرة
+    has_assignments = db.select(BedAssignment.id).where(BedAssignment.bed_id == Bed.id).exists()
+    existing_beds = {
+        bed.bed_code: bed for bed in db.session.execute(
+            db.select(Bed.id, Bed.bed_code, Bed.price, Bed.status, has_assignments.label('used'))
+            .where(Bed.building_id.in_(codes_by_id))
+        )
+    }
     
-    # إضافة المباني
-    buildings_data = [
-        {'building_code': 'K6', 'building_name': 'مبنى K6', 'total_rooms': 13, 'total_beds': 26},
-        {'building_code': 'K7', 'building_name': 'مبنى K7', 'total_rooms': 13, 'total_beds': 26}
-    ]
-    
-    for building_data in buildings_data:
-        existing = Building.query.filter_by(building_code=building_data['building_code']).first()
-        if not existing:
-            building = Building(**building_data)
-            db.session.add(building)
-    
+    new_beds = []
+    bed_updates = []
+    wanted_codes = set()
+    for code, (_, rooms) in layout.items():
+        for room_number, (beds, price, _) in rooms.items():
+            for bed_number in range(1, beds + 1):
+                bed_code = Bed.generate_bed_code(code, room_number, bed_number)
+                wanted_codes.add(bed_code)
+                bed = existing_beds.get(bed_code)
+                if bed is None:
+                    new_beds.append({
+                        'bed_code': bed_code,
+                        'building_id': building_ids[code],
+                        'room_id': room_ids[(code, room_number)],
+                        'bed_number': bed_number,
+                        'price': price,
+                        'status': 'available'
+                    })
+                elif reconcile and bed.price != price:
+                    bed_updates.append({'id': bed.id, 'price': price})
+    
+    if new_beds:
+        db.session.execute(db.insert(Bed), new_beds)
+        summary['beds_created'] = len(new_beds)
+    if bed_updates:
+        db.session.execute(db.update(Bed), bed_updates)
+        summary['beds_updated'] = len(bed_updates)
+    
+    extra_beds = [bed for code, bed in existing_beds.items() if code not in wanted_codes]
+    removable = [bed.id for bed in extra_beds if bed.status == 'available' and not bed.used] if reconcile else []
+    if removable:
+        db.session.execute(db.delete(Bed).where(Bed.id.in_(removable)))
+        summary['beds_removed'] = len(removable)
+    summary['beds_kept'] = len(extra_beds) - len(removable)
+    
+    if any(count for key, count in summary.items() if key != 'beds_kept'):
+        refresh_layout_totals(list(codes_by_id))
+        # الكتابة تمت خارج وحدة العمل: الفهارس والذاكرات المؤقتة تُعاد بناؤها بعد الـ commit
+        for model in (Building, Room, Bed):
+            mark_changed(db.session, model)
     db.session.commit()
+    db.session.expire_all()
+    return summary
+
+def refresh_layout_totals(building_ids):
+    """إعادة حساب إجمالي الأسرة وعدادات الإشغال والإيراد للغرف والمباني المحددة بتحديثين"""
+    if not building_ids:
+        return
+    
+    def bed_count(owner_column, owner_table, status=None):
+        query = db.select(func.count(Bed.id)).where(owner_column == owner_table.c.id)
+        if status is not None:
+            query = query.where(Bed.status == status)
+        return query.scalar_subquery()
+    
+    rooms = Room.__table__
+    room_beds = bed_count(Bed.room_id, rooms)
+    db.session.execute(
+        rooms.update().where(rooms.c.building_id.in_(building_ids)).values(
+            total_beds=room_beds,
+            occupied_beds=bed_count(Bed.room_id, rooms, 'occupied'),
+            available_beds=bed_count(Bed.room_id, rooms, 'available'),
+            monthly_revenue=room_beds * rooms.c.price_per_bed
+        )
+    )
     
-    # إضافة الغرف والأسرة
-    for building in Building.query.all():
-        for room_num in range(1, 14):  # غرف 1-13
-            room_code = f"{building.building_code}{room_num:02d}"
+    buildings = Building.__table__
+    db.session.execute(
+        buildings.update().where(buildings.c.id.in_(building_ids)).values(
+            total_rooms=db.select(func.count(Room.id)).where(Room.building_id == buildings.c.id).scalar_subquery(),
+            total_beds=bed_count(Bed.building_id, buildings),
+            occupied_beds=bed_count(Bed.building_id, buildings, 'occupied'),
+            available_beds=bed_count(Bed.building_id, buildings, 'available')
+        )
+    )
+
+def upgrade_database():
+    """ترقية قاعدة بيانات موجودة: إضافة الأعمدة والفهارس المعرفة في النماذج إن لم تكن موجودة
+    
+    create_all لا يعدل الجداول الموجودة، لذلك تُضاف الأعمدة الجديدة بـ ALTER TABLE
+    والفهارس بـ CREATE INDEX، وفهارس البحث النصي مع triggers المزامنة. العملية آمنة للتكرار.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    added_columns = []
+    created_indexes = []
+    
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                table.create(connection)
+                continue
             
-            existing_room = Room.query.filter_by(room_code=room_code).first()
-            if not existing_room:
-                room = Room(
-                    building_id=building.id,
-                    room_number=room_num,
-                    room_type='double',
-                    total_beds=2,  # افتراضياً سريرين لكل غرفة
-                    price_per_bed=55.0,
-                    monthly_revenue=110.0,
-                    room_code=room_code
-                )
-                db.session.add(room)
-                db.session.commit()
-                
-                # إضافة الأسرة
-                for bed_num in range(1, room.total_beds + 1):
-                    bed_code = Bed.generate_bed_code(building.building_code, room_num, bed_num)
-                    
-                    existing_bed = Bed.query.filter_by(bed_code=bed_code).first()
-                    if not existing_bed:
-                        bed = Bed(
-                            bed_code=bed_code,
-                            building_id=building.id,
-                            room_id=room.id,
-                            bed_number=bed_num,
-                            price=55.0,
-                            status='available'
-                        )
-                        db.session.add(bed)
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE {table.name} ADD COLUMN {column_definition(column, engine.dialect)}'
+                    )
+                    added_columns.append(f'{table.name}.{column.name}')
+            
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    created_indexes.append(index.name)
+        
+        created_indexes.extend(create_search_indexes(connection))
+    
+    return {'added_columns': added_columns, 'created_indexes': created_indexes}
+
+def column_definition(column, dialect):
+    """تعريف عمود صالح لـ ALTER TABLE ADD COLUMN في SQLite (القيمة الافتراضية الثابتة إن وجدت)"""
+    definition = f'{column.name} {column.type.compile(dialect=dialect)}'
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if isinstance(default, bool):
+        default = int(default)
+    if isinstance(default, (int, float)):
+        definition += f' DEFAULT {default}'
+        if not column.nullable:
+            definition += ' NOT NULL'
+    elif isinstance(default, str):
+        escaped = default.replace("'", "''")
+        definition += f" DEFAULT '{escaped}'"
+        if not column.nullable:
+            definition += ' NOT NULL'
+    return definition
+
+def explain_query(statement):
+    """مخطط تنفيذ SQLite (EXPLAIN QUERY PLAN) لاستعلام SQLAlchemy كقائمة أسطر"""
+    compiled = statement.compile(dialect=db.engine.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup or ())
+    rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + compiled.string, params).all()
+    return [row[-1] for row in rows]
+
+def check_query_plans():
+    """التحقق من أن استعلامات لوحة التحكم والمتأخرات والتصدير تستخدم الفهارس المعرفة
     
-    db.session.commit()
-    print("تم إعداد البيانات الأولية بنجاح!")
+    يعيد قائمة بكل استعلام ومخططه والفهرس المتوقع وهل استُخدم.
+    """
+    current_month = datetime.now().strftime('%Y-%m')
+    month_start, next_month_start = get_current_month_bounds()
+    
+    active_assignments = db.select(
+        BedAssignment.bed_id, func.min(BedAssignment.id).label('assignment_id')
+    ).where(BedAssignment.status == 'active').group_by(BedAssignment.bed_id).subquery()
+    
+    paid_this_month = db.select(Payment.id).where(
+        Payment.student_id == Student.id,
+        Payment.month_year == current_month,
+        Payment.payment_type == 'rent',
+        Payment.status == 'confirmed'
+    ).exists()
+    
+    checks = [
+        ('dashboard_occupied_beds', 'ix_beds_status',
+         db.select(func.count(Bed.id)).where(Bed.status == 'occupied')),
+        ('dashboard_building_beds', 'ix_beds_building_status',
+         db.select(Building.id, func.count(Bed.id)).outerjoin(Bed, Bed.building_id == Building.id).group_by(Building.id)),
+        ('dashboard_room_beds', 'ix_beds_room_status',
+         db.select(func.count(Bed.id)).where(Bed.room_id == 1, Bed.status == 'occupied')),
+        ('dashboard_monthly_payments', 'ix_payments_month_status',
+         db.select(Payment.payment_type, func.sum(Payment.amount)).where(
+             Payment.month_year == current_month, Payment.status == 'confirmed'
+         ).group_by(Payment.payment_type)),
+        ('dashboard_monthly_expenses', 'ix_expenses_expense_date',
+         db.select(func.sum(Expense.amount)).where(
+             Expense.expense_date >= month_start, Expense.expense_date < next_month_start
+         )),
+        ('overdue_active_assignment', 'ix_bed_assignments_student_status',
+         db.select(BedAssignment.id).where(BedAssignment.student_id == 1, BedAssignment.status == 'active')),
+        ('overdue_unpaid_students', 'ix_payments_student_type_status',
+         db.select(Student.id).where(Student.status == 'active', ~paid_this_month)),
+        ('overdue_follow_up', 'ix_overdue_payments_student_status',
+         db.select(OverduePayment.id).where(OverduePayment.student_id == 1, OverduePayment.follow_up_status == 'new')),
+        ('export_payments', 'ix_payments_payment_date',
+         db.select(Payment.id).order_by(Payment.payment_date.desc())),
+        ('export_beds_assignments', 'ix_bed_assignments_bed_status',
+         db.select(Bed.id).outerjoin(active_assignments, active_assignments.c.bed_id == Bed.id)),
+    ]
+    
+    results = []
+    for name, expected_index, statement in checks:
+        plan = explain_query(statement)
+        results.append({
+            'query': name,
+            'expected_index': expected_index,
+            'uses_index': any(expected_index in line for line in plan),
+            'plan': plan
+        })
+    return results
 
 def add_bed_to_room(room_id, price=55.0):
     """إضافة سرير جديد لغرفة موجودة"""
@@ -252,7 +680,7 @@ def add_bed_to_room(room_id, price=55.0):
     if existing:
         return False, "رمز السرير موجود مسبقاً"
     
-    # إضافة السرير
+    # إضافة السرير (عدد أسرة الغرفة والمبنى وإيراد الغرفة تُحدَّث عند الحفظ)
     bed = Bed(
         bed_code=bed_code,
         building_id=room.building_id,
@@ -262,14 +690,6 @@ def add_bed_to_room(room_id, price=55.0):
         status='available'
     )
     db.session.add(bed)
-    
-    # تحديث عدد الأسرة في الغرفة
-    room.total_beds += 1
-    room.update_monthly_revenue()
-    
-    # تحديث إجمالي الأسرة في المبنى
-    building.total_beds += 1
-    
     db.session.commit()
     return True, f"تم إضافة السرير {bed_code} بنجاح"
 
@@ -282,52 +702,128 @@ def remove_bed_from_room(bed_id):
     if bed.status == 'occupied':
         return False, "لا يمكن حذف سرير مشغول"
     
-    room = Room.query.get(bed.room_id)
-    building = Building.query.get(bed.building_id)
-    
-    # حذف السرير
+    # حذف السرير (عدد أسرة الغرفة والمبنى وإيراد الغرفة تُحدَّث عند الحفظ)
     db.session.delete(bed)
-    
-    # تحديث عدد الأسرة
-    room.total_beds -= 1
-    room.update_monthly_revenue()
-    building.total_beds -= 1
-    
     db.session.commit()
     return True, f"تم حذف السرير {bed.bed_code} بنجاح"
 
+def get_current_month_bounds(today=None):
+    """حدود الشهر الحالي: (أول يوم في الشهر، أول يوم في الشهر التالي)"""
+    today = today or date.today()
+    month_start = today.replace(day=1)
+    if month_start.month == 12:
+        next_month_start = month_start.replace(year=month_start.year + 1, month=1)
+    else:
+        next_month_start = month_start.replace(month=month_start.month + 1)
+    return month_start, next_month_start
+
 def get_system_statistics():
-    """الحصول على إحصائيات النظام"""
-    total_beds = Bed.query.count()
-    occupied_beds = Bed.query.filter_by(status='occupied').count()
+    """الحصول على إحصائيات النظام باستعلام واحد"""
+    month_start, next_month_start = get_current_month_bounds()
+    current_month = month_start.strftime('%Y-%m')
+    
+    # كل إحصائية استعلام فرعي عددي داخل SELECT واحد (رحلة واحدة لقاعدة البيانات)
+    row = db.session.execute(db.select(
+        db.select(func.coalesce(func.sum(Building.total_beds), 0)).scalar_subquery().label('total_beds'),
+        db.select(func.coalesce(func.sum(Building.occupied_beds), 0)).scalar_subquery().label('occupied_beds'),
+        db.select(func.count(Student.id)).where(
+            Student.status == 'active'
+        ).scalar_subquery().label('total_students'),
+        db.select(func.coalesce(func.sum(Payment.amount), 0)).where(
+            Payment.month_year == current_month,
+            Payment.status == 'confirmed'
+        ).scalar_subquery().label('actual_revenue'),
+        # نطاق تاريخ بدلاً من extract حتى يمكن استخدام الفهرس على expense_date
+        db.select(func.coalesce(func.sum(Expense.amount), 0)).where(
+            Expense.expense_date >= month_start,
+            Expense.expense_date < next_month_start
+        ).scalar_subquery().label('total_expenses')
+    )).one()
+    
+    total_beds = row.total_beds
+    occupied_beds = row.occupied_beds
     available_beds = total_beds - occupied_beds
-    
-    total_students = Student.query.filter_by(status='active').count()
     total_revenue = total_beds * 55.0  # الإيرادات المتوقعة
     
-    # الإيرادات الفعلية
-    from sqlalchemy import func, extract
-    current_month = datetime.now().strftime('%Y-%m')
-    actual_revenue = db.session.query(func.sum(Payment.amount)).filter(
-        Payment.month_year == current_month,
-        Payment.status == 'confirmed'
-    ).scalar() or 0
-    
-    # المصروفات
-    total_expenses = db.session.query(func.sum(Expense.amount)).filter(
-        extract('month', Expense.expense_date) == datetime.now().month,
-        extract('year', Expense.expense_date) == datetime.now().year
-    ).scalar() or 0
-    
     return {
         'total_beds': total_beds,
         'occupied_beds': occupied_beds,
         'available_beds': available_beds,
-        'total_students': total_students,
+        'total_students': row.total_students,
         'expected_revenue': total_revenue,
-        'actual_revenue': actual_revenue,
-        'total_expenses': total_expenses,
-        'net_profit': actual_revenue - total_expenses,
+        'actual_revenue': row.actual_revenue,
+        'total_expenses': row.total_expenses,
+        'net_profit': row.actual_revenue - row.total_expenses,
         'occupancy_rate': (occupied_beds / total_beds * 100) if total_beds > 0 else 0
     }
 
+def get_building_statistics():
+    """إحصائيات الأسرة لكل مبنى من العدادات المخزنة في جدول المباني"""
+    rows = db.session.execute(
+        db.select(
+            Building.building_code,
+            Building.building_name,
+            Building.total_beds,
+            Building.occupied_beds
+        ).order_by(Building.id)
+    ).all()
+    
+    building_stats = []
+    for row in rows:
+        building_stats.append({
+            'building_code': row.building_code,
+            'building_name': row.building_name,
+            'total_beds': row.total_beds,
+            'occupied_beds': row.occupied_beds,
+            'available_beds': row.total_beds - row.occupied_beds,
+            'occupancy_rate': (row.occupied_beds / row.total_beds * 100) if row.total_beds > 0 else 0,
+            'expected_revenue': row.total_beds * 55
+        })
+    
+    return building_stats
+
+def get_dashboard_statistics():
+    """بيانات لوحة التحكم كاملة بعدد ثابت من الاستعلامات المجمعة مهما زاد عدد المباني"""
+    month_start, next_month_start = get_current_month_bounds()
+    current_month = month_start.strftime('%Y-%m')
+    
+    stats = get_system_statistics()
+    building_stats = get_building_statistics()
+    
+    # المدفوعات الشهرية مجمعة حسب النوع
+    payment_rows = db.session.execute(
+        db.select(Payment.payment_type, func.count(Payment.id), func.sum(Payment.amount))
+        .where(Payment.month_year == current_month, Payment.status == 'confirmed')
+        .group_by(Payment.payment_type)
+    ).all()
+    payments_by_type = {payment_type: (count, amount) for payment_type, count, amount in payment_rows}
+    
+    payment_summary = {
+        'total_payments': sum(count for count, _ in payments_by_type.values()),
+        'total_amount': sum(amount for _, amount in payments_by_type.values()),
+        'rent_payments': payments_by_type.get('rent', (0, 0))[0],
+        'deposit_payments': payments_by_type.get('deposit', (0, 0))[0]
+    }
+    
+    # المصروفات الشهرية مجمعة حسب الفئة
+    expense_rows = db.session.execute(
+        db.select(Expense.category, func.count(Expense.id), func.sum(Expense.amount))
+        .where(Expense.expense_date >= month_start, Expense.expense_date < next_month_start)
+        .group_by(Expense.category)
+    ).all()
+    expenses_by_category = {category: (count, amount) for category, count, amount in expense_rows}
+    
+    expense_summary = {
+        'total_expenses': sum(count for count, _ in expenses_by_category.values()),
+        'total_amount': sum(amount for _, amount in expenses_by_category.values()),
+        'maintenance_expenses': expenses_by_category.get('maintenance', (0, 0))[1],
+        'utilities_expenses': expenses_by_category.get('utilities', (0, 0))[1],
+        'other_expenses': expenses_by_category.get('other', (0, 0))[1]
+    }
+    
+    return {
+        'general_stats': stats,
+        'building_stats': building_stats,
+        'payment_summary': payment_summary,
+        'expense_summary': expense_summary
+    }
@@ -0,0 +1,74 @@
+"""
+إشعارات التغييرات بعد تأكيد المعاملة (commit) للفهارس والذاكرات المؤقتة داخل العملية
+"""
+
+from collections import namedtuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# action: insert / update / delete / bulk / counters — values: قيم الأعمدة المحملة وقت الحفظ
+ModelChange = namedtuple('ModelChange', ['action', 'model', 'id', 'values'])
+
+# مفتاح خاص بالوحدة: تحميلها باسمين (models.events و src.models.events) لا يخلط التغييرات
+PENDING_KEY = f'{__name__}.pending_changes'
+
+_listeners = []
+
+def register_commit_listener(callback, models=None):
+    """تسجيل دالة تُستدعى بعد كل commit بقائمة التغييرات على النماذج المحددة (أو كلها)"""
+    model_names = None if models is None else {model.__name__ for model in models}
+    _listeners.append((callback, model_names))
+    return callback
+
+def mark_changed(session, model, ids=None, action='bulk'):
+    """تسجيل تغيير تم خارج الـ ORM (bulk أو SQL مباشر) ليُبلَّغ عنه عند الـ commit
+
+    ids=None يعني أن الجدول كله قد تغير. action='counters' لتحديث عدادات الإشغال فقط.
+    """
+    pending = session.info.setdefault(PENDING_KEY, [])
+    if ids is None:
+        pending.append(ModelChange(action, model.__name__, None, {}))
+    else:
+        pending.extend(ModelChange(action, model.__name__, object_id, {}) for object_id in ids)
+
+def loaded_values(obj):
+    """قيم الأعمدة المحملة في الكائن دون تحميل ما لم يُحمَّل"""
+    state = inspect(obj)
+    return {
+        attr.key: state.dict[attr.key]
+        for attr in state.mapper.column_attrs
+        if attr.key in state.dict
+    }
+
+@event.listens_for(Session, 'after_flush')
+def collect_changes(session, flush_context):
+    """جمع الكائنات المضافة والمعدلة والمحذوفة في كل flush حتى تأكيد المعاملة"""
+    if not _listeners:
+        return
+
+    pending = session.info.setdefault(PENDING_KEY, [])
+    for action, objects in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for obj in objects:
+            if action == 'update' and not session.is_modified(obj, include_collections=False):
+                continue
+            # المفتاح الأساسي من قيم الكائن (هوية الكائنات الجديدة لا تُسجل إلا بعد انتهاء الحفظ)
+            primary_key = inspect(obj).mapper.primary_key_from_instance(obj)
+            object_id = primary_key[0] if len(primary_key) == 1 else tuple(primary_key)
+            pending.append(ModelChange(action, type(obj).__name__, object_id, loaded_values(obj)))
+
+@event.listens_for(Session, 'after_commit')
+def dispatch_changes(session):
+    """إبلاغ المستمعين بالتغييرات المؤكدة فقط"""
+    changes = session.info.pop(PENDING_KEY, None)
+    if not changes:
+        return
+
+    for callback, model_names in _listeners:
+        relevant = changes if model_names is None else [c for c in changes if c.model in model_names]
+        if relevant:
+            callback(relevant)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changes(session):
+    """التغييرات الملغاة لا تُبلَّغ"""
+    session.info.pop(PENDING_KEY, None)
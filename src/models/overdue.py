@@ -0,0 +1,135 @@
+"""
+محرك المتأخرات: كل ساكنة بلا دفعة إيجار مؤكدة لأي شهر في الفترة باستعلام واحد (anti-join)
+"""
+
+from datetime import date, timedelta
+from sqlalchemy import Date, String, and_, exists, literal, or_, union_all
+from models.user import db
+from models.core import Student, BedAssignment, Payment, OverduePayment, get_current_month_bounds
+from models.events import mark_changed
+
+# المتابعات المفتوحة تُحدَّث مبالغها وأيامها؛ المشطوبة لا تُمس
+OPEN_STATUSES = ('new', 'reminded')
+
+def month_bounds(month_start):
+    """(أول يوم، آخر يوم) للشهر"""
+    month_start, next_month_start = get_current_month_bounds(month_start)
+    return month_start, next_month_start - timedelta(days=1)
+
+def overdue_statement(month_starts, today):
+    """استعلام (الطالبة، الشهر) لكل ساكنة في الشهر دون دفعة إيجار مؤكدة له
+
+    الأشهر جدول مشتق يُربط بالتخصيصات المتداخلة معها، فالفترة كلها استعلام واحد.
+    الإيجار مستحق من أول الشهر، فالأشهر التي لم تبدأ بعد لا تدخل.
+    """
+    rows = [
+        (month_start.strftime('%Y-%m'), *month_bounds(month_start))
+        for month_start in month_starts if month_start <= today
+    ]
+    if not rows:
+        return None
+
+    # SQLite لا يدعم تسمية أعمدة VALUES في FROM، فالأشهر SELECT ثابتة مدمجة بـ UNION ALL
+    months = union_all(*[
+        db.select(
+            literal(month_due, String).label('month_due'),
+            literal(month_start, Date).label('month_start'),
+            literal(month_end, Date).label('month_end')
+        )
+        for month_due, month_start, month_end in rows
+    ]).subquery('months')
+
+    paid = exists().where(
+        Payment.student_id == BedAssignment.student_id,
+        Payment.month_year == months.c.month_due,
+        Payment.payment_type == 'rent',
+        Payment.status == 'confirmed'
+    )
+
+    return db.select(
+        Student.id.label('student_id'), Student.name, Student.phone, Student.rent_amount,
+        months.c.month_due, months.c.month_start
+    ).select_from(months).join(
+        BedAssignment, and_(
+            BedAssignment.start_date <= months.c.month_end,
+            or_(
+                BedAssignment.end_date >= months.c.month_start,
+                and_(BedAssignment.end_date.is_(None), BedAssignment.status == 'active')
+            )
+        )
+    ).join(
+        Student, Student.id == BedAssignment.student_id
+    ).where(
+        ~paid
+    ).distinct().order_by(months.c.month_due, Student.id)
+
+def find_overdue(month_starts, today=None):
+    """قائمة المتأخرات المحسوبة (دون حفظ) مع عدد أيام التأخير"""
+    today = today or date.today()
+    statement = overdue_statement(month_starts, today)
+    if statement is None:
+        return []
+
+    return [{
+        'student_id': row.student_id,
+        'name': row.name,
+        'phone': row.phone,
+        'month_due': row.month_due,
+        'amount_due': row.rent_amount,
+        'days_overdue': (today - row.month_start).days
+    } for row in db.session.execute(statement)]
+
+def refresh_overdue_payments(month_starts, today=None):
+    """حساب المتأخرات للفترة وحفظها في overdue_payments دفعة واحدة
+
+    السجلات الجديدة تُدرج، والمفتوحة تُحدَّث أيامها ومبالغها، والمفتوحة التي سُددت
+    تصبح collected، والمحصلة التي عاد شهرها غير مسدد (إلغاء الدفعة) تُفتح من جديد.
+    """
+    today = today or date.today()
+    overdue = find_overdue(month_starts, today)
+    month_keys = [month_start.strftime('%Y-%m') for month_start in month_starts if month_start <= today]
+
+    existing = {}
+    if month_keys:
+        for record in db.session.query(
+            OverduePayment.id, OverduePayment.student_id, OverduePayment.month_due, OverduePayment.follow_up_status
+        ).filter(OverduePayment.month_due.in_(month_keys)):
+            existing[(record.student_id, record.month_due)] = record
+
+    inserts = []
+    updates = []
+    reopened = 0
+    for item in overdue:
+        record = existing.pop((item['student_id'], item['month_due']), None)
+        amounts = {'amount_due': item['amount_due'], 'days_overdue': item['days_overdue']}
+        if record is None:
+            inserts.append(dict(amounts, student_id=item['student_id'], month_due=item['month_due'], follow_up_status='new'))
+        elif record.follow_up_status in OPEN_STATUSES:
+            updates.append(dict(amounts, id=record.id))
+        elif record.follow_up_status == 'collected':
+            updates.append(dict(amounts, id=record.id, follow_up_status='new'))
+            reopened += 1
+
+    # ما بقي من السجلات المفتوحة لم يعد متأخراً: سُدد
+    collected = [
+        {'id': record.id, 'follow_up_status': 'collected'}
+        for record in existing.values() if record.follow_up_status in OPEN_STATUSES
+    ]
+
+    if inserts:
+        db.session.bulk_insert_mappings(OverduePayment, inserts)
+    if updates or collected:
+        db.session.bulk_update_mappings(OverduePayment, updates + collected)
+    if inserts or updates or collected:
+        mark_changed(db.session, OverduePayment)
+    db.session.commit()
+
+    return {
+        'months': month_keys,
+        'overdue': len(overdue),
+        'created': len(inserts),
+        'updated': len(updates) - reopened,
+        'reopened': reopened,
+        'collected': len(collected),
+        'total_amount_due': sum(item['amount_due'] or 0 for item in overdue)
+    }
@@ -0,0 +1,130 @@
+"""
+ترقيم الصفحات بالمفتاح (keyset) واختيار الحقول على مستوى SQL لقوائم الـ API
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def parse_fields(raw_fields, available_fields):
+    """تحليل معامل fields= وإرجاع الحقول المطلوبة بترتيب الطلب (كل الحقول إذا كان فارغاً)"""
+    if not raw_fields:
+        return list(available_fields)
+
+    fields = []
+    for field in raw_fields.split(','):
+        field = field.strip()
+        if field and field not in fields:
+            fields.append(field)
+
+    unknown = [field for field in fields if field not in available_fields]
+    if unknown:
+        raise ValueError(f'حقول غير معروفة: {", ".join(unknown)}')
+
+    return fields
+
+def parse_limit(raw_limit, default=DEFAULT_PAGE_SIZE):
+    """حجم الصفحة ضمن الحدود المسموحة"""
+    if raw_limit is None:
+        return default
+    limit = int(raw_limit)
+    if limit < 1:
+        raise ValueError('حجم الصفحة يجب أن يكون 1 على الأقل')
+    return min(limit, MAX_PAGE_SIZE)
+
+def encode_cursor(values):
+    """ترميز قيم المفتاح لآخر صف كمؤشر نصي"""
+    payload = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    encoded = base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+    return encoded.rstrip('=')
+
+def decode_cursor(cursor, key_columns):
+    """فك ترميز المؤشر إلى قيم مطابقة لأنواع أعمدة المفتاح"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('مؤشر الصفحة غير صالح')
+
+    if not isinstance(values, list) or len(values) != len(key_columns):
+        raise ValueError('مؤشر الصفحة غير صالح')
+
+    decoded = []
+    for column, value in zip(key_columns, values):
+        try:
+            decoded.append(decode_cursor_value(column.type.python_type, value))
+        except (TypeError, ValueError):
+            # مؤشر JSON صالح بقيمة من نوع خاطئ (رقم مكان تاريخ مثلاً)
+            raise ValueError('مؤشر الصفحة غير صالح')
+    return decoded
+
+def decode_cursor_value(python_type, value):
+    """قيمة واحدة من المؤشر بنوع عمودها؛ TypeError أو ValueError للقيمة غير المطابقة"""
+    if value is None:
+        return None
+    if python_type in (date, datetime):
+        if not isinstance(value, str):
+            raise TypeError(value)
+        return python_type.fromisoformat(value)
+    if python_type in (int, float):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise TypeError(value)
+        return value
+    if not isinstance(value, (str, int, float)):
+        raise TypeError(value)
+    return value
+
+def keyset_condition(key_columns, values, descending=False):
+    """شرط "بعد آخر صف" لمفتاح مركب: (a, b) > (va, vb) مفكوكاً ليستفيد من الفهارس"""
+    conditions = []
+    for i, column in enumerate(key_columns):
+        equal_prefix = [key_columns[j] == values[j] for j in range(i)]
+        after = column < values[i] if descending else column > values[i]
+        conditions.append(and_(*equal_prefix, after))
+    return or_(*conditions)
+
+def keyset_paginate(query, key_columns, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=False):
+    """جلب صفحة واحدة مرتبة على مفتاح ثابت مفهرس، وإرجاع (الصفوف، مؤشر الصفحة التالية)
+
+    يجب أن تكون أعمدة المفتاح ضمن أعمدة الاستعلام بنفس أسمائها حتى يمكن قراءتها من آخر صف.
+    """
+    if cursor:
+        values = decode_cursor(cursor, key_columns)
+        query = query.filter(keyset_condition(key_columns, values, descending))
+
+    order = [column.desc() if descending else column.asc() for column in key_columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in key_columns])
+
+    return rows, next_cursor
+
+def project_columns(field_columns, fields, key_columns=()):
+    """أعمدة SELECT للحقول المطلوبة فقط، مع إضافة أعمدة المفتاح اللازمة للمؤشر"""
+    columns = [field_columns[field].label(field) for field in fields if field in field_columns]
+    selected = set(fields)
+    for column in key_columns:
+        if column.key not in selected:
+            columns.append(column.label(column.key))
+    return columns
+
+def serialize_row(row, fields, formatters=None):
+    """تحويل صف مُسقَط إلى قاموس بالحقول المطلوبة فقط"""
+    formatters = formatters or {}
+    item = {}
+    for field in fields:
+        value = getattr(row, field, None)
+        if field in formatters:
+            value = formatters[field](value)
+        elif isinstance(value, (date, datetime)):
+            value = value.isoformat()
+        item[field] = value
+    return item
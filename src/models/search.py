@@ -0,0 +1,192 @@
+"""
+البحث النصي الكامل (SQLite FTS5) في الطالبات والأرشيف: جداول فهرسة خارجية المحتوى تُزامَن بالـ triggers
+"""
+
+from collections import namedtuple
+from itertools import product
+from sqlalchemy import text
+from models.user import db
+
+SearchIndex = namedtuple('SearchIndex', ['name', 'table', 'columns', 'weights', 'label_column'])
+
+# الأوزان لترتيب bm25: الاسم أهم من الهاتف والهوية، والملاحظات أقلها
+SEARCH_INDEXES = {
+    'students': SearchIndex(
+        'students_fts', 'students',
+        ['name', 'phone', 'national_id', 'guardian_phone', 'university', 'notes'],
+        [10.0, 5.0, 5.0, 3.0, 2.0, 1.0],
+        'name'
+    ),
+    'archive': SearchIndex(
+        'archive_fts', 'archive',
+        ['student_name', 'phone', 'national_id', 'notes'],
+        [10.0, 5.0, 5.0, 1.0],
+        'student_name'
+    )
+}
+
+# مقطع trigram يطابق أي جزء من النص بطول 3 محارف فأكثر (جزء من رقم هاتف أو اسم)
+MIN_TERM_LENGTH = 3
+
+DIGITS_TRANSLATION = {0x0660 + digit: str(digit) for digit in range(10)}
+DIGITS_TRANSLATION.update({0x06F0 + digit: str(digit) for digit in range(10)})
+
+# الفهرس يحفظ النص كما كُتب، فتُبحث الكلمة بكل صيغ الهمزة والتاء المربوطة والياء
+SPELLING_VARIANTS = [set('اأإآ'), set('هة'), set('يى')]
+MAX_TERM_VARIANTS = 16
+
+def search_index_ddl(index):
+    """أوامر إنشاء جدول FTS5 والـ triggers التي تزامنه مع الجدول الأصلي"""
+    columns = ', '.join(index.columns)
+    new_values = ', '.join(f'new.{column}' for column in index.columns)
+    old_values = ', '.join(f'old.{column}' for column in index.columns)
+    insert = f'INSERT INTO {index.name}(rowid, {columns}) VALUES (new.id, {new_values});'
+    delete = f"INSERT INTO {index.name}({index.name}, rowid, {columns}) VALUES ('delete', old.id, {old_values});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {index.name} USING fts5("
+        f"{columns}, content='{index.table}', content_rowid='id', tokenize='trigram')",
+        f'CREATE TRIGGER IF NOT EXISTS {index.name}_ai AFTER INSERT ON {index.table} BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS {index.name}_ad AFTER DELETE ON {index.table} BEGIN {delete} END',
+        # تغيير الحالة أو المبالغ لا يعيد فهرسة السجل
+        f'CREATE TRIGGER IF NOT EXISTS {index.name}_au AFTER UPDATE OF {columns} ON {index.table} '
+        f'BEGIN {delete} {insert} END'
+    ]
+
+def create_search_index(connection, index):
+    """إنشاء فهرس البحث إن لم يكن موجوداً وملؤه من البيانات الحالية؛ يعيد True عند الإنشاء"""
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (index.name,)
+    ).first()
+    for statement in search_index_ddl(index):
+        connection.exec_driver_sql(statement)
+    if exists:
+        return False
+    connection.exec_driver_sql(f"INSERT INTO {index.name}({index.name}) VALUES ('rebuild')")
+    return True
+
+def create_search_indexes(connection):
+    """إنشاء كل فهارس البحث الناقصة (SQLite فقط)؛ يعيد أسماء الفهارس المنشأة"""
+    if connection.dialect.name != 'sqlite':
+        return []
+    return [index.name for index in SEARCH_INDEXES.values() if create_search_index(connection, index)]
+
+def create_search_index_for_table(table, connection, **kwargs):
+    """مستمع after_create: إنشاء فهرس البحث مع الجدول في create_all"""
+    if connection.dialect.name != 'sqlite':
+        return
+    for index in SEARCH_INDEXES.values():
+        if index.table == table.name:
+            create_search_index(connection, index)
+
+def rebuild_search_indexes():
+    """إعادة بناء فهارس البحث بالكامل من الجداول الأصلية"""
+    with db.engine.begin() as connection:
+        for index in SEARCH_INDEXES.values():
+            connection.exec_driver_sql(f"INSERT INTO {index.name}({index.name}) VALUES ('rebuild')")
+
+def parse_search_terms(query):
+    """كلمات البحث: (كلمات بطول 3 فأكثر لـ MATCH، كلمات أقصر تُطابق بـ LIKE)"""
+    terms = str(query or '').translate(DIGITS_TRANSLATION).split()
+    long_terms = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+    short_terms = [term for term in terms if len(term) < MIN_TERM_LENGTH]
+    return long_terms, short_terms
+
+def term_variants(term):
+    """صيغ الكتابة البديلة للكلمة (فاطمه -> فاطمة، احمد -> أحمد) بحد أقصى MAX_TERM_VARIANTS"""
+    options = []
+    for char in term:
+        group = next((group for group in SPELLING_VARIANTS if char in group), None)
+        options.append(sorted(group) if group else [char])
+    variants = [term]
+    for chars in product(*options):
+        if len(variants) >= MAX_TERM_VARIANTS:
+            break
+        variant = ''.join(chars)
+        if variant != term:
+            variants.append(variant)
+    return variants
+
+def match_expression(terms):
+    """تعبير MATCH: كل كلمة عبارة بين علامتي تنصيص (لا تُفسر كصيغة FTS) ويجب وجودها كلها"""
+    clauses = []
+    for term in terms:
+        phrases = ['"' + variant.replace('"', '""') + '"' for variant in term_variants(term)]
+        clauses.append(phrases[0] if len(phrases) == 1 else '(' + ' OR '.join(phrases) + ')')
+    return ' AND '.join(clauses)
+
+def like_conditions(index, terms, alias, prefix):
+    """شروط LIKE على أعمدة الفهرس للكلمات الأقصر من مقطع trigram"""
+    conditions = []
+    params = {}
+    for i, term in enumerate(terms):
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        params[f'{prefix}_term_{i}'] = f'%{escaped}%'
+        conditions.append('(' + ' OR '.join(
+            f"{alias}.{column} LIKE :{prefix}_term_{i} ESCAPE '\\'" for column in index.columns
+        ) + ')')
+    return conditions, params
+
+def search_filter(index, query, alias, prefix='search'):
+    """(شرط SQL على الجدول الأصلي، المعاملات) لمطابقة كل كلمات البحث
+
+    الكلمات بطول 3 فأكثر تُبحث في فهرس FTS5، والأقصر منها بـ LIKE على أعمدة الفهرس.
+    """
+    long_terms, short_terms = parse_search_terms(query)
+    conditions, params = like_conditions(index, short_terms, alias, prefix)
+    if long_terms:
+        conditions.insert(0, f'{alias}.id IN (SELECT rowid FROM {index.name} WHERE {index.name} MATCH :{prefix}_match)')
+        params[f'{prefix}_match'] = match_expression(long_terms)
+    return ' AND '.join(conditions), params
+
+def matching_ids(scope, query):
+    """استعلام فرعي بمعرفات السجلات المطابقة (للدمج مع استعلامات القوائم الحالية)، أو None لبحث فارغ"""
+    index = SEARCH_INDEXES[scope]
+    condition, params = search_filter(index, query, index.table)
+    if not condition:
+        return None
+    return text(f'SELECT {index.table}.id FROM {index.table} WHERE {condition}').bindparams(**params)
+
+def ranked_select(scope, query):
+    """(استعلام النتائج مرتبة بـ bm25، المعاملات) لنطاق واحد"""
+    index = SEARCH_INDEXES[scope]
+    long_terms, short_terms = parse_search_terms(query)
+    conditions, params = like_conditions(index, short_terms, 'record', scope)
+
+    if long_terms:
+        # الترتيب من FTS5 مباشرة؛ الكلمات القصيرة شرط إضافي على الصفوف المطابقة
+        conditions.insert(0, f'{index.name} MATCH :{scope}_match')
+        params[f'{scope}_match'] = match_expression(long_terms)
+        source = f'{index.name} JOIN {index.table} AS record ON record.id = {index.name}.rowid'
+        weights = ', '.join(str(weight) for weight in index.weights)
+        score = f'bm25({index.name}, {weights})'
+    else:
+        source = f'{index.table} AS record'
+        score = '0.0'
+
+    return (
+        f"SELECT '{scope}' AS scope, record.id AS id, record.{index.label_column} AS name, "
+        f'record.phone AS phone, record.national_id AS national_id, {score} AS score '
+        f"FROM {source} WHERE {' AND '.join(conditions)}",
+        params
+    )
+
+def search_records(query, scopes=('students', 'archive'), page=1, per_page=20):
+    """بحث مرتب بالصلة في الطالبات والأرشيف مع ترقيم الصفحات: (النتائج، العدد الكلي)"""
+    long_terms, short_terms = parse_search_terms(query)
+    if not long_terms and not short_terms:
+        return [], 0
+
+    selects = []
+    params = {}
+    for scope in scopes:
+        select, scope_params = ranked_select(scope, query)
+        selects.append(select)
+        params.update(scope_params)
+    union = ' UNION ALL '.join(selects)
+
+    total = db.session.execute(text(f'SELECT count(*) FROM ({union})'), params).scalar()
+    rows = db.session.execute(
+        text(f'SELECT * FROM ({union}) ORDER BY score, scope DESC, id DESC LIMIT :limit OFFSET :offset'),
+        dict(params, limit=per_page, offset=(page - 1) * per_page)
+    ).mappings().all()
+    return [dict(row) for row in rows], total
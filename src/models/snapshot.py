@@ -0,0 +1,141 @@
+"""
+لقطة مخزنة لإحصائيات لوحة التحكم تُلغى عند تأكيد تغييرات على البيانات المالية أو الإشغال
+"""
+
+import json
+import threading
+import time
+from datetime import datetime
+from flask import current_app, has_app_context
+from models.user import db
+from models.core import (
+    Building, Bed, BedAssignment, Student, Payment, Expense, DashboardSnapshot,
+    get_dashboard_statistics
+)
+from models.events import register_commit_listener
+
+DEFAULT_MAX_STALENESS_SECONDS = 60
+SNAPSHOT_NAME = 'dashboard'
+
+class DashboardSnapshotCache:
+    """لقطة لوحة التحكم في الذاكرة
+
+    تُعاد اللقطة كما هي حتى يُؤكَّد تغيير على المدفوعات أو المصروفات أو الأسرة أو التسكين
+    أو الطالبات، أو تتجاوز أقصى قِدم مسموح (DASHBOARD_MAX_STALENESS) لتغطية تغييرات العمليات
+    الأخرى وبداية شهر جديد. إعادة الحساب تتم مرة واحدة مهما كان عدد الطلبات المتزامنة.
+    عند تفعيل DASHBOARD_SNAPSHOT_PERSIST تُحفظ اللقطة في جدول dashboard_snapshots لتستفيد
+    منها العمليات الأخرى وإعادة التشغيل ما دامت ضمن أقصى قِدم.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._computed_at = None
+        self._computed_monotonic = 0.0
+        self._version = 0
+        self._data_version = None
+        self.hits = 0
+        self.recomputes = 0
+
+    def invalidate(self, changes=None):
+        """إلغاء اللقطة (مستمع بعد الـ commit)"""
+        self._version += 1
+
+    def get(self, max_staleness=None):
+        """(بيانات اللقطة، وصفها) مع إعادة الحساب عند الحاجة"""
+        if max_staleness is None:
+            max_staleness = configured_max_staleness()
+
+        data = self._current(max_staleness)
+        if data is None:
+            with self._lock:
+                data = self._current(max_staleness)
+                if data is None:
+                    data = self._recompute(max_staleness)
+        else:
+            self.hits += 1
+
+        return data, {
+            'computed_at': self._computed_at.isoformat(),
+            'age_seconds': round(time.monotonic() - self._computed_monotonic, 3),
+            'max_staleness_seconds': max_staleness
+        }
+
+    def _current(self, max_staleness):
+        """اللقطة الحالية إن كانت صالحة"""
+        if self._data is None or self._data_version != self._version:
+            return None
+        if time.monotonic() - self._computed_monotonic > max_staleness:
+            return None
+        return self._data
+
+    def _recompute(self, max_staleness):
+        """حساب اللقطة (أو تحميلها من الجدول إن كانت حديثة بما يكفي)"""
+        version = self._version
+        persist = has_app_context() and current_app.config.get('DASHBOARD_SNAPSHOT_PERSIST', False)
+
+        data = computed_at = None
+        if persist and self._data is None:
+            data, computed_at = load_persisted_snapshot(max_staleness)
+
+        if data is None:
+            data = get_dashboard_statistics()
+            computed_at = datetime.utcnow()
+            self.recomputes += 1
+            if persist:
+                save_persisted_snapshot(data, computed_at)
+
+        age = (datetime.utcnow() - computed_at).total_seconds()
+        self._data = data
+        self._data_version = version
+        self._computed_at = computed_at
+        self._computed_monotonic = time.monotonic() - age
+        return data
+
+    def stats(self):
+        """عدادات استخدام اللقطة"""
+        return {
+            'hits': self.hits,
+            'recomputes': self.recomputes,
+            'computed_at': self._computed_at.isoformat() if self._computed_at else None
+        }
+
+def configured_max_staleness():
+    """أقصى قِدم مسموح للقطة من إعدادات التطبيق"""
+    if has_app_context():
+        return current_app.config.get('DASHBOARD_MAX_STALENESS', DEFAULT_MAX_STALENESS_SECONDS)
+    return DEFAULT_MAX_STALENESS_SECONDS
+
+def load_persisted_snapshot(max_staleness):
+    """قراءة اللقطة المحفوظة إن كانت أحدث من أقصى قِدم مسموح"""
+    record = DashboardSnapshot.query.filter_by(name=SNAPSHOT_NAME).first()
+    if not record or (datetime.utcnow() - record.computed_at).total_seconds() > max_staleness:
+        return None, None
+    return json.loads(record.data), record.computed_at
+
+def save_persisted_snapshot(data, computed_at):
+    """حفظ اللقطة في جدول الملخصات في جلسة مستقلة عن جلسة الطلب"""
+    with db.engine.begin() as connection:
+        table = DashboardSnapshot.__table__
+        values = {'data': json.dumps(data, ensure_ascii=False), 'computed_at': computed_at}
+        updated = connection.execute(table.update().where(table.c.name == SNAPSHOT_NAME).values(values))
+        if updated.rowcount == 0:
+            connection.execute(table.insert().values(name=SNAPSHOT_NAME, **values))
+
+dashboard_snapshot = DashboardSnapshotCache()
+register_commit_listener(
+    dashboard_snapshot.invalidate,
+    models=[Payment, Expense, Bed, BedAssignment, Student, Building]
+)
+
+def get_dashboard_snapshot(max_staleness=None):
+    """بيانات لوحة التحكم من اللقطة المخزنة"""
+    return dashboard_snapshot.get(max_staleness)
+
+def get_cached_system_statistics():
+    """الإحصائيات العامة من اللقطة المخزنة"""
+    return dashboard_snapshot.get()[0]['general_stats']
+
+def get_cached_building_statistics():
+    """إحصائيات المباني من اللقطة المخزنة"""
+    return dashboard_snapshot.get()[0]['building_stats']
@@ -0,0 +1,19 @@
+"""
+فهرس أسماء الطالبات للنظام الأساسي (ربط المدفوعات والمحادثة والاستيراد بالطالبة الصحيحة)
+"""
+
+from models.core import Student
+from models.events import register_commit_listener
+from utils.arabic import normalize_arabic
+from utils.names import StudentNameIndex
+
+student_names = StudentNameIndex(Student, normalize=normalize_arabic)
+register_commit_listener(student_names.apply_changes, models=[Student])
+
+def find_students(name, limit=5):
+    """الطالبات المرشحات لاسم مرتبات حسب التشابه"""
+    return student_names.search(name, limit)
+
+def resolve_student(name):
+    """(معرف الطالبة، المرشحون) — المعرف None ما لم يكن التطابق تاماً ووحيداً"""
+    return student_names.resolve(name)
@@ -1,6 +1,10 @@
 from flask import Blueprint, request, jsonify, session
 from src.routes.auth import login_required
 from src.models.housing import db, Building, Room, Student, BedAssignment, FinancialRecord, Expense, OverduePayment
+from src.utils.intents import IntentMatcher
+from src.utils.arabic import normalize_arabic, normalize_message
+from src.utils.names import StudentNameIndex
+from src.models.events import register_commit_listener
 from datetime import datetime, date
 import re
 import json
@@ -23,28 +27,42 @@ def process_chat_message():
     except Exception as e:
         return jsonify({'error': f'حدث خطأ: {str(e)}'}), 500
 
+# أوامر المحادثة مرتبة حسب الأولوية؛ قائمة المجموعات تعني وجوب كلمة من كل مجموعة
+COMMAND_MATCHER = IntentMatcher([
+    ('available_rooms', ['غرف', 'متاح', 'فارغ', 'شاغر']),
+    ('overdue_payments', ['متأخر', 'دفع', 'مستحق']),
+    ('students_list', ['طالبات', 'قائمة', 'أسماء']),
+    ('payment_registration', [['سجل', 'دفع'], ['ريال', 'مبلغ']]),
+    ('expense_registration', ['مصروف', 'فاتورة', 'تكلفة'])
+], normalize=normalize_arabic)
+
+# فهرس أسماء الطالبات لربط الدفعات بالطالبة الصحيحة دون مسح LIKE
+STUDENT_NAMES = StudentNameIndex(Student, normalize=normalize_arabic)
+register_commit_listener(STUDENT_NAMES.apply_changes, models=[Student])
+
 def process_user_command(message):
     """معالجة أوامر المستخدم وإرجاع الرد المناسب"""
-    message_lower = message.lower()
+    message = normalize_message(message)
+    command = COMMAND_MATCHER.match(message.text, default=None, normalized=True)
     
     # أوامر عرض الغرف المتاحة
-    if any(keyword in message_lower for keyword in ['غرف', 'متاح', 'فارغ', 'شاغر']):
+    if command == 'available_rooms':
         return get_available_rooms()
     
     # أوامر المتأخرات في الدفع
-    elif any(keyword in message_lower for keyword in ['متأخر', 'دفع', 'مستحق']):
+    elif command == 'overdue_payments':
         return get_overdue_payments()
     
     # أوامر قائمة الطالبات
-    elif any(keyword in message_lower for keyword in ['طالبات', 'قائمة', 'أسماء']):
+    elif command == 'students_list':
         return get_students_list()
     
     # أوامر تسجيل الدفعات
-    elif any(keyword in message_lower for keyword in ['سجل', 'دفع']) and any(keyword in message_lower for keyword in ['ريال', 'مبلغ']):
+    elif command == 'payment_registration':
         return process_payment_registration(message)
     
     # أوامر تسجيل المصروفات
-    elif any(keyword in message_lower for keyword in ['مصروف', 'فاتورة', 'تكلفة']):
+    elif command == 'expense_registration':
         return process_expense_registration(message)
     
     # رد افتراضي
@@ -98,32 +116,31 @@ def get_overdue_payments():
     try:
         current_month = datetime.now().strftime('%Y-%m')
         
-        # البحث عن الطالبات المتأخرات
-        overdue_students = db.session.query(Student, BedAssignment, Room).join(
+        # الطالبات الساكنات بلا دفعة مؤكدة لهذا الشهر باستعلام واحد (anti-join)
+        paid_this_month = db.session.query(FinancialRecord.id).filter(
+            FinancialRecord.student_id == Student.id,
+            FinancialRecord.month_for == current_month,
+            FinancialRecord.status == 'confirmed'
+        ).exists()
+        
+        overdue_students = db.session.query(
+            Student.name, Student.phone, Room.room_number, Room.price_per_bed
+        ).join(
             BedAssignment, Student.id == BedAssignment.student_id
         ).join(
             Room, BedAssignment.room_id == Room.id
         ).filter(
-            BedAssignment.status == 'active'
-        ).all()
-        
-        overdue_list = []
-        
-        for student, assignment, room in overdue_students:
-            # التحقق من وجود دفعة لهذا الشهر
-            payment_exists = FinancialRecord.query.filter_by(
-                student_id=student.id,
-                payment_month=current_month
-            ).first()
-            
-            if not payment_exists:
-                overdue_list.append({
-                    'name': student.full_name,
-                    'room': room.room_number,
-                    'amount': room.price_per_bed,
-                    'phone': student.phone_number,
-                    'month': current_month
-                })
+            BedAssignment.status == 'active',
+            ~paid_this_month
+        ).order_by(Room.room_number, Student.name).all()
+        
+        overdue_list = [{
+            'name': student.name,
+            'room': student.room_number,
+            'amount': student.price_per_bed,
+            'phone': student.phone,
+            'month': current_month
+        } for student in overdue_students]
         
         if not overdue_list:
             return "✅ <strong>ممتاز!</strong><br><br>جميع الطالبات منتظمات في الدفع لهذا الشهر."
@@ -176,31 +193,32 @@ def process_payment_registration(message):
     """معالجة تسجيل الدفعات"""
     try:
         # استخراج اسم الطالبة والمبلغ من الرسالة
-        name_match = re.search(r'الطالبة\s+([^دفعت]+)', message)
-        amount_match = re.search(r'(\d+)\s*ريال', message)
-        month_match = re.search(r'لشهر\s+(\w+)', message)
+        name_match = re.search(r'الطالبه\s+(.+?)\s+(?:دفعت|دفع|سددت|سدد|\d)', message.text)
+        amount_match = re.search(r'(\d+)\s*ريال', message.text)
+        month_match = re.search(r'لشهر\s+(\w+)', message.text)
         
         if not name_match or not amount_match:
             return "يرجى تحديد اسم الطالبة والمبلغ بوضوح.<br>مثال: سجل أن الطالبة فاطمة أحمد دفعت 55 ريال لشهر أغسطس"
         
-        student_name = name_match.group(1).strip()
+        student_name = message.original_group(name_match).strip()
         amount = float(amount_match.group(1))
-        month = month_match.group(1) if month_match else datetime.now().strftime('%Y-%m')
-        
-        # البحث عن الطالبة
-        student = Student.query.filter(
-            Student.full_name.contains(student_name.split()[0])
-        ).first()
-        
-        if not student:
+        month = message.original_group(month_match) if month_match else datetime.now().strftime('%Y-%m')
+        
+        # البحث عن الطالبة في فهرس الأسماء (التشابه التقريبي يُعرض كمرشحات فقط)
+        student_id, candidates = STUDENT_NAMES.resolve(student_name)
+        if student_id is None:
+            if candidates:
+                names = '<br>'.join(f"- {candidate.name}" for candidate in candidates)
+                return f"الاسم '{student_name}' لا يطابق طالبة واحدة بدقة، المرشحات:<br>{names}<br>يرجى كتابة الاسم كاملاً."
             return f"لم يتم العثور على طالبة باسم '{student_name}'.<br>يرجى التحقق من الاسم والمحاولة مرة أخرى."
+        student = db.session.get(Student, student_id)
         
         # تسجيل الدفعة
         payment = FinancialRecord(
             student_id=student.id,
             amount=amount,
             payment_date=datetime.now().date(),
-            payment_month=month,
+            month_for=month,
             payment_method='نقدي',
             notes=f'تم التسجيل عبر الوكيل الذكي'
         )
@@ -209,7 +227,7 @@ def process_payment_registration(message):
         db.session.commit()
         
         response = f"✅ <strong>تم تسجيل الدفعة بنجاح!</strong><br><br>"
-        response += f"الطالبة: {student.full_name}<br>"
+        response += f"الطالبة: {student.name}<br>"
         response += f"المبلغ: {amount} ريال<br>"
         response += f"الشهر: {month}<br>"
         response += f"التاريخ: {datetime.now().strftime('%Y-%m-%d')}<br><br>"
@@ -224,7 +242,7 @@ def process_expense_registration(message):
     """معالجة تسجيل المصروفات"""
     try:
         # استخراج تفاصيل المصروف من الرسالة
-        amount_match = re.search(r'(\d+)\s*ريال', message)
+        amount_match = re.search(r'(\d+)\s*ريال', message.text)
         
         if not amount_match:
             return """<strong>تسجيل مصروف جديد:</strong><br><br>
@@ -238,10 +256,10 @@ def process_expense_registration(message):
         amount = float(amount_match.group(1))
         
         # تحديد نوع المصروف
-        if 'كهرباء' in message or 'فاتورة' in message:
+        if 'كهرباء' in message.text or 'فاتوره' in message.text:
             category = 'فواتير'
             description = 'فاتورة كهرباء'
-        elif 'صيانة' in message:
+        elif 'صيانه' in message.text:
             category = 'صيانة'
             description = 'أعمال صيانة'
         else:
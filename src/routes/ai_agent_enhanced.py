@@ -2,8 +2,14 @@ from flask import Blueprint, request, jsonify, session
 from models.user import db
 from models.core import (
     Building, Room, Bed, Student, BedAssignment, Payment, Expense, 
-    get_system_statistics, add_bed_to_room, remove_bed_from_room
+    add_bed_to_room, remove_bed_from_room
 )
+from models.snapshot import get_cached_system_statistics, get_cached_building_statistics
+from utils.intents import IntentMatcher
+from utils.arabic import normalize_arabic, normalize_message
+from models.availability import bed_availability
+from models.cache import get_bed, get_room, get_building
+from models.student_names import resolve_student
 from datetime import datetime, date
 import re
 from functools import wraps
@@ -46,42 +52,46 @@ def ai_agent():
             'message': f'حدث خطأ: {str(e)}'
         })
 
+# أنماط الأوامر المختلفة مرتبة حسب الأولوية (تُطبَّع مع الرسالة، فلا حاجة لتكرار صيغ الهمزة)
+INTENT_PATTERNS = {
+    'show_rooms': [
+        'اعرض الغرف', 'عرض الغرف', 'الغرف المتاحة', 'غرف متاحة', 
+        'شواغر', 'الشواغر', 'أسرة متاحة'
+    ],
+    'show_students': [
+        'اعرض الطالبات', 'عرض الطالبات', 'قائمة الطالبات', 
+        'الطالبات النشطات', 'طالبات نشطات'
+    ],
+    'add_student': [
+        'أضف طالبة', 'تسجيل طالبة', 'طالبة جديدة'
+    ],
+    'record_payment': [
+        'دفعت', 'دفع', 'سدد', 'سددت', 'مدفوع'
+    ],
+    'record_expense': [
+        'مصروف', 'تصليح', 'صيانة', 'فاتورة'
+    ],
+    'statistics': [
+        'إحصائيات', 'تقرير', 'ملخص', 'نظرة عامة'
+    ],
+    'add_bed': [
+        'أضف سرير', 'سرير جديد', 'زيادة سرير'
+    ],
+    'building_info': [
+        'مبنى', 'مباني', 'k6', 'k7'
+    ]
+}
+
+# يُبنى مرة واحدة عند الاستيراد
+INTENT_MATCHER = IntentMatcher(list(INTENT_PATTERNS.items()), normalize=normalize_arabic)
+
 def process_user_message(message):
     """معالجة رسالة المستخدم وتحديد النية"""
-    message = message.lower().strip()
-    
-    # أنماط الأوامر المختلفة
-    patterns = {
-        'show_rooms': [
-            'اعرض الغرف', 'عرض الغرف', 'الغرف المتاحة', 'غرف متاحة', 
-            'شواغر', 'الشواغر', 'أسرة متاحة', 'اسرة متاحة'
-        ],
-        'show_students': [
-            'اعرض الطالبات', 'عرض الطالبات', 'قائمة الطالبات', 
-            'الطالبات النشطات', 'طالبات نشطات'
-        ],
-        'add_student': [
-            'أضف طالبة', 'اضف طالبة', 'تسجيل طالبة', 'طالبة جديدة'
-        ],
-        'record_payment': [
-            'دفعت', 'دفع', 'سدد', 'سددت', 'مدفوع'
-        ],
-        'record_expense': [
-            'مصروف', 'تصليح', 'صيانة', 'فاتورة'
-        ],
-        'statistics': [
-            'إحصائيات', 'احصائيات', 'تقرير', 'ملخص', 'نظرة عامة'
-        ],
-        'add_bed': [
-            'أضف سرير', 'اضف سرير', 'سرير جديد', 'زيادة سرير'
-        ],
-        'building_info': [
-            'مبنى', 'مباني', 'k6', 'k7'
-        ]
-    }
+    # تطبيع مرة واحدة؛ المعالجات تطابق على message.text وتأخذ الأسماء من النص الأصلي
+    message = normalize_message(message.strip())
     
     # تحديد النية
-    intent = determine_intent(message, patterns)
+    intent = INTENT_MATCHER.match(message.text, normalized=True)
     
     # تنفيذ الأمر حسب النية
     if intent == 'show_rooms':
@@ -103,18 +113,11 @@ def process_user_message(message):
     else:
         return handle_general_query(message)
 
-def determine_intent(message, patterns):
-    """تحديد نية المستخدم من الرسالة"""
-    for intent, keywords in patterns.items():
-        for keyword in keywords:
-            if keyword in message:
-                return intent
-    return 'general'
-
 def show_available_rooms():
     """عرض الغرف والأسرة المتاحة"""
     try:
-        available_beds = Bed.query.filter_by(status='available').all()
+        # الأسرة الشاغرة من فهرس التوفر مرتبة حسب المبنى والغرفة
+        available_beds = bed_availability.free_beds()
         
         if not available_beds:
             return "جميع الأسرة مشغولة حالياً."
@@ -123,18 +126,15 @@ def show_available_rooms():
         buildings_data = {}
         
         for bed in available_beds:
-            building = Building.query.get(bed.building_id)
-            room = Room.query.get(bed.room_id)
-            
-            if building.building_code not in buildings_data:
-                buildings_data[building.building_code] = {
-                    'name': building.building_name,
+            if bed.building_code not in buildings_data:
+                buildings_data[bed.building_code] = {
+                    'name': bed.building_name,
                     'beds': []
                 }
             
-            buildings_data[building.building_code]['beds'].append({
+            buildings_data[bed.building_code]['beds'].append({
                 'bed_code': bed.bed_code,
-                'room_number': room.room_number,
+                'room_number': bed.room_number,
                 'price': bed.price
             })
         
@@ -161,7 +161,7 @@ def show_available_rooms():
         response += f"• الإيرادات المتوقعة من الشواغر: {total_revenue} ريال شهرياً\n"
         
         # إضافة إحصائيات عامة
-        stats = get_system_statistics()
+        stats = get_cached_system_statistics()
         response += f"• إجمالي الأسرة في النظام: {stats['total_beds']} سرير\n"
         response += f"• معدل الإشغال: {stats['occupancy_rate']:.1f}%"
         
@@ -189,9 +189,9 @@ def show_active_students():
             
             bed_info = "غير محدد"
             if assignment:
-                bed = Bed.query.get(assignment.bed_id)
-                room = Room.query.get(assignment.room_id)
-                building = Building.query.get(bed.building_id)
+                bed = get_bed(assignment.bed_id)
+                room = get_room(assignment.room_id)
+                building = get_building(bed.building_id)
                 bed_info = f"{bed.bed_code} ({building.building_name} غرفة {room.room_number})"
             
             response += f"**{student.name}**\n"
@@ -212,22 +212,22 @@ def handle_add_student(message):
         # نمط: "أضف طالبة جديدة: فاطمة أحمد، جوال 0501234567، غرفة K611، إيجار 55"
         
         # البحث عن الاسم
-        name_match = re.search(r'(?:طالبة جديدة:|أضف طالبة:)\s*([^،,]+)', message)
+        name_match = re.search(r'(?:طالبه جديده:|اضف طالبه:)\s*([^,]+)', message.text)
         if not name_match:
             return "الرجاء تحديد اسم الطالبة. مثال: أضف طالبة جديدة: فاطمة أحمد، جوال 0501234567"
         
-        name = name_match.group(1).strip()
+        name = message.original_group(name_match).strip()
         
         # البحث عن رقم الجوال
-        phone_match = re.search(r'(?:جوال|هاتف|موبايل)\s*:?\s*(\d+)', message)
+        phone_match = re.search(r'(?:جوال|هاتف|موبايل)\s*:?\s*(\d+)', message.text)
         phone = phone_match.group(1) if phone_match else None
         
         # البحث عن رقم السرير
-        bed_match = re.search(r'(?:غرفة|سرير)\s*:?\s*(K\d+)', message, re.IGNORECASE)
+        bed_match = re.search(r'(?:غرفه|سرير)\s*:?\s*(k\d+)', message.text)
         bed_code = bed_match.group(1).upper() if bed_match else None
         
         # البحث عن الإيجار
-        rent_match = re.search(r'(?:إيجار|ايجار)\s*:?\s*(\d+)', message)
+        rent_match = re.search(r'ايجار\s*:?\s*(\d+)', message.text)
         rent = float(rent_match.group(1)) if rent_match else 55.0
         
         if not bed_code:
@@ -268,8 +268,8 @@ def handle_add_student(message):
         db.session.commit()
         
         # معلومات إضافية
-        room = Room.query.get(bed.room_id)
-        building = Building.query.get(bed.building_id)
+        room = get_room(bed.room_id)
+        building = get_building(bed.building_id)
         
         response = f"✅ **تم تسجيل الطالبة بنجاح!**\n\n"
         response += f"**الاسم:** {name}\n"
@@ -290,17 +290,21 @@ def handle_payment_record(message):
         # نمط: "فاطمة دفعت 55 ريال" أو "سميرة سددت 40"
         
         # البحث عن الاسم والمبلغ
-        payment_match = re.search(r'(\w+)\s+(?:دفعت|دفع|سددت|سدد)\s+(\d+)', message)
+        payment_match = re.search(r'(\w+)\s+(?:دفعت|دفع|سددت|سدد)\s+(\d+)', message.text)
         if not payment_match:
             return "الرجاء تحديد الاسم والمبلغ. مثال: فاطمة دفعت 55 ريال"
         
-        name = payment_match.group(1)
+        name = message.original_group(payment_match)
         amount = float(payment_match.group(2))
         
-        # البحث عن الطالبة
-        student = Student.query.filter(Student.name.contains(name)).first()
-        if not student:
+        # البحث عن الطالبة في فهرس الأسماء (التشابه التقريبي يُعرض كمرشحات فقط)
+        student_id, candidates = resolve_student(name)
+        if student_id is None:
+            if candidates:
+                names = '، '.join(candidate.name for candidate in candidates)
+                return f"الاسم {name} لا يطابق طالبة واحدة بدقة، المرشحات: {names}. الرجاء كتابة الاسم كاملاً"
             return f"لم يتم العثور على طالبة باسم {name}"
+        student = db.session.get(Student, student_id)
         
         # تسجيل الدفعة
         payment = Payment(
@@ -333,26 +337,26 @@ def handle_expense_record(message):
     try:
         # نمط: "تصليح مكيف 50 ريال" أو "صيانة 30"
         
-        expense_match = re.search(r'(تصليح|صيانة|فاتورة|مصروف)\s+(.+?)\s+(\d+)', message)
+        expense_match = re.search(r'(تصليح|صيانه|فاتوره|مصروف)\s+(.+?)\s+(\d+)', message.text)
         if not expense_match:
             return "الرجاء تحديد نوع المصروف والمبلغ. مثال: تصليح مكيف 50 ريال"
         
-        category = expense_match.group(1)
-        description = expense_match.group(2).strip()
+        category = message.original_group(expense_match, 1)
+        description = message.original_group(expense_match, 2).strip()
         amount = float(expense_match.group(3))
         
-        # تحديد فئة المصروف
+        # تحديد فئة المصروف (بالصيغة المطبعة)
         category_map = {
             'تصليح': 'maintenance',
-            'صيانة': 'maintenance',
-            'فاتورة': 'utilities',
+            'صيانه': 'maintenance',
+            'فاتوره': 'utilities',
             'مصروف': 'other'
         }
         
         expense = Expense(
             description=f"{category} {description}",
             amount=amount,
-            category=category_map.get(category, 'other'),
+            category=category_map.get(expense_match.group(1), 'other'),
             expense_date=date.today()
         )
         db.session.add(expense)
@@ -372,7 +376,7 @@ def handle_expense_record(message):
 def show_system_statistics():
     """عرض إحصائيات النظام"""
     try:
-        stats = get_system_statistics()
+        stats = get_cached_system_statistics()
         
         response = f"📊 **إحصائيات النظام:**\n\n"
         response += f"🏢 **المباني والأسرة:**\n"
@@ -391,12 +395,9 @@ def show_system_statistics():
         response += f"• صافي الربح: {stats['net_profit']} ريال\n"
         
         # إضافة تفاصيل المباني
-        buildings = Building.query.all()
         response += f"\n🏢 **تفاصيل المباني:**\n"
-        for building in buildings:
-            building_beds = Bed.query.filter_by(building_id=building.id).count()
-            occupied = Bed.query.filter_by(building_id=building.id, status='occupied').count()
-            response += f"• {building.building_name}: {occupied}/{building_beds} مشغول\n"
+        for building in get_cached_building_statistics():
+            response += f"• {building['building_name']}: {building['occupied_beds']}/{building['total_beds']} مشغول\n"
         
         return response
         
@@ -408,7 +409,7 @@ def handle_add_bed(message):
     try:
         # نمط: "أضف سرير في غرفة K601" أو "سرير جديد K701"
         
-        room_match = re.search(r'(?:غرفة|في)\s*(K\d+)', message, re.IGNORECASE)
+        room_match = re.search(r'(?:غرفه|في)\s*(k\d+)', message.text)
         if not room_match:
             return "الرجاء تحديد رقم الغرفة. مثال: أضف سرير في غرفة K601"
         
@@ -420,7 +421,7 @@ def handle_add_bed(message):
             return f"الغرفة {room_code} غير موجودة في النظام."
         
         # البحث عن السعر (اختياري)
-        price_match = re.search(r'(?:سعر|بسعر)\s*(\d+)', message)
+        price_match = re.search(r'(?:سعر|بسعر)\s*(\d+)', message.text)
         price = float(price_match.group(1)) if price_match else 55.0
         
         # إضافة السرير
@@ -428,8 +429,8 @@ def handle_add_bed(message):
         
         if success:
             # إعادة تحميل الغرفة للحصول على البيانات المحدثة
-            room = Room.query.get(room.id)
-            building = Building.query.get(room.building_id)
+            room = get_room(room.id)
+            building = get_building(room.building_id)
             
             response = f"✅ **{message_result}**\n\n"
             response += f"**الغرفة:** {room_code}\n"
@@ -448,7 +449,7 @@ def show_building_info(message):
     """عرض معلومات مبنى محدد"""
     try:
         # البحث عن رمز المبنى
-        building_match = re.search(r'(K\d+)', message, re.IGNORECASE)
+        building_match = re.search(r'(k\d+)', message.text)
         if building_match:
             building_code = building_match.group(1).upper()
             building = Building.query.filter_by(building_code=building_code).first()
@@ -456,10 +457,10 @@ def show_building_info(message):
             if not building:
                 return f"المبنى {building_code} غير موجود في النظام."
             
-            # إحصائيات المبنى
-            total_beds = Bed.query.filter_by(building_id=building.id).count()
-            occupied_beds = Bed.query.filter_by(building_id=building.id, status='occupied').count()
-            available_beds = total_beds - occupied_beds
+            # إحصائيات المبنى من العدادات المخزنة
+            total_beds = building.total_beds
+            occupied_beds = building.occupied_beds
+            available_beds = building.available_beds
             
             response = f"🏢 **معلومات {building.building_name}:**\n\n"
             response += f"**رمز المبنى:** {building.building_code}\n"
@@ -477,8 +478,8 @@ def show_building_info(message):
             response = f"🏢 **جميع المباني ({len(buildings)}):**\n\n"
             
             for building in buildings:
-                total_beds = Bed.query.filter_by(building_id=building.id).count()
-                occupied_beds = Bed.query.filter_by(building_id=building.id, status='occupied').count()
+                total_beds = building.total_beds
+                occupied_beds = building.occupied_beds
                 
                 response += f"**{building.building_name} ({building.building_code}):**\n"
                 response += f"• الغرف: {building.total_rooms}\n"
@@ -1,9 +1,14 @@
 from flask import Blueprint, request, jsonify, session
 from models.user import db
 from models.core import (
-    Student, BedAssignment, Payment, Expense, Archive,
-    get_system_statistics
+    Student, Bed, BedAssignment, Payment, Expense, Archive
 )
+from models.snapshot import get_cached_system_statistics
+from models.cache import get_bed, get_room, get_building
+from models.pagination import parse_fields, parse_limit, keyset_paginate, project_columns, serialize_row
+from models.search import SEARCH_INDEXES, matching_ids, search_records
+from models.overdue import find_overdue, refresh_overdue_payments
+from sqlalchemy import func, case
 from datetime import datetime, date, timedelta
 from functools import wraps
 
@@ -28,8 +33,14 @@ def archive_student():
         departure_reason = data.get('departure_reason', '')
         notes = data.get('notes', '')
         
-        if not student_id:
-            return jsonify({'success': False, 'message': 'رقم الطالبة مطلوب'})
+        if student_id in (None, ''):
+            return jsonify({'success': False, 'message': 'رقم الطالبة مطلوب'}), 400
+        
+        # المعرف قد يصل نصاً من JSON ("5")؛ الأرصدة مفهرسة بالأرقام
+        try:
+            student_id = int(student_id)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'رقم الطالبة غير صالح'}), 400
         
         student = Student.query.get(student_id)
         if not student:
@@ -39,13 +50,30 @@ def archive_student():
             return jsonify({'success': False, 'message': 'الطالبة مؤرشفة مسبقاً'})
         
         # حساب الرصيد النهائي
-        financial_summary = calculate_student_final_balance(student_id)
+        financial_summary = calculate_student_final_balance(student_id, departure_date)
+        if 'error' in financial_summary:
+            # لا تُؤرشف الطالبة بأرصدة صفرية إذا تعذر الحساب
+            return jsonify({'success': False, 'message': f"تعذر حساب الرصيد النهائي: {financial_summary['error']}"})
+        departure = datetime.strptime(departure_date, '%Y-%m-%d').date()
+        
+        # آخر سرير شغلته: التخصيص النشط، وإلا أحدث تخصيص سابق
+        active_assignment = BedAssignment.query.filter_by(
+            student_id=student_id, 
+            status='active'
+        ).first()
+        last_assignment = active_assignment or BedAssignment.query.filter_by(
+            student_id=student_id
+        ).order_by(BedAssignment.start_date.desc(), BedAssignment.id.desc()).first()
+        bed = Bed.query.get(last_assignment.bed_id) if last_assignment else None
         
         # إنشاء سجل الأرشيف
         archive_record = Archive(
             student_id=student_id,
             student_name=student.name,
-            departure_date=datetime.strptime(departure_date, '%Y-%m-%d').date(),
+            phone=student.phone,
+            national_id=student.national_id,
+            bed_code=bed.bed_code if bed else '',
+            departure_date=departure,
             departure_reason=departure_reason,
             total_payments=financial_summary['total_payments'],
             total_rent_due=financial_summary['total_rent_due'],
@@ -59,21 +87,14 @@ def archive_student():
         
         # تحديث حالة الطالبة
         student.status = 'archived'
-        student.departure_date = datetime.strptime(departure_date, '%Y-%m-%d').date()
+        student.departure_date = departure
         
         # تحرير السرير
-        active_assignment = BedAssignment.query.filter_by(
-            student_id=student_id, 
-            status='active'
-        ).first()
-        
         if active_assignment:
             active_assignment.status = 'completed'
-            active_assignment.end_date = datetime.strptime(departure_date, '%Y-%m-%d').date()
+            active_assignment.end_date = departure
             
             # تحديث حالة السرير
-            from models.core import Bed
-            bed = Bed.query.get(active_assignment.bed_id)
             if bed:
                 bed.status = 'available'
         
@@ -94,79 +115,14 @@ def archive_student():
             'message': f'خطأ في أرشفة الطالبة: {str(e)}'
         })
 
-def calculate_student_final_balance(student_id):
+def calculate_student_final_balance(student_id, departure_date=None):
     """حساب الرصيد النهائي للطالبة"""
     try:
-        student = Student.query.get(student_id)
-        
-        # إجمالي المدفوعات
-        total_payments = sum([
-            p.amount for p in student.payments 
-            if p.status == 'confirmed'
-        ])
-        
-        # مدفوعات الإيجار
-        rent_payments = sum([
-            p.amount for p in student.payments 
-            if p.status == 'confirmed' and p.payment_type == 'rent'
-        ])
-        
-        # مدفوعات التأمين
-        deposit_payments = sum([
-            p.amount for p in student.payments 
-            if p.status == 'confirmed' and p.payment_type == 'deposit'
-        ])
-        
-        # حساب الإيجار المستحق
-        if student.contract_start and student.departure_date:
-            months_stayed = calculate_months_between_dates(
-                student.contract_start, 
-                student.departure_date
-            )
-            total_rent_due = months_stayed * student.rent_amount
-        else:
-            # تقدير بناءً على تاريخ أول دفعة إيجار
-            first_rent_payment = Payment.query.filter_by(
-                student_id=student_id,
-                payment_type='rent',
-                status='confirmed'
-            ).order_by(Payment.payment_date).first()
-            
-            if first_rent_payment:
-                months_stayed = calculate_months_between_dates(
-                    first_rent_payment.payment_date,
-                    student.departure_date or date.today()
-                )
-                total_rent_due = months_stayed * student.rent_amount
-            else:
-                total_rent_due = 0
-        
-        # حساب الرصيد النهائي
-        rent_balance = rent_payments - total_rent_due
-        deposit_balance = deposit_payments
-        
-        # إذا كان رصيد الإيجار سالب، يخصم من التأمين
-        if rent_balance < 0:
-            remaining_deposit = deposit_balance + rent_balance  # rent_balance سالب
-            refund_amount = max(0, remaining_deposit)
-            final_balance = rent_balance if remaining_deposit < 0 else 0
-        else:
-            # إذا كان رصيد الإيجار موجب أو صفر، يُرد التأمين كاملاً
-            refund_amount = deposit_balance
-            final_balance = rent_balance
-        
-        return {
-            'total_payments': total_payments,
-            'rent_payments': rent_payments,
-            'deposit_payments': deposit_payments,
-            'total_rent_due': total_rent_due,
-            'security_deposit': student.security_deposit,
-            'rent_balance': rent_balance,
-            'deposit_balance': deposit_balance,
-            'final_balance': final_balance,
-            'refund_amount': refund_amount,
-            'months_stayed': months_stayed if 'months_stayed' in locals() else 0
-        }
+        student_id = int(student_id)
+        balances = calculate_students_final_balances([student_id], departure_date)
+        if student_id not in balances:
+            raise ValueError('الطالبة غير موجودة')
+        return balances[student_id]
         
     except Exception as e:
         return {
@@ -178,6 +134,108 @@ def calculate_student_final_balance(student_id):
             'refund_amount': 0
         }
 
+def calculate_students_final_balances(student_ids=None, departure_date=None):
+    """حساب الرصيد النهائي لمجموعة طالبات (أو كل غير المؤرشفات) في تمريرة SQL مجمعة واحدة
+    
+    يعيد {student_id: الملخص المالي} بنفس حقول calculate_student_final_balance.
+    """
+    if isinstance(departure_date, str):
+        departure_date = datetime.strptime(departure_date, '%Y-%m-%d').date()
+    
+    confirmed = Payment.status == 'confirmed'
+    confirmed_rent = db.and_(confirmed, Payment.payment_type == 'rent')
+    confirmed_deposit = db.and_(confirmed, Payment.payment_type == 'deposit')
+    
+    query = db.session.query(
+        Student.id,
+        Student.contract_start,
+        Student.rent_amount,
+        Student.security_deposit,
+        func.coalesce(func.sum(case((confirmed, Payment.amount), else_=0)), 0).label('total_payments'),
+        func.coalesce(func.sum(case((confirmed_rent, Payment.amount), else_=0)), 0).label('rent_payments'),
+        func.coalesce(func.sum(case((confirmed_deposit, Payment.amount), else_=0)), 0).label('deposit_payments'),
+        func.min(case((confirmed_rent, Payment.payment_date))).label('first_rent_date')
+    ).outerjoin(
+        Payment, Payment.student_id == Student.id
+    ).group_by(Student.id)
+    
+    if student_ids is not None:
+        query = query.filter(Student.id.in_(student_ids))
+    else:
+        query = query.filter(Student.status != 'archived')
+    
+    balances = {}
+    for row in query.all():
+        balances[row.id] = build_final_balance(row, departure_date)
+    return balances
+
+def build_final_balance(row, departure_date=None):
+    """الرصيد النهائي لطالبة من مجاميع مدفوعاتها"""
+    # حساب الإيجار المستحق
+    months_stayed = 0
+    if row.contract_start and departure_date:
+        months_stayed = calculate_months_between_dates(row.contract_start, departure_date)
+    elif row.first_rent_date:
+        # تقدير بناءً على تاريخ أول دفعة إيجار
+        months_stayed = calculate_months_between_dates(row.first_rent_date, departure_date or date.today())
+    total_rent_due = months_stayed * row.rent_amount
+    
+    # حساب الرصيد النهائي
+    rent_balance = row.rent_payments - total_rent_due
+    deposit_balance = row.deposit_payments
+    
+    # إذا كان رصيد الإيجار سالب، يخصم من التأمين
+    if rent_balance < 0:
+        remaining_deposit = deposit_balance + rent_balance  # rent_balance سالب
+        refund_amount = max(0, remaining_deposit)
+        final_balance = rent_balance if remaining_deposit < 0 else 0
+    else:
+        # إذا كان رصيد الإيجار موجب أو صفر، يُرد التأمين كاملاً
+        refund_amount = deposit_balance
+        final_balance = rent_balance
+    
+    return {
+        'total_payments': row.total_payments,
+        'rent_payments': row.rent_payments,
+        'deposit_payments': row.deposit_payments,
+        'total_rent_due': total_rent_due,
+        'security_deposit': row.security_deposit,
+        'rent_balance': rent_balance,
+        'deposit_balance': deposit_balance,
+        'final_balance': final_balance,
+        'refund_amount': refund_amount,
+        'months_stayed': months_stayed
+    }
+
+@archive_system_bp.route('/archive/balances/preview', methods=['GET'])
+@login_required
+def preview_final_balances():
+    """معاينة التسوية النهائية لكل الطالبات (أو لقائمة student_ids) دفعة واحدة"""
+    try:
+        student_ids = request.args.get('student_ids')
+        if student_ids:
+            student_ids = [int(student_id) for student_id in student_ids.split(',') if student_id.strip()]
+        departure_date = request.args.get('departure_date')
+        
+        balances = calculate_students_final_balances(student_ids or None, departure_date)
+        
+        return jsonify({
+            'success': True,
+            'data': [dict(student_id=student_id, **summary) for student_id, summary in balances.items()],
+            'summary': {
+                'students': len(balances),
+                'total_refunds': sum(b['refund_amount'] for b in balances.values()),
+                'total_due_from_students': sum(-b['final_balance'] for b in balances.values() if b['final_balance'] < 0),
+                'total_credit_to_students': sum(b['final_balance'] for b in balances.values() if b['final_balance'] > 0)
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في معاينة التسوية: {str(e)}'
+        })
+
 def calculate_months_between_dates(start_date, end_date):
     """حساب عدد الأشهر بين تاريخين"""
     if isinstance(start_date, str):
@@ -202,36 +260,66 @@ def get_archived_students():
         per_page = request.args.get('per_page', 20, type=int)
         search = request.args.get('search', '')
         
-        query = Archive.query
-        
-        if search:
-            query = query.filter(
-                Archive.student_name.contains(search)
-            )
+        archive_fields = {
+            'id': Archive.id,
+            'student_name': Archive.student_name,
+            'departure_date': Archive.departure_date,
+            'departure_reason': Archive.reason_for_leaving,
+            'total_payments': Archive.total_paid,
+            'total_rent_due': Archive.total_due,
+            'security_deposit': Archive.security_deposit,
+            'final_balance': Archive.final_balance,
+            'refund_amount': Archive.refund_amount,
+            'notes': Archive.notes,
+            'archived_at': Archive.archived_at
+        }
+        formatters = {
+            'archived_at': lambda value: value.strftime('%Y-%m-%d %H:%M') if value else None
+        }
+        key_columns = [Archive.archived_at, Archive.id]
+        
+        try:
+            fields = parse_fields(request.args.get('fields'), archive_fields)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)})
+        
+        query = db.session.query(*project_columns(archive_fields, fields, key_columns))
+        
+        # البحث عبر فهرس FTS5 (الاسم والهاتف والهوية والملاحظات) بدل مسح الجدول
+        search_ids = matching_ids('archive', search)
+        if search_ids is not None:
+            query = query.filter(Archive.id.in_(search_ids))
+        
+        # ترقيم بالمفتاح عند طلب cursor أو limit، وإلا الترقيم بالصفحات كما كان
+        if 'cursor' in request.args or 'limit' in request.args:
+            try:
+                rows, next_cursor = keyset_paginate(
+                    query,
+                    key_columns,
+                    cursor=request.args.get('cursor'),
+                    limit=parse_limit(request.args.get('limit'), default=per_page),
+                    descending=True
+                )
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)})
+            
+            return jsonify({
+                'success': True,
+                'data': [serialize_row(row, fields, formatters) for row in rows],
+                'pagination': {
+                    'limit': len(rows),
+                    'next_cursor': next_cursor,
+                    'has_next': next_cursor is not None
+                }
+            })
         
-        archives = query.order_by(Archive.archived_at.desc()).paginate(
+        archives = query.order_by(Archive.archived_at.desc(), Archive.id.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
         
-        archive_list = []
-        for archive in archives.items:
-            archive_list.append({
-                'id': archive.id,
-                'student_name': archive.student_name,
-                'departure_date': archive.departure_date.strftime('%Y-%m-%d'),
-                'departure_reason': archive.departure_reason,
-                'total_payments': archive.total_payments,
-                'total_rent_due': archive.total_rent_due,
-                'security_deposit': archive.security_deposit,
-                'final_balance': archive.final_balance,
-                'refund_amount': archive.refund_amount,
-                'notes': archive.notes,
-                'archived_at': archive.archived_at.strftime('%Y-%m-%d %H:%M')
-            })
-        
         return jsonify({
             'success': True,
-            'data': archive_list,
+            'data': [serialize_row(row, fields, formatters) for row in archives.items],
             'pagination': {
                 'page': page,
                 'pages': archives.pages,
@@ -248,6 +336,50 @@ def get_archived_students():
             'message': f'خطأ في جلب الأرشيف: {str(e)}'
         })
 
+@archive_system_bp.route('/search', methods=['GET'])
+@login_required
+def search_students_and_archive():
+    """بحث نصي مرتب بالصلة في الطالبات والأرشيف (اسم، هاتف، هوية، جامعة، ملاحظات)"""
+    try:
+        search = request.args.get('q', '').strip()
+        scope = request.args.get('scope', 'all')
+        page = max(1, request.args.get('page', 1, type=int))
+        per_page = parse_limit(request.args.get('per_page'), default=20)
+        
+        if scope == 'all':
+            scopes = list(SEARCH_INDEXES)
+        elif scope in SEARCH_INDEXES:
+            scopes = [scope]
+        else:
+            return jsonify({'success': False, 'message': f'نطاق بحث غير معروف: {scope}'})
+        
+        if not search:
+            return jsonify({'success': False, 'message': 'يرجى إدخال نص البحث'})
+        
+        hits, total = search_records(search, scopes, page=page, per_page=per_page)
+        pages = (total + per_page - 1) // per_page
+        
+        return jsonify({
+            'success': True,
+            'data': [dict(hit, score=round(-hit['score'], 4) + 0.0) for hit in hits],
+            'pagination': {
+                'page': page,
+                'pages': pages,
+                'per_page': per_page,
+                'total': total,
+                'has_next': page < pages,
+                'has_prev': page > 1
+            }
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في البحث: {str(e)}'
+        })
+
 @archive_system_bp.route('/archive/student/<int:student_id>/preview', methods=['GET'])
 @login_required
 def preview_student_archive(student_id):
@@ -271,10 +403,9 @@ def preview_student_archive(student_id):
         
         bed_info = {}
         if active_assignment:
-            from models.core import Bed, Room, Building
-            bed = Bed.query.get(active_assignment.bed_id)
-            room = Room.query.get(active_assignment.room_id)
-            building = Building.query.get(bed.building_id)
+            bed = get_bed(active_assignment.bed_id)
+            room = get_room(active_assignment.room_id)
+            building = get_building(bed.building_id)
             
             bed_info = {
                 'bed_code': bed.bed_code,
@@ -357,60 +488,68 @@ def get_financial_summary():
         end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
         
         # إحصائيات عامة
-        stats = get_system_statistics()
+        stats = get_cached_system_statistics()
         
-        # المدفوعات في الفترة
-        payments_in_period = Payment.query.filter(
+        # المدفوعات في الفترة مجمعة حسب النوع
+        payment_rows = db.session.query(
+            Payment.payment_type, func.count(Payment.id), func.sum(Payment.amount)
+        ).filter(
             Payment.payment_date >= start_date,
             Payment.payment_date <= end_date,
             Payment.status == 'confirmed'
-        ).all()
+        ).group_by(Payment.payment_type).all()
         
-        # المصروفات في الفترة
-        expenses_in_period = Expense.query.filter(
+        # المصروفات في الفترة مجمعة حسب الفئة
+        expense_rows = db.session.query(
+            Expense.category, func.count(Expense.id), func.sum(Expense.amount)
+        ).filter(
             Expense.expense_date >= start_date,
             Expense.expense_date <= end_date
-        ).all()
+        ).group_by(Expense.category).all()
         
         # تحليل المدفوعات
-        rent_payments = [p for p in payments_in_period if p.payment_type == 'rent']
-        deposit_payments = [p for p in payments_in_period if p.payment_type == 'deposit']
-        other_payments = [p for p in payments_in_period if p.payment_type not in ['rent', 'deposit']]
+        payments_breakdown = group_totals(payment_rows, ['rent', 'deposit'])
+        rent_payments = payments_breakdown['rent']
+        deposit_payments = payments_breakdown['deposit']
+        other_payments = payments_breakdown['other']
         
         # تحليل المصروفات
-        maintenance_expenses = [e for e in expenses_in_period if e.category == 'maintenance']
-        utilities_expenses = [e for e in expenses_in_period if e.category == 'utilities']
-        other_expenses = [e for e in expenses_in_period if e.category not in ['maintenance', 'utilities']]
+        expenses_breakdown = group_totals(expense_rows, ['maintenance', 'utilities'])
+        maintenance_expenses = expenses_breakdown['maintenance']
+        utilities_expenses = expenses_breakdown['utilities']
+        other_expenses = expenses_breakdown['other']
         
         # حساب الأرباح
-        total_revenue = sum([p.amount for p in payments_in_period])
-        total_expenses = sum([e.amount for e in expenses_in_period])
+        total_revenue = sum([amount for _, _, amount in payment_rows])
+        total_expenses = sum([amount for _, _, amount in expense_rows])
         net_profit = total_revenue - total_expenses
         
         # معدل التحصيل
         expected_monthly_revenue = stats['expected_revenue']
         collection_rate = (total_revenue / expected_monthly_revenue * 100) if expected_monthly_revenue > 0 else 0
         
-        # الطالبات المتأخرات في الدفع
+        # الطالبات المتأخرات في الدفع: النشطات بلا دفعة إيجار مؤكدة لهذا الشهر (anti-join)
         current_month = date.today().strftime('%Y-%m')
-        active_students = Student.query.filter_by(status='active').all()
-        
-        overdue_students = []
-        for student in active_students:
-            monthly_payment = Payment.query.filter_by(
-                student_id=student.id,
-                month_year=current_month,
-                payment_type='rent',
-                status='confirmed'
-            ).first()
-            
-            if not monthly_payment:
-                overdue_students.append({
-                    'id': student.id,
-                    'name': student.name,
-                    'phone': student.phone,
-                    'rent_amount': student.rent_amount
-                })
+        paid_this_month = db.session.query(Payment.id).filter(
+            Payment.student_id == Student.id,
+            Payment.month_year == current_month,
+            Payment.payment_type == 'rent',
+            Payment.status == 'confirmed'
+        ).exists()
+        
+        unpaid_students = db.session.query(
+            Student.id, Student.name, Student.phone, Student.rent_amount
+        ).filter(
+            Student.status == 'active',
+            ~paid_this_month
+        ).order_by(Student.id).all()
+        
+        overdue_students = [{
+            'id': student.id,
+            'name': student.name,
+            'phone': student.phone,
+            'rent_amount': student.rent_amount
+        } for student in unpaid_students]
         
         return jsonify({
             'success': True,
@@ -427,32 +566,14 @@ def get_financial_summary():
                     'expected_revenue': expected_monthly_revenue
                 },
                 'payments_breakdown': {
-                    'rent_payments': {
-                        'count': len(rent_payments),
-                        'amount': sum([p.amount for p in rent_payments])
-                    },
-                    'deposit_payments': {
-                        'count': len(deposit_payments),
-                        'amount': sum([p.amount for p in deposit_payments])
-                    },
-                    'other_payments': {
-                        'count': len(other_payments),
-                        'amount': sum([p.amount for p in other_payments])
-                    }
+                    'rent_payments': rent_payments,
+                    'deposit_payments': deposit_payments,
+                    'other_payments': other_payments
                 },
                 'expenses_breakdown': {
-                    'maintenance': {
-                        'count': len(maintenance_expenses),
-                        'amount': sum([e.amount for e in maintenance_expenses])
-                    },
-                    'utilities': {
-                        'count': len(utilities_expenses),
-                        'amount': sum([e.amount for e in utilities_expenses])
-                    },
-                    'other': {
-                        'count': len(other_expenses),
-                        'amount': sum([e.amount for e in other_expenses])
-                    }
+                    'maintenance': maintenance_expenses,
+                    'utilities': utilities_expenses,
+                    'other': other_expenses
                 },
                 'overdue_students': overdue_students,
                 'system_stats': stats
@@ -465,71 +586,105 @@ def get_financial_summary():
             'message': f'خطأ في إنشاء التقرير المالي: {str(e)}'
         })
 
+def group_totals(rows, named_groups):
+    """تحويل صفوف (المجموعة، العدد، المجموع) إلى {المجموعة: {'count', 'amount'}} مع دمج الباقي في other"""
+    totals = {group: {'count': 0, 'amount': 0} for group in named_groups + ['other']}
+    for group, count, amount in rows:
+        bucket = totals[group if group in named_groups else 'other']
+        bucket['count'] += count
+        bucket['amount'] += amount or 0
+    return totals
+
+@archive_system_bp.route('/reports/overdue', methods=['GET'])
+@login_required
+def get_overdue_report():
+    """المتأخرات في الدفع لشهر أو فترة (الشهر الحالي افتراضياً) محسوبة باستعلام واحد"""
+    try:
+        month = request.args.get('month')  # "2025-08" (اختياري)
+        start_month = request.args.get('start_month', month)
+        end_month = request.args.get('end_month', month)
+        months = request.args.get('months', 1, type=int)
+        
+        month_starts = build_month_range(months, start_month, end_month)
+        overdue = find_overdue(month_starts)
+        
+        by_month = {}
+        for item in overdue:
+            summary = by_month.setdefault(item['month_due'], {'count': 0, 'amount_due': 0})
+            summary['count'] += 1
+            summary['amount_due'] += item['amount_due'] or 0
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'overdue': overdue,
+                'by_month': by_month,
+                'summary': {
+                    'count': len(overdue),
+                    'students': len({item['student_id'] for item in overdue}),
+                    'total_amount_due': sum(item['amount_due'] or 0 for item in overdue)
+                }
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في حساب المتأخرات: {str(e)}'
+        })
+
+@archive_system_bp.route('/reports/overdue/refresh', methods=['POST'])
+@login_required
+def refresh_overdue_report():
+    """تحديث جدول المتأخرات (overdue_payments) للفترة المطلوبة"""
+    try:
+        data = request.get_json(silent=True) or {}
+        month = data.get('month')
+        month_starts = build_month_range(
+            data.get('months', 1),
+            data.get('start_month', month),
+            data.get('end_month', month)
+        )
+        
+        result = refresh_overdue_payments(month_starts)
+        
+        return jsonify({
+            'success': True,
+            'message': f"تم تحديث المتأخرات: {result['created']} جديدة، {result['collected']} محصلة",
+            'data': result
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'خطأ في تحديث المتأخرات: {str(e)}'
+        })
+
 @archive_system_bp.route('/reports/occupancy_history', methods=['GET'])
 @login_required
 def get_occupancy_history():
     """تقرير تاريخ الإشغال"""
     try:
         months = request.args.get('months', 6, type=int)  # آخر 6 أشهر افتراضياً
+        start_month = request.args.get('start_month')  # "2024-01" (اختياري)
+        end_month = request.args.get('end_month')  # "2025-12" (اختياري)
         
-        history = []
-        current_date = date.today()
-        
-        for i in range(months):
-            # حساب تاريخ بداية ونهاية الشهر
-            if i == 0:
-                month_start = current_date.replace(day=1)
-                month_end = current_date
-            else:
-                month_date = current_date.replace(day=1) - timedelta(days=i*30)
-                month_start = month_date.replace(day=1)
-                # آخر يوم في الشهر
-                if month_start.month == 12:
-                    month_end = month_start.replace(year=month_start.year+1, month=1, day=1) - timedelta(days=1)
-                else:
-                    month_end = month_start.replace(month=month_start.month+1, day=1) - timedelta(days=1)
-            
-            # حساب الإشغال في ذلك الشهر
-            assignments_in_month = BedAssignment.query.filter(
-                BedAssignment.start_date <= month_end,
-                db.or_(
-                    BedAssignment.end_date >= month_start,
-                    BedAssignment.end_date.is_(None)
-                )
-            ).all()
-            
-            occupied_beds = len(assignments_in_month)
-            total_beds = stats['total_beds'] if 'stats' in locals() else 52
-            occupancy_rate = (occupied_beds / total_beds * 100) if total_beds > 0 else 0
-            
-            # الإيرادات في ذلك الشهر
-            month_payments = Payment.query.filter(
-                Payment.payment_date >= month_start,
-                Payment.payment_date <= month_end,
-                Payment.status == 'confirmed',
-                Payment.payment_type == 'rent'
-            ).all()
-            
-            month_revenue = sum([p.amount for p in month_payments])
-            
-            history.append({
-                'month': month_start.strftime('%Y-%m'),
-                'month_name': month_start.strftime('%B %Y'),
-                'occupied_beds': occupied_beds,
-                'total_beds': total_beds,
-                'occupancy_rate': round(occupancy_rate, 2),
-                'revenue': month_revenue
-            })
+        month_starts = build_month_range(months, start_month, end_month)
+        history = calculate_occupancy_history(month_starts)
+        
+        # الملخص على الترتيب التنازلي كما كان (الأحدث أولاً عند التساوي)
+        latest_first = list(reversed(history))
         
         return jsonify({
             'success': True,
             'data': {
-                'history': list(reversed(history)),  # ترتيب تصاعدي
+                'history': history,  # ترتيب تصاعدي
                 'summary': {
                     'avg_occupancy': round(sum([h['occupancy_rate'] for h in history]) / len(history), 2),
                     'total_revenue': sum([h['revenue'] for h in history]),
-                    'best_month': max(history, key=lambda x: x['occupancy_rate']),
-                    'worst_month': min(history, key=lambda x: x['occupancy_rate'])
+                    'best_month': max(latest_first, key=lambda x: x['occupancy_rate']),
+                    'worst_month': min(latest_first, key=lambda x: x['occupancy_rate'])
                 }
             }
         })
@@ -540,3 +695,89 @@ def get_occupancy_history():
             'message': f'خطأ في إنشاء تقرير الإشغال: {str(e)}'
         })
 
+MAX_HISTORY_MONTHS = 60
+
+def add_months(month_start, count):
+    """إزاحة أول يوم في الشهر بعدد من الأشهر"""
+    month_index = month_start.year * 12 + month_start.month - 1 + count
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def build_month_range(months=6, start_month=None, end_month=None):
+    """قائمة أوائل الأشهر التقويمية للتقرير بترتيب تصاعدي"""
+    current_month = date.today().replace(day=1)
+    
+    if start_month or end_month:
+        last = datetime.strptime(end_month, '%Y-%m').date() if end_month else current_month
+        first = datetime.strptime(start_month, '%Y-%m').date() if start_month else add_months(last, -(months - 1))
+    else:
+        last = current_month
+        first = add_months(last, -(months - 1))
+    
+    count = (last.year - first.year) * 12 + (last.month - first.month) + 1
+    if count < 1:
+        raise ValueError('فترة التقرير غير صالحة')
+    if count > MAX_HISTORY_MONTHS:
+        raise ValueError(f'الحد الأقصى للتقرير {MAX_HISTORY_MONTHS} شهراً')
+    
+    return [add_months(first, i) for i in range(count)]
+
+def calculate_occupancy_history(month_starts):
+    """الإشغال والإيرادات لكل شهر في الفترة بعدد ثابت من الاستعلامات
+    
+    التخصيصات المتداخلة مع الفترة تُجلب مرة واحدة ثم تُوزع على الأشهر بمصفوفة فروق
+    (إضافة 1 في شهر البداية وطرح 1 بعد شهر النهاية ثم مجموع تراكمي).
+    """
+    today = date.today()
+    first_month = month_starts[0]
+    period_end = min(add_months(month_starts[-1], 1) - timedelta(days=1), today)
+    month_count = len(month_starts)
+    
+    def month_index(value):
+        return (value.year - first_month.year) * 12 + (value.month - first_month.month)
+    
+    from models.core import Bed
+    total_beds = Bed.query.count()
+    
+    # التخصيصات المتداخلة مع الفترة كاملة
+    assignments = db.session.query(BedAssignment.start_date, BedAssignment.end_date).filter(
+        BedAssignment.start_date <= period_end,
+        db.or_(
+            BedAssignment.end_date >= first_month,
+            BedAssignment.end_date.is_(None)
+        )
+    ).all()
+    
+    deltas = [0] * (month_count + 1)
+    for start_date, end_date in assignments:
+        first = max(0, month_index(start_date))
+        last = month_count - 1 if end_date is None else min(month_count - 1, month_index(end_date))
+        if first <= last:
+            deltas[first] += 1
+            deltas[last + 1] -= 1
+    
+    # إيرادات الإيجار مجمعة حسب الشهر
+    payment_month = func.strftime('%Y-%m', Payment.payment_date)
+    revenue_rows = db.session.query(payment_month, func.sum(Payment.amount)).filter(
+        Payment.payment_date >= first_month,
+        Payment.payment_date <= period_end,
+        Payment.status == 'confirmed',
+        Payment.payment_type == 'rent'
+    ).group_by(payment_month).all()
+    revenue_by_month = dict(revenue_rows)
+    
+    history = []
+    occupied_beds = 0
+    for i, month_start in enumerate(month_starts):
+        occupied_beds += deltas[i]
+        occupancy_rate = (occupied_beds / total_beds * 100) if total_beds > 0 else 0
+        
+        history.append({
+            'month': month_start.strftime('%Y-%m'),
+            'month_name': month_start.strftime('%B %Y'),
+            'occupied_beds': occupied_beds,
+            'total_beds': total_beds,
+            'occupancy_rate': round(occupancy_rate, 2),
+            'revenue': revenue_by_month.get(month_start.strftime('%Y-%m'), 0)
+        })
+    
+    return history
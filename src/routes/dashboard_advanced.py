@@ -1,14 +1,23 @@
-from flask import Blueprint, request, jsonify, session, send_file
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
 from werkzeug.utils import secure_filename
 from models.user import db
 from models.core import (
-    Building, Room, Bed, Student, BedAssignment, Payment, Expense, Archive,
-    get_system_statistics
+    Building, Room, Bed, Student, BedAssignment, Payment, Expense, Archive
 )
+from models.snapshot import get_dashboard_snapshot
+from models.availability import bed_availability
+from models.cache import reference_cache
+from models.student_names import student_names
+from models.events import mark_changed
+from sqlalchemy import func
 from datetime import datetime, date
 import pandas as pd
 import os
 import io
+import csv
+import re
+import zipfile
+from xml.sax.saxutils import escape
 from functools import wraps
 
 dashboard_advanced_bp = Blueprint('dashboard_advanced', __name__)
@@ -32,67 +41,62 @@ def allowed_file(filename):
 def get_dashboard_stats():
     """الحصول على إحصائيات لوحة التحكم"""
     try:
-        stats = get_system_statistics()
-        
-        # إحصائيات إضافية
-        buildings = Building.query.all()
-        building_stats = []
+        # refresh=1 لتجاوز اللقطة المخزنة وإعادة الحساب
+        max_staleness = 0 if request.args.get('refresh') == '1' else None
+        data, snapshot = get_dashboard_snapshot(max_staleness)
+        return jsonify({
+            'success': True,
+            'data': data,
+            'snapshot': snapshot
+        })
         
-        for building in buildings:
-            building_beds = Bed.query.filter_by(building_id=building.id).count()
-            occupied_beds = Bed.query.filter_by(building_id=building.id, status='occupied').count()
-            available_beds = building_beds - occupied_beds
-            
-            building_stats.append({
-                'building_code': building.building_code,
-                'building_name': building.building_name,
-                'total_beds': building_beds,
-                'occupied_beds': occupied_beds,
-                'available_beds': available_beds,
-                'occupancy_rate': (occupied_beds / building_beds * 100) if building_beds > 0 else 0,
-                'expected_revenue': building_beds * 55
-            })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'حدث خطأ في جلب الإحصائيات: {str(e)}'
+        })
+
+@dashboard_advanced_bp.route('/dashboard/beds/available', methods=['GET'])
+@login_required
+def get_available_beds():
+    """البحث في الأسرة الشاغرة من فهرس التوفر (مبنى، حد أقصى للسعر، أول N، غرف بحد أدنى من الشاغر)"""
+    try:
+        building_code = request.args.get('building')
+        max_price = request.args.get('max_price', type=float)
+        limit = request.args.get('limit', type=int)
+        min_free = request.args.get('min_free', type=int)
         
-        # إحصائيات المدفوعات الشهرية
-        current_month = datetime.now().strftime('%Y-%m')
-        monthly_payments = Payment.query.filter_by(month_year=current_month, status='confirmed').all()
-        payment_summary = {
-            'total_payments': len(monthly_payments),
-            'total_amount': sum([p.amount for p in monthly_payments]),
-            'rent_payments': len([p for p in monthly_payments if p.payment_type == 'rent']),
-            'deposit_payments': len([p for p in monthly_payments if p.payment_type == 'deposit'])
-        }
+        if building_code:
+            building_code = building_code.upper()
         
-        # إحصائيات المصروفات
-        current_month_expenses = Expense.query.filter(
-            db.extract('month', Expense.expense_date) == datetime.now().month,
-            db.extract('year', Expense.expense_date) == datetime.now().year
-        ).all()
-        
-        expense_summary = {
-            'total_expenses': len(current_month_expenses),
-            'total_amount': sum([e.amount for e in current_month_expenses]),
-            'maintenance_expenses': sum([e.amount for e in current_month_expenses if e.category == 'maintenance']),
-            'utilities_expenses': sum([e.amount for e in current_month_expenses if e.category == 'utilities']),
-            'other_expenses': sum([e.amount for e in current_month_expenses if e.category == 'other'])
-        }
+        if min_free:
+            return jsonify({
+                'success': True,
+                'data': bed_availability.rooms_with_free_beds(min_free, building_code, max_price)
+            })
         
+        beds = bed_availability.free_beds(building_code, max_price=max_price, limit=limit)
         return jsonify({
             'success': True,
-            'data': {
-                'general_stats': stats,
-                'building_stats': building_stats,
-                'payment_summary': payment_summary,
-                'expense_summary': expense_summary
-            }
+            'data': [bed._asdict() for bed in beds],
+            'total_available': bed_availability.count_free(building_code, max_price=max_price)
         })
         
     except Exception as e:
         return jsonify({
             'success': False,
-            'message': f'حدث خطأ في جلب الإحصائيات: {str(e)}'
+            'message': f'حدث خطأ في البحث عن الأسرة المتاحة: {str(e)}'
         })
 
+@dashboard_advanced_bp.route('/dashboard/cache/stats', methods=['GET'])
+@login_required
+def get_cache_stats():
+    """عدادات الذاكرة المؤقتة للمباني والغرف والأسرة"""
+    return jsonify({
+        'success': True,
+        'data': reference_cache.stats()
+    })
+
 @dashboard_advanced_bp.route('/dashboard/upload_excel', methods=['POST'])
 @login_required
 def upload_excel_file():
@@ -108,22 +112,23 @@ def upload_excel_file():
             return jsonify({'success': False, 'message': 'لم يتم اختيار ملف'})
         
         if file and allowed_file(file.filename):
-            # قراءة الملف مباشرة من الذاكرة
+            if file_type not in IMPORT_PROCESSORS:
+                return jsonify({'success': False, 'message': 'نوع ملف غير مدعوم'})
+            
             try:
+                # الملفات الكبيرة تُعالج على دفعات بذاكرة محدودة مع حفظ كل دفعة على حدة
+                if use_streaming_import(request):
+                    chunk_rows = request.form.get('chunk_rows', STREAM_CHUNK_ROWS, type=int)
+                    return jsonify(process_upload_stream(file, file_type, chunk_rows))
+                
+                # قراءة الملف مباشرة من الذاكرة
                 if file.filename.endswith('.csv'):
                     df = pd.read_csv(file)
                 else:
                     df = pd.read_excel(file)
                 
                 # معالجة البيانات حسب النوع
-                if file_type == 'payments':
-                    result = process_payments_excel(df)
-                elif file_type == 'students':
-                    result = process_students_excel(df)
-                elif file_type == 'expenses':
-                    result = process_expenses_excel(df)
-                else:
-                    return jsonify({'success': False, 'message': 'نوع ملف غير مدعوم'})
+                result = IMPORT_PROCESSORS[file_type](df)
                 
                 return jsonify(result)
                 
@@ -147,9 +152,6 @@ def upload_excel_file():
 def process_payments_excel(df):
     """معالجة ملف Excel للمدفوعات"""
     try:
-        processed = 0
-        errors = []
-        
         # التحقق من وجود الأعمدة المطلوبة
         required_columns = ['student_name', 'amount', 'payment_date']
         missing_columns = [col for col in required_columns if col not in df.columns]
@@ -160,45 +162,45 @@ def process_payments_excel(df):
                 'message': f'أعمدة مفقودة في الملف: {", ".join(missing_columns)}'
             }
         
-        for index, row in df.iterrows():
-            try:
-                # البحث عن الطالبة
-                student = Student.query.filter(
-                    Student.name.contains(str(row['student_name']).strip())
-                ).first()
-                
-                if not student:
-                    errors.append(f'الصف {index + 1}: لم يتم العثور على الطالبة {row["student_name"]}')
-                    continue
-                
-                # تحويل التاريخ
-                payment_date = pd.to_datetime(row['payment_date']).date()
-                
-                # إنشاء الدفعة
-                payment = Payment(
-                    student_id=student.id,
-                    amount=float(row['amount']),
-                    payment_type=row.get('payment_type', 'rent'),
-                    payment_date=payment_date,
-                    month_year=payment_date.strftime('%Y-%m'),
-                    payment_method=row.get('payment_method', 'cash'),
-                    notes=row.get('notes', ''),
-                    status='confirmed'
-                )
-                
-                db.session.add(payment)
-                processed += 1
-                
-            except Exception as e:
-                errors.append(f'الصف {index + 1}: {str(e)}')
-        
+        errors = RowErrors()
+        
+        # ربط كل الأسماء الفريدة بالطالبات دفعة واحدة من فهرس الأسماء
+        names = text_column(df, 'student_name')
+        resolved, ambiguous = resolve_student_names(names.unique())
+        student_ids = names.map(resolved)
+        is_ambiguous = names.isin(ambiguous)
+        errors.add(is_ambiguous, lambda i: f'الاسم {df.at[i, "student_name"]} لا يطابق طالبة واحدة بدقة، المرشحات: {ambiguous[names[i]]}')
+        errors.add(student_ids.isna() & ~is_ambiguous, lambda i: f'لم يتم العثور على الطالبة {df.at[i, "student_name"]}')
+        
+        amounts = pd.to_numeric(df['amount'], errors='coerce')
+        errors.add(amounts.isna(), 'قيمة المبلغ غير صالحة')
+        
+        payment_dates = date_column(df['payment_date'])
+        errors.add(payment_dates.isna(), 'تاريخ الدفع غير صالح')
+        
+        valid = errors.valid_mask(df.index)
+        mappings = build_mappings(
+            student_id=student_ids[valid].astype(int),
+            amount=amounts[valid].astype(float),
+            payment_type=text_column(df, 'payment_type', 'rent')[valid],
+            payment_date=payment_dates[valid].dt.date,
+            month_year=payment_dates[valid].dt.strftime('%Y-%m'),
+            payment_method=text_column(df, 'payment_method', 'cash')[valid],
+            notes=text_column(df, 'notes')[valid],
+            status='confirmed'
+        )
+        
+        bulk_insert(Payment, mappings)
+        # الإدراج المجمع لا يمر بأحداث الـ ORM: لقطة لوحة التحكم تُلغى بعد الـ commit
+        mark_changed(db.session, Payment)
         db.session.commit()
         
+        processed = len(mappings)
         return {
             'success': True,
             'message': f'تم معالجة {processed} دفعة بنجاح',
             'processed': processed,
-            'errors': errors
+            'errors': errors.messages()
         }
         
     except Exception as e:
@@ -211,9 +213,6 @@ def process_payments_excel(df):
 def process_students_excel(df):
     """معالجة ملف Excel للطالبات"""
     try:
-        processed = 0
-        errors = []
-        
         required_columns = ['name', 'phone']
         missing_columns = [col for col in required_columns if col not in df.columns]
         
@@ -223,41 +222,52 @@ def process_students_excel(df):
                 'message': f'أعمدة مفقودة في الملف: {", ".join(missing_columns)}'
             }
         
-        for index, row in df.iterrows():
-            try:
-                # التحقق من عدم وجود الطالبة مسبقاً
-                existing = Student.query.filter_by(name=str(row['name']).strip()).first()
-                if existing:
-                    errors.append(f'الصف {index + 1}: الطالبة {row["name"]} موجودة مسبقاً')
-                    continue
-                
-                # إنشاء الطالبة
-                student = Student(
-                    name=str(row['name']).strip(),
-                    phone=str(row.get('phone', '')).strip(),
-                    national_id=str(row.get('national_id', '')).strip(),
-                    guardian_phone=str(row.get('guardian_phone', '')).strip(),
-                    university=str(row.get('university', '')).strip(),
-                    category=row.get('category', 'student'),
-                    rent_amount=float(row.get('rent_amount', 55.0)),
-                    security_deposit=float(row.get('security_deposit', 100.0)),
-                    contract_start=pd.to_datetime(row.get('contract_start', date.today())).date() if pd.notna(row.get('contract_start')) else date.today(),
-                    status='active'
-                )
-                
-                db.session.add(student)
-                processed += 1
-                
-            except Exception as e:
-                errors.append(f'الصف {index + 1}: {str(e)}')
+        errors = RowErrors()
         
+        # التحقق من عدم وجود الطالبة مسبقاً (في قاعدة البيانات أو مكررة في نفس الملف)
+        names = text_column(df, 'name')
+        existing = names.map(student_names.has_exact)
+        normalized_names = names.map(student_names.name_key)
+        errors.add(existing | normalized_names.duplicated(), lambda i: f'الطالبة {df.at[i, "name"]} موجودة مسبقاً')
+        
+        rent_amounts = numeric_column(df, 'rent_amount', 55.0)
+        errors.add(rent_amounts.isna(), 'قيمة الإيجار غير صالحة')
+        
+        security_deposits = numeric_column(df, 'security_deposit', 100.0)
+        errors.add(security_deposits.isna(), 'قيمة التأمين غير صالحة')
+        
+        if 'contract_start' in df.columns:
+            contract_starts = date_column(df['contract_start'])
+            errors.add(df['contract_start'].notna() & contract_starts.isna(), 'تاريخ بداية العقد غير صالح')
+            contract_starts = contract_starts.dt.date.where(contract_starts.notna(), date.today())
+        else:
+            contract_starts = pd.Series(date.today(), index=df.index)
+        
+        valid = errors.valid_mask(df.index)
+        mappings = build_mappings(
+            name=names[valid],
+            phone=text_column(df, 'phone')[valid],
+            national_id=text_column(df, 'national_id')[valid],
+            guardian_phone=text_column(df, 'guardian_phone')[valid],
+            university=text_column(df, 'university')[valid],
+            category=text_column(df, 'category', 'student')[valid],
+            rent_amount=rent_amounts[valid],
+            security_deposit=security_deposits[valid],
+            contract_start=contract_starts[valid],
+            status='active'
+        )
+        
+        bulk_insert(Student, mappings)
+        # الإدراج المجمع لا يمر بأحداث الـ ORM: فهرس الأسماء يُعاد بناؤه بعد الـ commit
+        mark_changed(db.session, Student)
         db.session.commit()
         
+        processed = len(mappings)
         return {
             'success': True,
             'message': f'تم إضافة {processed} طالبة بنجاح',
             'processed': processed,
-            'errors': errors
+            'errors': errors.messages()
         }
         
     except Exception as e:
@@ -270,9 +280,6 @@ def process_students_excel(df):
 def process_expenses_excel(df):
     """معالجة ملف Excel للمصروفات"""
     try:
-        processed = 0
-        errors = []
-        
         required_columns = ['description', 'amount', 'expense_date']
         missing_columns = [col for col in required_columns if col not in df.columns]
         
@@ -282,30 +289,35 @@ def process_expenses_excel(df):
                 'message': f'أعمدة مفقودة في الملف: {", ".join(missing_columns)}'
             }
         
-        for index, row in df.iterrows():
-            try:
-                expense = Expense(
-                    description=str(row['description']).strip(),
-                    amount=float(row['amount']),
-                    category=row.get('category', 'other'),
-                    expense_date=pd.to_datetime(row['expense_date']).date(),
-                    receipt_number=str(row.get('receipt_number', '')).strip(),
-                    notes=str(row.get('notes', '')).strip()
-                )
-                
-                db.session.add(expense)
-                processed += 1
-                
-            except Exception as e:
-                errors.append(f'الصف {index + 1}: {str(e)}')
+        errors = RowErrors()
+        
+        amounts = pd.to_numeric(df['amount'], errors='coerce')
+        errors.add(amounts.isna(), 'قيمة المبلغ غير صالحة')
         
+        expense_dates = date_column(df['expense_date'])
+        errors.add(expense_dates.isna(), 'تاريخ المصروف غير صالح')
+        
+        valid = errors.valid_mask(df.index)
+        mappings = build_mappings(
+            description=text_column(df, 'description')[valid],
+            amount=amounts[valid].astype(float),
+            category=text_column(df, 'category', 'other')[valid],
+            expense_date=expense_dates[valid].dt.date,
+            receipt_number=text_column(df, 'receipt_number')[valid],
+            notes=text_column(df, 'notes')[valid]
+        )
+        
+        bulk_insert(Expense, mappings)
+        # الإدراج المجمع لا يمر بأحداث الـ ORM: لقطة لوحة التحكم تُلغى بعد الـ commit
+        mark_changed(db.session, Expense)
         db.session.commit()
         
+        processed = len(mappings)
         return {
             'success': True,
             'message': f'تم إضافة {processed} مصروف بنجاح',
             'processed': processed,
-            'errors': errors
+            'errors': errors.messages()
         }
         
     except Exception as e:
@@ -315,19 +327,201 @@ def process_expenses_excel(df):
             'message': f'خطأ في معالجة ملف المصروفات: {str(e)}'
         }
 
+# أدوات الاستيراد المجمع
+
+IMPORT_CHUNK_SIZE = 500
+
+IMPORT_PROCESSORS = {
+    'payments': process_payments_excel,
+    'students': process_students_excel,
+    'expenses': process_expenses_excel
+}
+
+# الاستيراد المتدفق للملفات الكبيرة
+
+STREAM_CHUNK_ROWS = 5000
+STREAM_THRESHOLD_BYTES = 5 * 1024 * 1024  # الملفات الأكبر من 5MB تُعالج على دفعات تلقائياً
+MAX_REPORTED_ERRORS = 1000
+
+def use_streaming_import(req):
+    """المعالجة المتدفقة عند طلبها صراحة (stream=1) أو عند تجاوز حجم الطلب للحد"""
+    stream = req.form.get('stream', '').lower()
+    if stream in ('1', 'true', 'yes'):
+        return True
+    if stream in ('0', 'false', 'no'):
+        return False
+    return (req.content_length or 0) > STREAM_THRESHOLD_BYTES
+
+def iter_upload_chunks(file, chunk_rows=STREAM_CHUNK_ROWS):
+    """قراءة الملف المرفوع كدفعات DataFrame ثابتة الحجم دون تحميله كاملاً في الذاكرة"""
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    
+    if extension == 'csv':
+        # read_csv يحافظ على ترقيم الصفوف متصلاً بين الدفعات
+        yield from pd.read_csv(file, chunksize=chunk_rows)
+    elif extension == 'xlsx':
+        yield from iter_xlsx_chunks(file.stream, chunk_rows)
+    else:
+        # صيغة xls القديمة لا تدعم القراءة المتدفقة
+        yield pd.read_excel(file)
+
+def iter_xlsx_chunks(stream, chunk_rows):
+    """قراءة ملف xlsx صفاً صفاً بوضع القراءة فقط في openpyxl"""
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(c).strip() if c is not None else f'column_{i}' for i, c in enumerate(header)]
+        
+        offset = 0
+        buffer = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            buffer.append(row[:len(columns)])
+            if len(buffer) >= chunk_rows:
+                yield pd.DataFrame(buffer, columns=columns, index=range(offset, offset + len(buffer)))
+                offset += len(buffer)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns, index=range(offset, offset + len(buffer)))
+    finally:
+        workbook.close()
+
+def process_upload_stream(file, file_type, chunk_rows=STREAM_CHUNK_ROWS):
+    """معالجة ملف كبير على دفعات مع حفظ كل دفعة وإرجاع تقرير تقدم وملخص"""
+    processor = IMPORT_PROCESSORS[file_type]
+    chunk_rows = max(1, chunk_rows)
+    
+    processed = 0
+    error_count = 0
+    errors = []
+    chunks = []
+    
+    for chunk_number, chunk in enumerate(iter_upload_chunks(file, chunk_rows), start=1):
+        result = processor(chunk)
+        
+        if not result['success']:
+            # خطأ يمنع المتابعة (مثل أعمدة مفقودة)؛ الدفعات السابقة محفوظة
+            return {
+                'success': False,
+                'message': result['message'],
+                'processed': processed,
+                'chunks': chunks
+            }
+        
+        chunk_errors = result['errors']
+        processed += result['processed']
+        error_count += len(chunk_errors)
+        errors.extend(chunk_errors[:max(0, MAX_REPORTED_ERRORS - len(errors))])
+        
+        chunks.append({
+            'chunk': chunk_number,
+            'rows': len(chunk),
+            'processed': result['processed'],
+            'errors': len(chunk_errors),
+            'total_processed': processed
+        })
+    
+    return {
+        'success': True,
+        'message': f'تمت معالجة {processed} صف بنجاح على {len(chunks)} دفعة',
+        'processed': processed,
+        'error_count': error_count,
+        'errors': errors,
+        'chunks': chunks
+    }
+
+class RowErrors:
+    """تجميع أخطاء الصفوف من أقنعة pandas مع الاحتفاظ بأول خطأ لكل صف"""
+    
+    def __init__(self):
+        self.errors = {}
+    
+    def add(self, mask, message):
+        """تسجيل خطأ لكل صف يحقق القناع (message نص ثابت أو دالة تأخذ رقم الصف)"""
+        for index in mask[mask].index:
+            if index not in self.errors:
+                self.errors[index] = message(index) if callable(message) else message
+    
+    def valid_mask(self, index):
+        return ~index.isin(list(self.errors))
+    
+    def messages(self):
+        return [f'الصف {index + 1}: {message}' for index, message in sorted(self.errors.items())]
+
+def text_column(df, column, default=''):
+    """عمود نصي منظف، مع قيمة افتراضية للعمود المفقود أو الخلايا الفارغة"""
+    if column not in df.columns:
+        return pd.Series(default, index=df.index, dtype=object)
+    values = df[column].fillna('').astype(str).str.strip()
+    if default:
+        values = values.mask(values == '', default)
+    return values
+
+def date_column(values):
+    """عمود تواريخ تُحلل كل خلية فيه بصيغتها (الصيغة لا تؤخذ من أول قيمة)؛ غير الصالح يصبح NaT"""
+    return pd.to_datetime(values, errors='coerce', format='mixed')
+
+def numeric_column(df, column, default):
+    """عمود رقمي اختياري: الخلايا الفارغة تأخذ القيمة الافتراضية والقيم غير الرقمية تصبح NaN"""
+    if column not in df.columns:
+        return pd.Series(default, index=df.index, dtype=float)
+    values = pd.to_numeric(df[column], errors='coerce')
+    return values.mask(df[column].isna(), default)
+
+def build_mappings(**columns):
+    """تحويل أعمدة pandas (أو قيم ثابتة) إلى قائمة قواميس بأنواع Python الأصلية"""
+    series = {key: value for key, value in columns.items() if isinstance(value, pd.Series)}
+    constants = {key: value for key, value in columns.items() if key not in series}
+    if not series:
+        return []
+    
+    keys = list(series)
+    # tolist() يعيد أنواع Python الأصلية (int/float/date) المقبولة في sqlite3
+    value_lists = [series[key].tolist() for key in keys]
+    return [dict(zip(keys, values), **constants) for values in zip(*value_lists)]
+
+def bulk_insert(model, mappings, chunk_size=IMPORT_CHUNK_SIZE):
+    """إدراج مجمع (executemany) على دفعات داخل المعاملة الحالية"""
+    for start in range(0, len(mappings), chunk_size):
+        db.session.bulk_insert_mappings(model, mappings[start:start + chunk_size])
+
+def resolve_student_names(names):
+    """ربط الأسماء الفريدة بالطالبات من فهرس الأسماء: ({الاسم: id}, {الاسم الملتبس: المرشحات})"""
+    resolved = {}
+    ambiguous = {}
+    for name in names:
+        if not name:
+            continue
+        student_id, candidates = student_names.resolve(name)
+        if student_id is not None:
+            resolved[name] = student_id
+        elif candidates:
+            ambiguous[name] = '، '.join(candidate.name for candidate in candidates)
+    return resolved, ambiguous
+
 @dashboard_advanced_bp.route('/dashboard/export/<data_type>', methods=['GET'])
 @login_required
 def export_data(data_type):
-    """تصدير البيانات إلى Excel"""
+    """تصدير البيانات إلى Excel أو CSV (format=xlsx|csv)"""
     try:
+        export_format = request.args.get('format', 'xlsx').lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'success': False, 'message': 'صيغة تصدير غير مدعومة'})
+        
         if data_type == 'students':
-            return export_students_data()
+            return export_students_data(export_format)
         elif data_type == 'payments':
-            return export_payments_data()
+            return export_payments_data(export_format)
         elif data_type == 'expenses':
-            return export_expenses_data()
+            return export_expenses_data(export_format)
         elif data_type == 'beds':
-            return export_beds_data()
+            return export_beds_data(export_format)
         else:
             return jsonify({'success': False, 'message': 'نوع بيانات غير مدعوم'})
             
@@ -337,175 +531,306 @@ def export_data(data_type):
             'message': f'خطأ في تصدير البيانات: {str(e)}'
         })
 
-def export_students_data():
+def export_students_data(export_format='xlsx'):
     """تصدير بيانات الطالبات"""
-    students = Student.query.filter_by(status='active').all()
-    
-    data = []
-    for student in students:
-        # الحصول على السرير الحالي
-        assignment = BedAssignment.query.filter_by(
-            student_id=student.id, 
-            status='active'
-        ).first()
-        
-        bed_code = ''
-        building_name = ''
-        room_number = ''
-        
-        if assignment:
-            bed = Bed.query.get(assignment.bed_id)
-            room = Room.query.get(assignment.room_id)
-            building = Building.query.get(bed.building_id)
-            bed_code = bed.bed_code
-            building_name = building.building_name
-            room_number = room.room_number
-        
-        # حساب إجمالي المدفوعات
-        total_payments = sum([p.amount for p in student.payments if p.status == 'confirmed'])
-        
-        data.append({
-            'الاسم': student.name,
-            'الجوال': student.phone or '',
-            'رقم الهوية': student.national_id or '',
-            'جوال الأقارب': student.guardian_phone or '',
-            'الجامعة': student.university or '',
-            'الفئة': 'طالبة' if student.category == 'student' else 'موظفة',
-            'رقم السرير': bed_code,
-            'المبنى': building_name,
-            'رقم الغرفة': room_number,
-            'الإيجار الشهري': student.rent_amount,
-            'مبلغ التأمين': student.security_deposit,
-            'إجمالي المدفوعات': total_payments,
-            'تاريخ بداية العقد': student.contract_start.strftime('%Y-%m-%d') if student.contract_start else '',
-            'تاريخ نهاية العقد': student.contract_end.strftime('%Y-%m-%d') if student.contract_end else '',
-            'ملاحظات': student.notes or ''
-        })
-    
-    df = pd.DataFrame(data)
-    
-    # إنشاء ملف Excel في الذاكرة
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='الطالبات النشطات', index=False)
-    
-    output.seek(0)
-    
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=f'students_data_{datetime.now().strftime("%Y%m%d")}.xlsx'
-    )
+    headers = [
+        'الاسم', 'الجوال', 'رقم الهوية', 'جوال الأقارب', 'الجامعة', 'الفئة',
+        'رقم السرير', 'المبنى', 'رقم الغرفة', 'الإيجار الشهري', 'مبلغ التأمين',
+        'إجمالي المدفوعات', 'تاريخ بداية العقد', 'تاريخ نهاية العقد', 'ملاحظات'
+    ]
+    
+    def rows():
+        # أول تخصيص نشط لكل طالبة
+        active_assignments = db.session.query(
+            BedAssignment.student_id,
+            func.min(BedAssignment.id).label('assignment_id')
+        ).filter(BedAssignment.status == 'active').group_by(BedAssignment.student_id).subquery()
+        
+        # مجموع المدفوعات المؤكدة لكل طالبة
+        payment_totals = db.session.query(
+            Payment.student_id,
+            func.sum(Payment.amount).label('total_payments')
+        ).filter(Payment.status == 'confirmed').group_by(Payment.student_id).subquery()
+        
+        # استعلام واحد: الطالبات ⋈ التخصيص النشط ⋈ الأسرة ⋈ الغرف ⋈ المباني ⋈ مجاميع المدفوعات
+        students = db.session.query(
+            Student.name,
+            Student.phone,
+            Student.national_id,
+            Student.guardian_phone,
+            Student.university,
+            Student.category,
+            Student.rent_amount,
+            Student.security_deposit,
+            Student.contract_start,
+            Student.contract_end,
+            Student.notes,
+            Bed.bed_code,
+            Building.building_name,
+            Room.room_number,
+            func.coalesce(payment_totals.c.total_payments, 0).label('total_payments')
+        ).outerjoin(
+            active_assignments, active_assignments.c.student_id == Student.id
+        ).outerjoin(
+            BedAssignment, BedAssignment.id == active_assignments.c.assignment_id
+        ).outerjoin(
+            Bed, BedAssignment.bed_id == Bed.id
+        ).outerjoin(
+            Room, BedAssignment.room_id == Room.id
+        ).outerjoin(
+            Building, Bed.building_id == Building.id
+        ).outerjoin(
+            payment_totals, payment_totals.c.student_id == Student.id
+        ).filter(
+            Student.status == 'active'
+        ).order_by(Student.id).execution_options(stream_results=True).yield_per(EXPORT_BATCH_SIZE)
+        
+        for student in students:
+            yield [
+                student.name,
+                student.phone or '',
+                student.national_id or '',
+                student.guardian_phone or '',
+                student.university or '',
+                'طالبة' if student.category == 'student' else 'موظفة',
+                student.bed_code or '',
+                student.building_name or '',
+                student.room_number or '',
+                student.rent_amount,
+                student.security_deposit,
+                student.total_payments,
+                student.contract_start.strftime('%Y-%m-%d') if student.contract_start else '',
+                student.contract_end.strftime('%Y-%m-%d') if student.contract_end else '',
+                student.notes or ''
+            ]
+    
+    return stream_export(rows(), headers, 'الطالبات النشطات', 'students_data', export_format)
 
-def export_payments_data():
+def export_payments_data(export_format='xlsx'):
     """تصدير بيانات المدفوعات"""
-    payments = Payment.query.order_by(Payment.payment_date.desc()).all()
-    
-    data = []
-    for payment in payments:
-        student = Student.query.get(payment.student_id)
-        
-        data.append({
-            'اسم الطالبة': student.name,
-            'المبلغ': payment.amount,
-            'نوع الدفعة': 'إيجار' if payment.payment_type == 'rent' else 'تأمين' if payment.payment_type == 'deposit' else 'أخرى',
-            'تاريخ الدفع': payment.payment_date.strftime('%Y-%m-%d'),
-            'الشهر': payment.month_year or '',
-            'طريقة الدفع': payment.payment_method or '',
-            'الحالة': 'مؤكد' if payment.status == 'confirmed' else 'معلق',
-            'ملاحظات': payment.notes or ''
-        })
-    
-    df = pd.DataFrame(data)
-    
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='المدفوعات', index=False)
-    
-    output.seek(0)
-    
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=f'payments_data_{datetime.now().strftime("%Y%m%d")}.xlsx'
-    )
+    headers = ['اسم الطالبة', 'المبلغ', 'نوع الدفعة', 'تاريخ الدفع', 'الشهر', 'طريقة الدفع', 'الحالة', 'ملاحظات']
+    
+    def rows():
+        # استعلام واحد: المدفوعات مع أسماء الطالبات
+        payments = db.session.query(
+            Payment.amount,
+            Payment.payment_type,
+            Payment.payment_date,
+            Payment.month_year,
+            Payment.payment_method,
+            Payment.status,
+            Payment.notes,
+            Student.name.label('student_name')
+        ).outerjoin(
+            Student, Payment.student_id == Student.id
+        ).order_by(Payment.payment_date.desc()).yield_per(EXPORT_BATCH_SIZE)
+        
+        for payment in payments:
+            yield [
+                payment.student_name or '',
+                payment.amount,
+                'إيجار' if payment.payment_type == 'rent' else 'تأمين' if payment.payment_type == 'deposit' else 'أخرى',
+                payment.payment_date.strftime('%Y-%m-%d'),
+                payment.month_year or '',
+                payment.payment_method or '',
+                'مؤكد' if payment.status == 'confirmed' else 'معلق',
+                payment.notes or ''
+            ]
+    
+    return stream_export(rows(), headers, 'المدفوعات', 'payments_data', export_format)
 
-def export_expenses_data():
+def export_expenses_data(export_format='xlsx'):
     """تصدير بيانات المصروفات"""
-    expenses = Expense.query.order_by(Expense.expense_date.desc()).all()
-    
-    data = []
-    for expense in expenses:
-        data.append({
-            'الوصف': expense.description,
-            'المبلغ': expense.amount,
-            'الفئة': expense.category,
-            'تاريخ المصروف': expense.expense_date.strftime('%Y-%m-%d'),
-            'رقم الإيصال': expense.receipt_number or '',
-            'ملاحظات': expense.notes or ''
-        })
-    
-    df = pd.DataFrame(data)
-    
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='المصروفات', index=False)
-    
-    output.seek(0)
-    
-    return send_file(
-        output,
+    headers = ['الوصف', 'المبلغ', 'الفئة', 'تاريخ المصروف', 'رقم الإيصال', 'ملاحظات']
+    
+    def rows():
+        expenses = Expense.query.order_by(Expense.expense_date.desc()).yield_per(EXPORT_BATCH_SIZE)
+        for expense in expenses:
+            yield [
+                expense.description,
+                expense.amount,
+                expense.category,
+                expense.expense_date.strftime('%Y-%m-%d'),
+                expense.receipt_number or '',
+                expense.notes or ''
+            ]
+    
+    return stream_export(rows(), headers, 'المصروفات', 'expenses_data', export_format)
+
+def export_beds_data(export_format='xlsx'):
+    """تصدير بيانات الأسرة"""
+    headers = ['رقم السرير', 'المبنى', 'رقم الغرفة', 'رقم السرير في الغرفة', 'السعر', 'الحالة', 'اسم الطالبة']
+    
+    def rows():
+        # أول تخصيص نشط لكل سرير (نفس سلوك first() السابق)
+        active_assignments = db.session.query(
+            BedAssignment.bed_id,
+            func.min(BedAssignment.id).label('assignment_id')
+        ).filter(BedAssignment.status == 'active').group_by(BedAssignment.bed_id).subquery()
+        
+        # استعلام واحد: الأسرة ⋈ الغرف ⋈ المباني ⋈ التخصيصات النشطة ⋈ الطالبات
+        beds = db.session.query(
+            Bed.bed_code,
+            Bed.bed_number,
+            Bed.price,
+            Bed.status,
+            Building.building_name,
+            Room.room_number,
+            Student.name.label('student_name')
+        ).join(
+            Room, Bed.room_id == Room.id
+        ).join(
+            Building, Bed.building_id == Building.id
+        ).outerjoin(
+            active_assignments, active_assignments.c.bed_id == Bed.id
+        ).outerjoin(
+            BedAssignment, BedAssignment.id == active_assignments.c.assignment_id
+        ).outerjoin(
+            Student, BedAssignment.student_id == Student.id
+        ).order_by(Bed.id).yield_per(EXPORT_BATCH_SIZE)
+        
+        for bed in beds:
+            yield [
+                bed.bed_code,
+                bed.building_name,
+                bed.room_number,
+                bed.bed_number,
+                bed.price,
+                'مشغول' if bed.status == 'occupied' else 'متاح' if bed.status == 'available' else 'صيانة',
+                bed.student_name or ''
+            ]
+    
+    return stream_export(rows(), headers, 'الأسرة', 'beds_data', export_format)
+
+# التصدير المتدفق
+
+EXPORT_FORMATS = {'xlsx', 'csv'}
+EXPORT_BATCH_SIZE = 1000  # عدد الصفوف المجلوبة من المؤشر في كل دفعة
+
+def stream_export(rows, headers, sheet_name, filename_prefix, export_format='xlsx'):
+    """إرسال التصدير صفاً صفاً بذاكرة ثابتة: مولد CSV أو xlsx متدفق"""
+    download_name = f'{filename_prefix}_{datetime.now().strftime("%Y%m%d")}.{export_format}'
+    
+    if export_format == 'csv':
+        return Response(
+            stream_with_context(generate_csv(headers, rows)),
+            mimetype='text/csv; charset=utf-8',
+            headers={'Content-Disposition': f'attachment; filename={download_name}'}
+        )
+    
+    return Response(
+        stream_with_context(generate_xlsx(headers, rows, sheet_name)),
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=f'expenses_data_{datetime.now().strftime("%Y%m%d")}.xlsx'
+        headers={'Content-Disposition': f'attachment; filename={download_name}'}
     )
 
-def export_beds_data():
-    """تصدير بيانات الأسرة"""
-    beds = Bed.query.all()
-    
-    data = []
-    for bed in beds:
-        room = Room.query.get(bed.room_id)
-        building = Building.query.get(bed.building_id)
-        
-        # الحصول على الطالبة الحالية
-        assignment = BedAssignment.query.filter_by(
-            bed_id=bed.id, 
-            status='active'
-        ).first()
-        
-        student_name = ''
-        if assignment:
-            student = Student.query.get(assignment.student_id)
-            student_name = student.name
-        
-        data.append({
-            'رقم السرير': bed.bed_code,
-            'المبنى': building.building_name,
-            'رقم الغرفة': room.room_number,
-            'رقم السرير في الغرفة': bed.bed_number,
-            'السعر': bed.price,
-            'الحالة': 'مشغول' if bed.status == 'occupied' else 'متاح' if bed.status == 'available' else 'صيانة',
-            'اسم الطالبة': student_name
-        })
+def generate_csv(headers, rows):
+    """مولد CSV يُخرج الصفوف على دفعات صغيرة"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    # BOM حتى يعرض Excel النص العربي بشكل صحيح
+    buffer.write('\ufeff')
+    writer.writerow(headers)
+    
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    
+    yield buffer.getvalue()
+
+# أجزاء ملف xlsx الثابتة (ورقة واحدة بنصوص مضمنة فلا حاجة لجدول النصوص المشتركة)
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+XLSX_SHEET_END = '</sheetData></worksheet>'
+
+# محارف التحكم غير مسموحة في XML
+XML_ILLEGAL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def xlsx_cell(value):
+    """خلية XML: الأرقام كقيم والباقي نص مضمن"""
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(XML_ILLEGAL_CHARS.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def xlsx_row(values):
+    """صف XML"""
+    return '<row>' + ''.join(xlsx_cell(value) for value in values) + '</row>'
+
+class StreamSink(io.RawIOBase):
+    """مخرج غير قابل للتنقل يجمع ما يكتبه zipfile حتى يُرسل (zipfile يكتب عندها واصفات البيانات بعد كل جزء)"""
     
-    df = pd.DataFrame(data)
+    def __init__(self):
+        self.chunks = []
     
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='الأسرة', index=False)
+    def writable(self):
+        return True
     
-    output.seek(0)
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
     
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=f'beds_data_{datetime.now().strftime("%Y%m%d")}.xlsx'
-    )
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def generate_xlsx(headers, rows, sheet_name):
+    """مولد xlsx يضغط الصفوف مباشرة في أرشيف zip متدفق ويُخرجها على دفعات (دون ملف مؤقت)"""
+    sink = StreamSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', XLSX_ROOT_RELS)
+        archive.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(sheet_name=escape(sheet_name[:31], {'"': '&quot;'})))
+        archive.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        yield sink.drain()
+        
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((XLSX_SHEET_START + xlsx_row(headers)).encode('utf-8'))
+            batch = []
+            for count, row in enumerate(rows, start=1):
+                batch.append(xlsx_row(row))
+                if count % EXPORT_BATCH_SIZE == 0:
+                    sheet.write(''.join(batch).encode('utf-8'))
+                    batch = []
+                    yield sink.drain()
+            sheet.write((''.join(batch) + XLSX_SHEET_END).encode('utf-8'))
+    yield sink.drain()
 
 @dashboard_advanced_bp.route('/dashboard/bed_management', methods=['POST'])
 @login_required
@@ -1,5 +1,8 @@
 from flask import Blueprint, request, jsonify
 from src.models.housing import db, Building, Room, Student, BedAssignment, FinancialRecord, Expense, OverduePayment
+from src.models.pagination import parse_fields, parse_limit, keyset_paginate, project_columns, serialize_row
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 from datetime import datetime, date
 import json
 
@@ -19,45 +22,76 @@ def get_buildings():
 
 @housing_bp.route('/rooms', methods=['GET'])
 def get_rooms():
-    rooms = Room.query.all()
-    return jsonify([{
-        'id': r.id,
-        'building_code': r.building.building_code,
-        'room_number': r.room_number,
-        'room_type': r.room_type,
-        'total_beds': r.total_beds,
-        'occupied_beds': r.occupied_beds,
-        'available_beds': r.available_beds,
-        'price_per_bed': r.price_per_bed,
-        'monthly_revenue': r.monthly_revenue,
-        'status': r.status
-    } for r in rooms])
+    occupancy = get_rooms_occupancy_subquery()
+    occupied = func.coalesce(occupancy.c.occupied_beds, 0)
+    room_fields = {
+        'id': Room.id,
+        'building_code': Building.building_code,
+        'room_number': Room.room_number,
+        'room_type': Room.room_type,
+        'total_beds': Room.total_beds,
+        'occupied_beds': occupied,
+        'available_beds': Room.total_beds - occupied,
+        'price_per_bed': Room.price_per_bed,
+        'monthly_revenue': Room.monthly_revenue,
+        'status': Room.status
+    }
+    
+    try:
+        fields = parse_fields(request.args.get('fields'), room_fields)
+        query = db.session.query(*project_columns(room_fields, fields, [Room.id])).select_from(Room)
+        if 'building_code' in fields:
+            query = query.join(Building, Room.building_id == Building.id)
+        if 'occupied_beds' in fields or 'available_beds' in fields:
+            query = query.outerjoin(occupancy, occupancy.c.room_id == Room.id)
+        rows, next_cursor = paginate_list(query, [Room.id])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return list_response([serialize_row(r, fields) for r in rows], next_cursor)
 
 @housing_bp.route('/rooms/available', methods=['GET'])
 def get_available_rooms():
-    rooms = Room.query.filter(Room.total_beds > Room.occupied_beds).all()
+    occupancy = get_rooms_occupancy_subquery()
+    occupied = func.coalesce(occupancy.c.occupied_beds, 0)
+    rows = db.session.query(Room, occupied).outerjoin(
+        occupancy, occupancy.c.room_id == Room.id
+    ).filter(Room.total_beds > occupied).options(joinedload(Room.building)).all()
     return jsonify([{
         'id': r.id,
         'building_code': r.building.building_code,
         'room_number': r.room_number,
-        'available_beds': r.available_beds,
+        'available_beds': r.total_beds - occupied_beds,
         'price_per_bed': r.price_per_bed
-    } for r in rooms if r.available_beds > 0])
+    } for r, occupied_beds in rows])
 
 # مسارات الطالبات
 @housing_bp.route('/students', methods=['GET'])
 def get_students():
-    students = Student.query.all()
-    return jsonify([{
-        'id': s.id,
-        'name': s.name,
-        'phone': s.phone,
-        'university': s.university,
-        'status': s.status,
-        'contract_start': s.contract_start.isoformat() if s.contract_start else None,
-        'contract_end': s.contract_end.isoformat() if s.contract_end else None,
-        'current_room': get_student_current_room(s.id)
-    } for s in students])
+    student_fields = {
+        'id': Student.id,
+        'name': Student.name,
+        'phone': Student.phone,
+        'university': Student.university,
+        'status': Student.status,
+        'contract_start': Student.contract_start,
+        'contract_end': Student.contract_end
+    }
+    
+    try:
+        fields = parse_fields(request.args.get('fields'), list(student_fields) + ['current_room'])
+        query = db.session.query(*project_columns(student_fields, fields, [Student.id]))
+        rows, next_cursor = paginate_list(query, [Student.id])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    items = [serialize_row(s, fields) for s in rows]
+    if 'current_room' in fields:
+        current_rooms = get_students_current_rooms([s.id for s in rows])
+        for item, s in zip(items, rows):
+            item['current_room'] = current_rooms.get(s.id)
+    
+    return list_response(items, next_cursor)
 
 @housing_bp.route('/students', methods=['POST'])
 def create_student():
@@ -156,16 +190,27 @@ def add_payment():
 
 @housing_bp.route('/students/<int:student_id>/payments', methods=['GET'])
 def get_student_payments(student_id):
-    payments = FinancialRecord.query.filter_by(student_id=student_id).order_by(FinancialRecord.payment_date.desc()).all()
-    return jsonify([{
-        'id': p.id,
-        'payment_date': p.payment_date.isoformat(),
-        'amount': p.amount,
-        'month_for': p.month_for,
-        'payment_method': p.payment_method,
-        'notes': p.notes,
-        'status': p.status
-    } for p in payments])
+    payment_fields = {
+        'id': FinancialRecord.id,
+        'payment_date': FinancialRecord.payment_date,
+        'amount': FinancialRecord.amount,
+        'month_for': FinancialRecord.month_for,
+        'payment_method': FinancialRecord.payment_method,
+        'notes': FinancialRecord.notes,
+        'status': FinancialRecord.status
+    }
+    key_columns = [FinancialRecord.payment_date, FinancialRecord.id]
+    
+    try:
+        fields = parse_fields(request.args.get('fields'), payment_fields)
+        query = db.session.query(*project_columns(payment_fields, fields, key_columns)).filter(
+            FinancialRecord.student_id == student_id
+        )
+        rows, next_cursor = paginate_list(query, key_columns, descending=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return list_response([serialize_row(p, fields) for p in rows], next_cursor)
 
 # مسارات المتأخرات
 @housing_bp.route('/overdue-payments', methods=['GET'])
@@ -203,20 +248,35 @@ def add_expense():
 
 @housing_bp.route('/expenses', methods=['GET'])
 def get_expenses():
-    expenses = Expense.query.order_by(Expense.expense_date.desc()).all()
-    return jsonify([{
-        'id': e.id,
-        'expense_date': e.expense_date.isoformat(),
-        'description': e.description,
-        'amount': e.amount,
-        'category': e.category,
-        'building_code': e.building.building_code if e.building_id else None,
-        'room_number': e.room.room_number if e.room_id else None
-    } for e in expenses])
+    expense_fields = {
+        'id': Expense.id,
+        'expense_date': Expense.expense_date,
+        'description': Expense.description,
+        'amount': Expense.amount,
+        'category': Expense.category,
+        'building_code': Building.building_code,
+        'room_number': Room.room_number
+    }
+    key_columns = [Expense.expense_date, Expense.id]
+    
+    try:
+        fields = parse_fields(request.args.get('fields'), expense_fields)
+        query = db.session.query(*project_columns(expense_fields, fields, key_columns)).select_from(Expense)
+        if 'building_code' in fields:
+            query = query.outerjoin(Building, Expense.building_id == Building.id)
+        if 'room_number' in fields:
+            query = query.outerjoin(Room, Expense.room_id == Room.id)
+        rows, next_cursor = paginate_list(query, key_columns, descending=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return list_response([serialize_row(e, fields) for e in rows], next_cursor)
 
 # دوال مساعدة
 def get_student_current_room(student_id):
-    assignment = BedAssignment.query.filter_by(student_id=student_id, status='active').first()
+    assignment = BedAssignment.query.options(
+        joinedload(BedAssignment.room).joinedload(Room.building)
+    ).filter_by(student_id=student_id, status='active').first()
     if assignment:
         return {
             'building_code': assignment.room.building.building_code,
@@ -225,6 +285,58 @@ def get_student_current_room(student_id):
         }
     return None
 
+def get_students_current_rooms(student_ids=None):
+    """الغرفة الحالية لكل الطالبات (أو لقائمة محددة) باستعلام واحد: {student_id: current_room}"""
+    query = db.session.query(
+        BedAssignment.student_id,
+        Building.building_code,
+        Room.room_number,
+        BedAssignment.bed_number
+    ).join(Room, BedAssignment.room_id == Room.id).join(
+        Building, Room.building_id == Building.id
+    ).filter(BedAssignment.status == 'active')
+    if student_ids is not None:
+        query = query.filter(BedAssignment.student_id.in_(student_ids))
+    rows = query.order_by(BedAssignment.id).all()
+    
+    current_rooms = {}
+    for student_id, building_code, room_number, bed_number in rows:
+        # نفس سلوك first(): أول تخصيص نشط لكل طالبة
+        current_rooms.setdefault(student_id, {
+            'building_code': building_code,
+            'room_number': room_number,
+            'bed_number': bed_number
+        })
+    return current_rooms
+
+def get_rooms_occupancy_subquery():
+    """استعلام فرعي مجمع لعدد الأسرة المشغولة في كل غرفة (room_id, occupied_beds)"""
+    return db.session.query(
+        BedAssignment.room_id,
+        func.count(BedAssignment.id).label('occupied_beds')
+    ).filter(BedAssignment.status == 'active').group_by(BedAssignment.room_id).subquery()
+
+def paginate_list(query, key_columns, descending=False):
+    """ترقيم بالمفتاح عند طلب limit أو cursor، وإلا إرجاع القائمة كاملة بنفس الترتيب"""
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        order = [c.desc() if descending else c.asc() for c in key_columns]
+        return query.order_by(*order).all(), None
+    
+    return keyset_paginate(
+        query,
+        key_columns,
+        cursor=request.args.get('cursor'),
+        limit=parse_limit(request.args.get('limit')),
+        descending=descending
+    )
+
+def list_response(items, next_cursor):
+    """القائمة كما هي في جسم الرد، ومؤشر الصفحة التالية في الترويسة X-Next-Cursor"""
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
 def get_student_financial_summary(student_id):
     payments = FinancialRecord.query.filter_by(student_id=student_id).all()
     total_paid = sum(p.amount for p in payments)
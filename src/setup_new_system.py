@@ -9,17 +9,36 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from flask import Flask
 from models.user import db
-from models.core import setup_initial_data, Building, Room, Bed, Student
-from datetime import datetime, date
+from models.core import setup_initial_data, provision_layout, upgrade_database, check_query_plans, reconcile_occupancy_counters, Building, Room, Bed, Student
+from models.search import rebuild_search_indexes
+from models.overdue import refresh_overdue_payments
+from utils.metrics import request_metrics
+from utils.profiling import request_profiler
+from utils.slow_queries import slow_query_log
+from utils.sqlite_profile import sqlite_profile, read_pragmas, DEFAULT_SQLITE_PRAGMAS
+from datetime import datetime, date, timedelta
 
-def create_app():
-    """إنشاء تطبيق Flask للإعداد"""
+def create_app(config=None):
+    """إنشاء تطبيق Flask للإعداد (config يتجاوز الإعدادات الافتراضية)"""
     app = Flask(__name__)
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///housing_system.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = 'your-secret-key-here'
+    # سجل الاستعلامات البطيئة (0 يعطله) في instance/slow_queries.log و /admin/slow-queries
+    app.config['SLOW_QUERY_THRESHOLD_MS'] = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+    # تحليل الأداء عند الطلب (?_profile=cprofile|sample) وسجل أبطأ الطلبات — معطلان افتراضياً
+    app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED') == '1'
+    app.config['PROFILING_SAMPLER'] = os.environ.get('PROFILING_SAMPLER') == '1'
+    app.config['PROFILING_DIR'] = os.environ.get('PROFILING_DIR')
+    # أوامر PRAGMA ومجمع الاتصالات: SQLITE_PRAGMAS و SQLITE_POOL تتجاوز القيم الافتراضية (None يلغي الإعداد)
+    app.config.update(config or {})
     
+    sqlite_profile.init_app(app)
     db.init_app(app)
+    slow_query_log.init_app(app)
+    # قياس الاستعلامات وزمن الطلبات لكل الـ blueprints المسجلة في التطبيق (/metrics)
+    request_metrics.init_app(app)
+    request_profiler.init_app(app)
     return app
 
 def setup_database():
@@ -66,6 +85,76 @@ def display_statistics():
         building = Building.query.get(bed.building_id)
         print(f"  {bed.bed_code} - {building.building_name} غرفة {room.room_number} سرير {bed.bed_number}")
 
+def upgrade_existing_database():
+    """ترقية قاعدة بيانات موجودة بالأعمدة والفهارس الجديدة ثم التحقق من مخططات الاستعلامات"""
+    app = create_app()
+    
+    with app.app_context():
+        print("🔄 ترقية قاعدة البيانات...")
+        result = upgrade_database()
+        print(f"أعمدة مضافة: {', '.join(result['added_columns']) or 'لا يوجد'}")
+        print(f"فهارس منشأة: {', '.join(result['created_indexes']) or 'لا يوجد'}")
+        
+        settings = read_pragmas(db.session.connection())
+        print(f"إعدادات SQLite: {', '.join(f'{name}={value}' for name, value in settings.items())}")
+        
+        # الأعمدة المضافة للتو تبدأ بصفر؛ تُحسب العدادات من جدول الأسرة
+        reconcile_counters()
+        explain_query_plans()
+
+def reconcile_counters():
+    """إعادة حساب عدادات الإشغال في الغرف والمباني وإصلاح الانحراف"""
+    drift = reconcile_occupancy_counters(repair=True)
+    print(f"\n🔧 عدادات الإشغال: تم إصلاح {len(drift)} سجل")
+    for item in drift:
+        print(f"  {item['table']} #{item['id']}: {item['stored']} ← {item['actual']}")
+    return drift
+
+def provision_from_file(path):
+    """تطبيق تخطيط مبانٍ من ملف JSON ثم عرض الإحصائيات"""
+    import json
+    
+    with open(path, encoding='utf-8') as layout_file:
+        spec = json.load(layout_file)
+    # مفاتيح room_overrides في JSON نصوص
+    for building in spec:
+        building['room_overrides'] = {int(k): v for k, v in building.get('room_overrides', {}).items()}
+    
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        result = provision_layout(spec)
+        print("🏗️ نتيجة التخطيط:")
+        for key, count in result.items():
+            print(f"  {key}: {count}")
+        display_statistics()
+
+def refresh_overdue(months=1):
+    """تحديث جدول المتأخرات لآخر عدد من الأشهر"""
+    current_month = date.today().replace(day=1)
+    month_starts = []
+    for offset in range(months - 1, -1, -1):
+        month_index = current_month.year * 12 + current_month.month - 1 - offset
+        month_starts.append(date(month_index // 12, month_index % 12 + 1, 1))
+    
+    result = refresh_overdue_payments(month_starts)
+    print(f"\n⏰ المتأخرات ({', '.join(result['months'])}): {result['overdue']} مستحق")
+    print(f"  جديدة: {result['created']} | محدثة: {result['updated']} | أعيد فتحها: {result['reopened']} | محصلة: {result['collected']}")
+    print(f"  إجمالي المستحق: {result['total_amount_due']} ريال")
+    return result
+
+def explain_query_plans():
+    """عرض مخططات تنفيذ الاستعلامات الساخنة والتحقق من استخدام الفهارس"""
+    print(f"\n🔍 مخططات تنفيذ الاستعلامات:")
+    all_ok = True
+    for check in check_query_plans():
+        status = '✅' if check['uses_index'] else '❌'
+        all_ok = all_ok and check['uses_index']
+        print(f"  {status} {check['query']} ({check['expected_index']})")
+        for line in check['plan']:
+            print(f"      {line}")
+    return all_ok
+
 def add_sample_students():
     """إضافة طالبات تجريبية"""
     app = create_app()
@@ -144,6 +233,568 @@ def test_bed_management():
                 if new_bed:
                     print(f"السرير الجديد: {new_bed.bed_code}")
 
+def benchmark_import_reads(rows=20000):
+    """قياس استعلامات لوحة التحكم أثناء استيراد ملف مدفوعات: دون إعدادات SQLite ثم مع ملف الأداء
+    
+    كل تشغيل في قاعدة مؤقتة جديدة: الاستيراد في خيط، والقراءة في الخيط الرئيسي حتى ينتهي.
+    """
+    import shutil
+    import tempfile
+    import threading
+    import time
+    import pandas as pd
+    from sqlalchemy import func
+    from models.core import Payment
+    from models.student_names import student_names
+    from routes.dashboard_advanced import process_payments_excel
+    
+    students = 200
+    current_month = date.today().strftime('%Y-%m')
+    payments = pd.DataFrame({
+        'student_name': [f'طالبة تجريبية {i % students}' for i in range(rows)],
+        'amount': 55,
+        'payment_date': [date(2025, 1 + i % 12, 1 + i % 28).isoformat() for i in range(rows)]
+    })
+    
+    profiles = [
+        ('دون إعدادات (rollback journal)', {name: None for name in DEFAULT_SQLITE_PRAGMAS}),
+        ('WAL + PRAGMA', {})
+    ]
+    
+    print(f"\n⏱️ القراءة أثناء استيراد {rows} دفعة:")
+    for label, pragmas in profiles:
+        directory = tempfile.mkdtemp()
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'benchmark.db'),
+            'SQLITE_PRAGMAS': pragmas,
+            'SLOW_QUERY_THRESHOLD_MS': 0
+        })
+        with app.app_context():
+            db.create_all()
+            setup_initial_data()
+            db.session.execute(db.insert(Student), [
+                {'name': f'طالبة تجريبية {i}', 'phone': f'05{i:08d}', 'status': 'active'} for i in range(students)
+            ])
+            db.session.commit()
+            student_names.invalidate()
+            journal_mode = read_pragmas(db.session.connection(), ['journal_mode'])['journal_mode']
+            db.session.commit()
+        
+        result = {}
+        def run_import():
+            with app.app_context():
+                started = time.perf_counter()
+                result.update(process_payments_excel(payments))
+                result['seconds'] = time.perf_counter() - started
+        
+        writer = threading.Thread(target=run_import)
+        latencies = []
+        failures = 0
+        with app.app_context():
+            writer.start()
+            while writer.is_alive():
+                started = time.perf_counter()
+                try:
+                    db.session.execute(
+                        db.select(Payment.payment_type, func.sum(Payment.amount)).where(
+                            Payment.month_year == current_month, Payment.status == 'confirmed'
+                        ).group_by(Payment.payment_type)
+                    ).all()
+                    db.session.execute(db.select(func.count(Bed.id)).where(Bed.status == 'occupied')).scalar()
+                    db.session.commit()
+                    latencies.append(time.perf_counter() - started)
+                except Exception:
+                    db.session.rollback()
+                    failures += 1
+            writer.join()
+            db.session.remove()
+            db.engine.dispose()
+        shutil.rmtree(directory, ignore_errors=True)
+        
+        latencies.sort()
+        elapsed = result.get('seconds') or 0
+        print(f"  {label} [journal_mode={journal_mode}]:")
+        print(f"    الاستيراد: {result.get('processed', 0)} دفعة في {elapsed:.2f} ث")
+        if latencies:
+            print(f"    القراءة: {len(latencies)} ({len(latencies) / max(elapsed, 1e-9):.0f}/ث) | "
+                  f"p50 {latencies[len(latencies) // 2] * 1000:.1f}ms | "
+                  f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms | "
+                  f"أقصى {latencies[-1] * 1000:.1f}ms | فشل {failures}")
+        else:
+            print(f"    القراءة: لم تكتمل أي قراءة أثناء الاستيراد | فشل {failures}")
+
+# أحجام البيانات الاصطناعية (--scale): السكان = كل من سكنت خلال السنوات، والحاليات حتى OCCUPANCY من الأسرة
+SYNTHETIC_SCALES = {
+    'small': {'buildings': 2, 'rooms': 13, 'beds_per_room': 2, 'residents': 120, 'years': 1},
+    'medium': {'buildings': 6, 'rooms': 20, 'beds_per_room': 3, 'residents': 1500, 'years': 3},
+    'large': {'buildings': 20, 'rooms': 30, 'beds_per_room': 4, 'residents': 12000, 'years': 5}
+}
+SYNTHETIC_SEED = 2025
+SYNTHETIC_OCCUPANCY = 0.85
+SYNTHETIC_CHUNK_SIZE = 5000
+
+FIRST_NAMES = ['فاطمة', 'عائشة', 'مريم', 'نورة', 'سارة', 'هند', 'ريم', 'لمى', 'جود', 'رهف',
+               'أمل', 'دانة', 'شهد', 'غادة', 'منى', 'هيفاء', 'بشرى', 'ليان', 'روان', 'أسماء']
+FAMILY_NAMES = ['أحمد', 'محمد', 'علي', 'سالم', 'خالد', 'حسن', 'سعد', 'عبدالله', 'القحطاني', 'الزهراني',
+                'العتيبي', 'الشهري', 'الغامدي', 'الحربي', 'المطيري', 'الدوسري']
+UNIVERSITIES = ['جامعة الملك سعود', 'جامعة الأميرة نورة', 'جامعة الإمام', None]
+EXPENSE_CATEGORIES = ['maintenance', 'utilities', 'supplies', 'other']
+
+def month_start_offset(month_start, count):
+    """أول يوم في الشهر بعد إزاحة عدد من الأشهر"""
+    month_index = month_start.year * 12 + month_start.month - 1 + count
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def insert_rows(model, rows, returning=None):
+    """إدراج مجمع (executemany) على دفعات؛ returning يعيد عموداً بترتيب الصفوف"""
+    values = []
+    for start in range(0, len(rows), SYNTHETIC_CHUNK_SIZE):
+        chunk = rows[start:start + SYNTHETIC_CHUNK_SIZE]
+        if returning is None:
+            db.session.execute(db.insert(model), chunk)
+        else:
+            statement = db.insert(model).returning(returning, sort_by_parameter_order=True)
+            values.extend(db.session.execute(statement, chunk).scalars())
+    return values
+
+def generate_synthetic_data(buildings=2, rooms=13, beds_per_room=2, residents=120, years=1,
+                            seed=SYNTHETIC_SEED, today=None):
+    """بيانات اصطناعية حتمية (نفس seed = نفس البيانات) بحجم واقعي لقياس الأداء
+    
+    مبانٍ وغرف وأسرة عبر provision_layout، ثم ساكنات على مدى years سنة: الحاليات على أسرة
+    مشغولة بتسكين نشط، والمغادرات بتسكين مكتمل وسجل أرشيف برصيدهن النهائي، مع إيجار شهري
+    (بعض الأشهر غير مدفوعة) وتأمين لكل ساكنة ومصروفات شهرية لكل مبنى. الإدراج دفعات مجمعة
+    ثم تُحسب العدادات وفهارس البحث مرة واحدة. يعيد عدد الصفوف في كل جدول.
+    """
+    import random
+    from collections import namedtuple
+    from models.core import Archive, BedAssignment, Expense, Payment
+    from models.events import mark_changed
+    from routes.archive_system import build_final_balance
+    
+    rng = random.Random(seed)
+    today = today or date.today()
+    current_month = today.replace(day=1)
+    first_month = month_start_offset(current_month, -12 * years + 1)
+    history_days = (today - first_month).days
+    
+    # المباني والغرف والأسرة
+    spec = [
+        {
+            'building_code': f'S{number}',
+            'building_name': f'مبنى S{number}',
+            'rooms': rooms,
+            'beds_per_room': beds_per_room,
+            'price_per_bed': rng.choice([50.0, 55.0, 60.0, 70.0])
+        }
+        for number in range(1, buildings + 1)
+    ]
+    provision_layout(spec, reconcile=False)
+    codes = [building['building_code'] for building in spec]
+    beds = db.session.execute(
+        db.select(Bed.id, Bed.room_id, Bed.building_id, Bed.bed_code, Bed.price)
+        .join(Building, Building.id == Bed.building_id)
+        .where(Building.building_code.in_(codes)).order_by(Bed.id)
+    ).all()
+    building_ids = sorted({bed.building_id for bed in beds})
+    
+    # الساكنات: الحاليات أولاً على أسرة مختلفة، ثم المغادرات على أسرة عشوائية في الماضي
+    current_count = min(residents, int(len(beds) * SYNTHETIC_OCCUPANCY))
+    current_beds = rng.sample(beds, current_count)
+    stays = []
+    for index in range(residents):
+        if index < current_count:
+            bed = current_beds[index]
+            start = first_month + timedelta(days=rng.randrange(history_days))
+            end = None
+        else:
+            bed = rng.choice(beds)
+            start = first_month + timedelta(days=rng.randrange(max(1, history_days - 60)))
+            end = min(start + timedelta(days=rng.randrange(30, 400)), today - timedelta(days=1))
+        stays.append((bed, start, end))
+    
+    students = []
+    for index, (bed, start, end) in enumerate(stays):
+        students.append({
+            'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(FAMILY_NAMES)} {rng.choice(FAMILY_NAMES)}',
+            'phone': f'05{index:08d}',
+            'national_id': f'1{index:09d}',
+            'guardian_phone': f'05{residents + index:08d}',
+            'university': rng.choice(UNIVERSITIES),
+            'category': 'student' if rng.random() < 0.8 else 'employee',
+            'contract_start': start,
+            'contract_end': end,
+            'rent_amount': bed.price,
+            'security_deposit': 100.0,
+            'deposit_status': 'returned' if end else 'paid',
+            'status': 'archived' if end else 'active'
+        })
+    student_ids = insert_rows(Student, students, returning=Student.id)
+    
+    assignments = []
+    payments = []
+    archives = []
+    BalanceRow = namedtuple('BalanceRow', [
+        'contract_start', 'rent_amount', 'security_deposit', 'total_payments',
+        'rent_payments', 'deposit_payments', 'first_rent_date'
+    ])
+    for student_id, student, (bed, start, end) in zip(student_ids, students, stays):
+        assignments.append({
+            'student_id': student_id, 'bed_id': bed.id, 'room_id': bed.room_id,
+            'start_date': start, 'end_date': end, 'status': 'completed' if end else 'active'
+        })
+        
+        # التأمين عند السكن ثم إيجار كل شهر حتى المغادرة (نحو 8% من الأشهر دون دفع)
+        payments.append({
+            'student_id': student_id, 'amount': 100.0, 'payment_type': 'deposit', 'payment_date': start,
+            'month_year': start.strftime('%Y-%m'), 'payment_method': 'cash', 'status': 'confirmed'
+        })
+        rent_paid = 0.0
+        month = start.replace(day=1)
+        last_month = (end or today).replace(day=1)
+        while month <= last_month:
+            if rng.random() >= 0.08:
+                paid_on = min(month + timedelta(days=rng.randrange(28)), today)
+                status = 'pending' if rng.random() < 0.03 else 'confirmed'
+                payments.append({
+                    'student_id': student_id, 'amount': bed.price, 'payment_type': 'rent',
+                    'payment_date': paid_on, 'month_year': month.strftime('%Y-%m'),
+                    'payment_method': rng.choice(['cash', 'transfer', 'card']), 'status': status
+                })
+                if status == 'confirmed':
+                    rent_paid += bed.price
+            month = month_start_offset(month, 1)
+        
+        if end:
+            balance = build_final_balance(BalanceRow(
+                start, bed.price, 100.0, rent_paid + 100.0, rent_paid, 100.0, None
+            ), end)
+            archives.append({
+                'student_id': student_id, 'student_name': student['name'], 'phone': student['phone'],
+                'national_id': student['national_id'], 'bed_code': bed.bed_code, 'departure_date': end,
+                'total_paid': balance['total_payments'], 'total_due': balance['total_rent_due'],
+                'final_balance': balance['final_balance'], 'security_deposit': 100.0,
+                'deposit_returned': balance['refund_amount'] > 0,
+                'reason_for_leaving': rng.choice(['تخرج', 'انتقال', 'نهاية العقد']),
+                'refund_amount': balance['refund_amount'], 'archived_by': 'synthetic',
+                'archived_at': datetime.combine(end, datetime.min.time())
+            })
+    
+    expenses = []
+    for offset in range(12 * years):
+        month = month_start_offset(first_month, offset)
+        for building_id in building_ids:
+            for _ in range(rng.randint(1, 4)):
+                expenses.append({
+                    'description': f'مصروف {month.strftime("%Y-%m")}',
+                    'amount': round(rng.uniform(20, 800), 2),
+                    'category': rng.choice(EXPENSE_CATEGORIES),
+                    'expense_date': min(month + timedelta(days=rng.randrange(28)), today),
+                    'building_id': building_id,
+                    'receipt_number': f'R{len(expenses):07d}'
+                })
+    
+    insert_rows(BedAssignment, assignments)
+    insert_rows(Payment, payments)
+    insert_rows(Expense, expenses)
+    insert_rows(Archive, archives)
+    db.session.execute(db.update(Bed), [{'id': bed.id, 'status': 'occupied'} for bed in current_beds])
+    
+    # الإدراج المجمع لا يمر بأحداث الـ ORM: الذاكرات والعدادات والفهارس تُحدَّث مرة واحدة
+    for model in (Student, BedAssignment, Payment, Expense, Archive, Bed):
+        mark_changed(db.session, model)
+    db.session.commit()
+    reconcile_occupancy_counters(repair=True)
+    rebuild_search_indexes()
+    
+    return {
+        'buildings': buildings,
+        'rooms': buildings * rooms,
+        'beds': len(beds),
+        'students': len(students),
+        'active_students': current_count,
+        'assignments': len(assignments),
+        'payments': len(payments),
+        'expenses': len(expenses),
+        'archives': len(archives)
+    }
+
+def generate_synthetic_database(path, scale='small', seed=SYNTHETIC_SEED):
+    """إنشاء قاعدة SQLite جديدة بالبيانات الاصطناعية (لا تُكتب فوق قاعدة موجودة)"""
+    if os.path.exists(path):
+        print(f"❌ الملف {path} موجود مسبقاً؛ البيانات الاصطناعية تُنشأ في قاعدة جديدة فقط")
+        return None
+    
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(path)})
+    with app.app_context():
+        db.create_all()
+        counts = generate_synthetic_data(seed=seed, **SYNTHETIC_SCALES[scale])
+        db.session.remove()
+        db.engine.dispose()
+    print(f"🧪 بيانات اصطناعية ({scale}، seed={seed}) في {path}:")
+    for key, count in counts.items():
+        print(f"  {key}: {count}")
+    return counts
+
+# نقاط النهاية المقاسة: (الاسم، الطريقة، المسار، جسم JSON)
+BENCHMARK_REQUESTS = [
+    ('dashboard_stats', 'GET', '/api/dashboard/stats?refresh=1', None),
+    ('dashboard_stats_cached', 'GET', '/api/dashboard/stats', None),
+    ('beds_available', 'GET', '/api/dashboard/beds/available', None),
+    ('beds_available_filtered', 'GET', '/api/dashboard/beds/available?building=S1&min_free=2', None),
+    ('cache_stats', 'GET', '/api/dashboard/cache/stats', None),
+    ('export_students_xlsx', 'GET', '/api/dashboard/export/students', None),
+    ('export_students_csv', 'GET', '/api/dashboard/export/students?format=csv', None),
+    ('export_payments_csv', 'GET', '/api/dashboard/export/payments?format=csv', None),
+    ('export_expenses_csv', 'GET', '/api/dashboard/export/expenses?format=csv', None),
+    ('export_beds_xlsx', 'GET', '/api/dashboard/export/beds', None),
+    ('archive_list', 'GET', '/api/archive/list', None),
+    ('archive_list_cursor', 'GET', '/api/archive/list?limit=50', None),
+    ('archive_search', 'GET', '/api/archive/list?search=فاطمة', None),
+    ('balances_preview', 'GET', '/api/archive/balances/preview', None),
+    ('search', 'GET', '/api/search?q=سارة أحمد', None),
+    ('financial_summary', 'GET', '/api/reports/financial_summary', None),
+    ('overdue_report', 'GET', '/api/reports/overdue?months=3', None),
+    ('overdue_refresh', 'POST', '/api/reports/overdue/refresh', {'months': 3}),
+    ('occupancy_history', 'GET', '/api/reports/occupancy_history?months=12', None),
+    ('chat_statistics', 'POST', '/api/ai_agent_enhanced', {'message': 'إحصائيات'}),
+    ('chat_rooms', 'POST', '/api/ai_agent_enhanced', {'message': 'اعرض الغرف'}),
+    ('chat_students', 'POST', '/api/ai_agent_enhanced', {'message': 'اعرض الطالبات'}),
+    ('chat_building', 'POST', '/api/ai_agent_enhanced', {'message': 'مبنى S1'}),
+    ('chat_payment', 'POST', '/api/ai_agent_enhanced', {'message': 'فاطمة دفعت 55'})
+]
+BENCHMARK_IMPORT_ROWS = 2000
+
+def run_benchmark_suite(report_path=None, scale='small', seed=SYNTHETIC_SEED, repeat=3):
+    """قياس كل نقاط النهاية والدوال الأساسية على بيانات اصطناعية وكتابة تقرير JSON قابل للمقارنة
+    
+    قاعدة مؤقتة جديدة بحجم scale، ثم كل حالة تُنفذ repeat مرة: الطلبات عبر test client
+    (الردود المتدفقة تُقرأ كاملة) والدوال داخل سياق التطبيق. لكل حالة زمن أول تنفيذ (بارد)
+    والوسيط والأدنى والأقصى وعدد استعلامات SQL في آخر تنفيذ. الحالات التي تكتب
+    (الاستيراد، الأرشفة، إضافة سرير) في النهاية حتى لا تغير قياس القراءة.
+    """
+    import io
+    import json
+    import platform
+    import shutil
+    import sqlite3
+    import statistics
+    import tempfile
+    import time
+    import pandas as pd
+    import sqlalchemy
+    from sqlalchemy import event
+    from models.core import (
+        Archive, get_building_statistics, get_dashboard_statistics, get_system_statistics
+    )
+    from models.overdue import find_overdue
+    from models.student_names import student_names
+    from routes.ai_agent_enhanced import ai_agent_enhanced_bp
+    from routes.archive_system import (
+        archive_system_bp, build_month_range, calculate_occupancy_history,
+        calculate_students_final_balances
+    )
+    from routes.dashboard_advanced import (
+        dashboard_advanced_bp, export_payments_data, export_students_data,
+        process_expenses_excel, process_payments_excel, process_students_excel
+    )
+    
+    directory = tempfile.mkdtemp()
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'benchmark.db'),
+        'SLOW_QUERY_THRESHOLD_MS': 0,
+        'TESTING': True
+    })
+    for blueprint in (dashboard_advanced_bp, archive_system_bp, ai_agent_enhanced_bp):
+        app.register_blueprint(blueprint, url_prefix='/api')
+    
+    statements = {'count': 0}
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements['count'] += 1
+    
+    cases = []
+    def measure(name, kind, run):
+        """تنفيذ حالة repeat مرة وتسجيل أزمنتها (run يعيد (الحالة، الحجم) أو None)"""
+        timings = []
+        status = size = error = None
+        for _ in range(repeat):
+            statements['count'] = 0
+            started = time.perf_counter()
+            try:
+                status, size = run()
+            except Exception as e:
+                status, size, error = 'error', None, str(e)
+                db.session.rollback()
+            timings.append((time.perf_counter() - started) * 1000)
+            db.session.remove()
+        cases.append({
+            'name': name,
+            'kind': kind,
+            'runs': repeat,
+            'first_ms': round(timings[0], 2),
+            'median_ms': round(statistics.median(timings), 2),
+            'min_ms': round(min(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'sql_statements': statements['count'],
+            'status': status,
+            'size': size,
+            'error': error
+        })
+        print(f"  {name:<34} {cases[-1]['median_ms']:>10.2f}ms  SQL {statements['count']:>5}  {error or status}")
+    
+    def request_case(client, method, path, body):
+        def run():
+            response = client.open(path, method=method, json=body)
+            size = len(response.get_data())
+            return response.status_code, size
+        return run
+    
+    def function_case(function, *args):
+        def run():
+            # دوال التصدير تعيد ردوداً متدفقة تحتاج سياق طلب؛ الزمن يشمل توليد الملف كاملاً
+            with app.test_request_context():
+                result = function(*args)
+                if hasattr(result, 'response'):
+                    return 'ok', sum(len(chunk) for chunk in result.response)
+            return 'ok', len(result) if hasattr(result, '__len__') else None
+        return run
+    
+    def import_case(process, frame):
+        def run():
+            result = process(frame)
+            return ('ok' if result.get('success') else 'error'), result.get('processed')
+        return run
+    
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        dataset = generate_synthetic_data(seed=seed, **SYNTHETIC_SCALES[scale])
+        generate_seconds = time.perf_counter() - started
+        student_names.invalidate()
+        print(f"\n⏱️ مقياس {scale} (seed={seed}): {dataset} في {generate_seconds:.1f} ث")
+        
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['logged_in'] = True
+        
+        for name, method, path, body in BENCHMARK_REQUESTS:
+            measure(name, 'endpoint', request_case(client, method, path, body))
+        
+        month_starts = build_month_range(12)
+        current_month = build_month_range(1)
+        for name, run in (
+            ('get_system_statistics', function_case(get_system_statistics)),
+            ('get_building_statistics', function_case(get_building_statistics)),
+            ('get_dashboard_statistics', function_case(get_dashboard_statistics)),
+            ('calculate_students_final_balances', function_case(calculate_students_final_balances)),
+            ('find_overdue', function_case(find_overdue, current_month)),
+            ('calculate_occupancy_history', function_case(calculate_occupancy_history, month_starts)),
+            ('export_students_data', function_case(export_students_data, 'csv')),
+            ('export_payments_data', function_case(export_payments_data, 'csv')),
+            ('reconcile_occupancy_counters', function_case(reconcile_occupancy_counters, False)),
+            ('student_names_rebuild', function_case(student_names.rebuild))
+        ):
+            measure(name, 'function', run)
+        
+        # الحالات التي تكتب: الاستيراد بأسماء موجودة، ثم الأرشفة وإدارة الأسرة عبر المسارات
+        names = [name for name, in db.session.execute(db.select(Student.name).limit(200))]
+        today = date.today().isoformat()
+        rows = BENCHMARK_IMPORT_ROWS
+        imports = (
+            ('import_payments', process_payments_excel, pd.DataFrame({
+                'student_name': [names[i % len(names)] for i in range(rows)],
+                'amount': 55, 'payment_date': today
+            })),
+            ('import_students', process_students_excel, pd.DataFrame({
+                'name': [f'مستوردة {i}' for i in range(rows)],
+                'phone': [f'07{i:08d}' for i in range(rows)], 'contract_start': today
+            })),
+            ('import_expenses', process_expenses_excel, pd.DataFrame({
+                'description': ['مصروف مستورد'] * rows, 'amount': 30,
+                'category': 'other', 'expense_date': today
+            }))
+        )
+        for name, process, frame in imports:
+            measure(name, 'import', import_case(process, frame))
+        
+        csv_file = io.BytesIO()
+        imports[0][2].to_csv(csv_file, index=False)
+        def upload():
+            response = client.post('/api/dashboard/upload_excel', data={
+                'file': (io.BytesIO(csv_file.getvalue()), 'payments.csv'), 'file_type': 'payments'
+            }, content_type='multipart/form-data')
+            return response.status_code, len(response.get_data())
+        measure('upload_payments_csv', 'endpoint', upload)
+        
+        active_ids = iter(db.session.execute(
+            db.select(Student.id).where(Student.status == 'active').order_by(Student.id)
+        ).scalars().all())
+        measure('archive_student', 'endpoint', lambda: request_case(
+            client, 'POST', '/api/archive/student', {'student_id': next(active_ids), 'departure_reason': 'تخرج'}
+        )())
+        archive_ids = iter(db.session.execute(
+            db.select(Archive.id).where(Archive.archived_by == 'admin').order_by(Archive.id)
+        ).scalars().all())
+        measure('restore_student', 'endpoint', lambda: request_case(
+            client, 'POST', f'/api/archive/restore/{next(archive_ids)}', None
+        )())
+        room_id = db.session.execute(db.select(Room.id).order_by(Room.id)).scalars().first()
+        measure('bed_management_add', 'endpoint', request_case(
+            client, 'POST', '/api/dashboard/bed_management', {'action': 'add', 'room_id': room_id}
+        ))
+        
+        event.remove(db.engine, 'before_cursor_execute', count_statement)
+        db.session.remove()
+        db.engine.dispose()
+    shutil.rmtree(directory, ignore_errors=True)
+    
+    report = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'scale': dict(SYNTHETIC_SCALES[scale], name=scale),
+        'seed': seed,
+        'repeat': repeat,
+        'dataset': dataset,
+        'generate_seconds': round(generate_seconds, 2),
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'sqlalchemy': sqlalchemy.__version__,
+            'platform': platform.platform()
+        },
+        'cases': cases
+    }
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, ensure_ascii=False, indent=2)
+        print(f"📄 التقرير: {report_path}")
+    return report
+
+def compare_benchmark_reports(baseline, report, threshold=1.2):
+    """مقارنة تقريرين بالوسيط لكل حالة: الحالات الأبطأ أو الأسرع من threshold وتغير عدد الاستعلامات"""
+    previous = {case['name']: case for case in baseline['cases']}
+    changes = []
+    for case in report['cases']:
+        old = previous.get(case['name'])
+        if old is None:
+            continue
+        ratio = case['median_ms'] / old['median_ms'] if old['median_ms'] else None
+        if (ratio and (ratio >= threshold or ratio <= 1 / threshold)) or case['sql_statements'] != old['sql_statements']:
+            changes.append({
+                'name': case['name'],
+                'median_ms': (old['median_ms'], case['median_ms']),
+                'ratio': round(ratio, 2) if ratio else None,
+                'sql_statements': (old['sql_statements'], case['sql_statements'])
+            })
+    
+    if baseline.get('scale') != report.get('scale') or baseline.get('seed') != report.get('seed'):
+        print("⚠️ التقريران بمقياس أو seed مختلف؛ المقارنة تقريبية")
+    print(f"\n📊 المقارنة ({len(changes)} حالة تغيرت):")
+    for change in changes:
+        print(f"  {change['name']:<34} {change['median_ms'][0]:>10.2f} → {change['median_ms'][1]:>10.2f}ms "
+              f"(×{change['ratio']})  SQL {change['sql_statements'][0]} → {change['sql_statements'][1]}")
+    return changes
+
 if __name__ == '__main__':
     import argparse
     
@@ -151,6 +802,24 @@ if __name__ == '__main__':
     parser.add_argument('--setup', action='store_true', help='إعداد قاعدة البيانات')
     parser.add_argument('--students', action='store_true', help='إضافة طالبات تجريبية')
     parser.add_argument('--test', action='store_true', help='اختبار إدارة الأسرة')
+    parser.add_argument('--upgrade', action='store_true', help='ترقية قاعدة بيانات موجودة (أعمدة وفهارس) والتحقق من مخططات الاستعلامات')
+    parser.add_argument('--reconcile', action='store_true', help='إعادة حساب عدادات الإشغال وإصلاح الانحراف')
+    parser.add_argument('--overdue', nargs='?', const=1, type=int, metavar='MONTHS',
+                        help='تحديث جدول المتأخرات لآخر MONTHS شهر (الحالي افتراضياً) — للتشغيل الليلي')
+    parser.add_argument('--provision', metavar='LAYOUT_JSON',
+                        help='إنشاء أو مطابقة المباني والغرف والأسرة من ملف تخطيط JSON (قائمة مبانٍ)')
+    parser.add_argument('--reindex', action='store_true', help='إعادة بناء فهارس البحث النصي من جداول الطالبات والأرشيف')
+    parser.add_argument('--benchmark', nargs='?', const=20000, type=int, metavar='ROWS',
+                        help='قياس سرعة القراءة أثناء استيراد ROWS دفعة مع إعدادات SQLite وبدونها (قواعد مؤقتة)')
+    parser.add_argument('--generate', metavar='DB_PATH',
+                        help='إنشاء قاعدة SQLite جديدة ببيانات اصطناعية حتمية بحجم --scale')
+    parser.add_argument('--bench-report', metavar='REPORT_JSON',
+                        help='قياس كل نقاط النهاية والدوال الأساسية على بيانات اصطناعية وكتابة تقرير JSON')
+    parser.add_argument('--scale', choices=sorted(SYNTHETIC_SCALES), default='small',
+                        help='حجم البيانات الاصطناعية لـ --generate و --bench-report')
+    parser.add_argument('--seed', type=int, default=SYNTHETIC_SEED, help='بذرة البيانات الاصطناعية')
+    parser.add_argument('--repeat', type=int, default=3, help='عدد مرات تنفيذ كل حالة في --bench-report')
+    parser.add_argument('--compare', metavar='BASELINE_JSON', help='مقارنة تقرير --bench-report بتقرير سابق')
     parser.add_argument('--all', action='store_true', help='تنفيذ جميع العمليات')
     
     args = parser.parse_args()
@@ -164,7 +833,44 @@ if __name__ == '__main__':
     if args.all or args.test:
         test_bed_management()
     
-    if not any(vars(args).values()):
+    if args.upgrade:
+        upgrade_existing_database()
+    
+    if args.reconcile:
+        app = create_app()
+        with app.app_context():
+            reconcile_counters()
+    
+    if args.provision:
+        provision_from_file(args.provision)
+    
+    if args.overdue:
+        app = create_app()
+        with app.app_context():
+            refresh_overdue(args.overdue)
+    
+    if args.reindex:
+        app = create_app()
+        with app.app_context():
+            rebuild_search_indexes()
+            print("🔎 تمت إعادة بناء فهارس البحث")
+    
+    if args.benchmark:
+        benchmark_import_reads(args.benchmark)
+    
+    if args.generate:
+        generate_synthetic_database(args.generate, args.scale, args.seed)
+    
+    if args.bench_report:
+        report = run_benchmark_suite(args.bench_report, args.scale, args.seed, args.repeat)
+        if args.compare:
+            import json
+            with open(args.compare, encoding='utf-8') as baseline_file:
+                compare_benchmark_reports(json.load(baseline_file), report)
+    
+    # خيارات المقاييس لها قيم افتراضية؛ رسالة المساعدة عند عدم طلب أي عملية
+    options = ('scale', 'seed', 'repeat', 'compare')
+    if not any(value for name, value in vars(args).items() if name not in options):
         print("استخدم --help لعرض الخيارات المتاحة")
         print("أو استخدم --all لتنفيذ جميع العمليات")
 
@@ -0,0 +1,77 @@
+"""
+تطبيع النص العربي لرسائل الوكيل: توحيد الألف والهمزات والتاء المربوطة والياء، حذف التشكيل
+والتطويل، وتحويل الأرقام العربية الهندية — بجدول ترجمة واحد محسوب مسبقاً وذاكرة LRU
+"""
+
+from functools import lru_cache
+
+# محارف تُحذف: التشكيل (فتحتان .. سكون)، الألف الخنجرية، التطويل
+REMOVED_CHARACTERS = (
+    [chr(code) for code in range(0x064B, 0x0653)]
+    + ['ٰ', 'ـ']
+)
+
+FOLDED_CHARACTERS = {
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي',
+    'ؤ': 'و',
+    'ة': 'ه',
+}
+
+def build_translation_table():
+    """جدول الترجمة: كل محرف يتحول لمحرف واحد أو يُحذف (حتى يمكن تتبع المواضع)"""
+    table = {ord(char): None for char in REMOVED_CHARACTERS}
+    table.update({ord(char): folded for char, folded in FOLDED_CHARACTERS.items()})
+    # الأرقام العربية الهندية والفارسية
+    for digit in range(10):
+        table[0x0660 + digit] = str(digit)
+        table[0x06F0 + digit] = str(digit)
+    table[ord('،')] = ','
+    # الحروف اللاتينية الكبيرة (رموز الأسرة K6011) بدلاً من lower() على النص كله
+    for code in range(ord('A'), ord('Z') + 1):
+        table[code] = chr(code + 32)
+    return table
+
+ARABIC_TRANSLATION = build_translation_table()
+REMOVED_SET = frozenset(REMOVED_CHARACTERS)
+
+@lru_cache(maxsize=4096)
+def normalize_arabic(text):
+    """النص بعد التطبيع (للكلمات المفتاحية والمقارنات)"""
+    return text.translate(ARABIC_TRANSLATION)
+
+class NormalizedMessage:
+    """رسالة مطبعة مع إمكانية استرجاع النص الأصلي لأي جزء مطابق فيها
+
+    التعبيرات المنتظمة تعمل على text المطبع، أما الأسماء والأوصاف فتُؤخذ من النص الأصلي
+    بنفس المواضع حتى تُحفظ كما كتبها المستخدم.
+    """
+
+    __slots__ = ('original', 'text', '_offsets')
+
+    def __init__(self, original):
+        self.original = original
+        self.text = normalize_arabic(original)
+        # عند عدم حذف أي محرف تتطابق المواضع فلا حاجة لجدول
+        self._offsets = None
+        if len(self.text) != len(original):
+            self._offsets = [i for i, char in enumerate(original) if char not in REMOVED_SET]
+
+    def original_span(self, start, end):
+        """النص الأصلي المقابل للمدى [start, end) في النص المطبع"""
+        if self._offsets is None:
+            return self.original[start:end]
+        if end <= start:
+            return ''
+        return self.original[self._offsets[start]:self._offsets[end - 1] + 1]
+
+    def original_group(self, match, group=1):
+        """النص الأصلي لمجموعة في نتيجة مطابقة على النص المطبع"""
+        if match.group(group) is None:
+            return None
+        return self.original_span(match.start(group), match.end(group))
+
+@lru_cache(maxsize=1024)
+def normalize_message(message):
+    """تطبيع رسالة مرة واحدة (الرسائل المتكررة من الذاكرة)"""
+    return NormalizedMessage(message)
@@ -0,0 +1,155 @@
+"""
+مطابقة نوايا المحادثة بتعبير منتظم واحد مُجمَّع مسبقاً بدلاً من المرور على كل كلمة مفتاحية
+"""
+
+import re
+
+def trie_pattern(words):
+    """تعبير منتظم على شكل شجرة بادئات: تفرع بحرف واحد في كل مستوى بدل تجربة كل كلمة في كل موضع"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def emit(node):
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # نهاية كلمة مع إمكانية الاستمرار: الجزء الباقي اختياري (جشع، فالأطول أولاً)
+        return '(?:' + body + ')?' if '' in node else body
+
+    return emit(trie)
+
+class IntentMatcher:
+    """مطابق نوايا بأولويات
+
+    intents قائمة مرتبة حسب الأولوية من (النية، الكلمات المفتاحية). الكلمات إما قائمة واحدة
+    (تكفي أي كلمة منها) أو قائمة مجموعات يجب أن تظهر كلمة من كل مجموعة فيها.
+    كل الكلمات في تعبير واحد على شكل شجرة بادئات داخل lookahead، فيُفحص كل موضع في الرسالة
+    بمرور واحد دون أن تحجب مطابقةٌ مطابقةً متداخلة معها. المطابقة الأطول في كل موضع تشمل
+    الكلمات الأقصر الواقعة داخلها (محسوبة مسبقاً).
+    """
+
+    def __init__(self, intents, normalize=str.lower):
+        self.normalize = normalize
+        self.intents = []
+        keywords = set()
+        for intent, groups in intents:
+            if groups and isinstance(groups[0], str):
+                groups = [groups]
+            groups = [frozenset(normalize(keyword) for keyword in group) for group in groups]
+            self.intents.append((intent, groups))
+            for group in groups:
+                keywords.update(group)
+
+        self._pattern = re.compile('(?=(' + trie_pattern(keywords) + '))')
+
+        # الكلمات الموجودة ضمنياً داخل كل كلمة مطابقة
+        self._contained = {
+            keyword: frozenset(other for other in keywords if other in keyword)
+            for keyword in keywords
+        }
+        # مسار سريع حين تكفي كلمة واحدة لكل نية: أعلى أولوية تحققها كل كلمة مطابقة
+        self._single_group = all(len(groups) == 1 for _, groups in self.intents)
+        self._rank = {
+            keyword: min(
+                (priority for priority, (_, groups) in enumerate(self.intents) if groups[0] & contained),
+                default=len(self.intents)
+            )
+            for keyword, contained in self._contained.items()
+        }
+
+    def keywords_in(self, text, normalized=False):
+        """كل الكلمات المفتاحية الموجودة في النص"""
+        if not normalized:
+            text = self.normalize(text)
+        found = set()
+        for keyword in self._pattern.findall(text):
+            found |= self._contained[keyword]
+        return found
+
+    def match_all(self, text, normalized=False):
+        """كل النوايا المطابقة مرتبة حسب الأولوية"""
+        found = self.keywords_in(text, normalized)
+        return [
+            intent for intent, groups in self.intents
+            if all(group & found for group in groups)
+        ]
+
+    def match(self, text, default='general', normalized=False):
+        """النية ذات الأولوية الأعلى"""
+        if self._single_group:
+            if not normalized:
+                text = self.normalize(text)
+            matches = self._pattern.findall(text)
+            if not matches:
+                return default
+            return self.intents[min(map(self._rank.__getitem__, matches))][0]
+
+        matches = self.match_all(text, normalized)
+        return matches[0] if matches else default
+
+def linear_match(message, patterns):
+    """الطريقة السابقة: المرور على كل كلمة لكل نية (للمقارنة في القياس)"""
+    for intent, keywords in patterns.items():
+        for keyword in keywords:
+            if keyword in message:
+                return intent
+    return 'general'
+
+def benchmark(patterns, messages, rounds=20000):
+    """قياس متوسط زمن تحديد النية للطريقتين بالميكروثانية"""
+    import timeit
+
+    matcher = IntentMatcher(list(patterns.items()))
+    messages = [message.lower() for message in messages]
+    for message in messages:
+        assert matcher.match(message, normalized=True) == linear_match(message, patterns), message
+
+    results = {}
+    for name, function in (
+        ('linear', lambda: [linear_match(message, patterns) for message in messages]),
+        ('compiled', lambda: [matcher.match(message, normalized=True) for message in messages])
+    ):
+        seconds = timeit.timeit(function, number=rounds)
+        results[name] = seconds / (rounds * len(messages)) * 1e6
+    return results
+
+if __name__ == '__main__':
+    import os
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from routes.ai_agent_enhanced import INTENT_PATTERNS
+
+    sample_messages = [
+        'اعرض الغرف المتاحة',
+        'فاطمة دفعت 55 ريال',
+        'أضف طالبة سارة في السرير K6011',
+        'مصروف كهرباء 120 ريال',
+        'اعطني ملخص الوضع المالي',
+        'معلومات المبنى K7',
+        'مرحبا، كيف حالك اليوم؟ أريد مساعدة في شيء لا علاقة له بالسكن'
+    ]
+    # جدول موسع بمرادفات إضافية (كلمات عشوائية ثابتة البذرة) لمحاكاة نمو الجدول
+    import random
+    generator = random.Random(0)
+    letters = 'ابتثجحخدذرزسشصضطظعغفقكلمنهوي'
+    tables = [('current', INTENT_PATTERNS)]
+    for extra_intents in (20, 60):
+        extended_patterns = dict(INTENT_PATTERNS)
+        for i in range(extra_intents):
+            extended_patterns[f'synonyms_{i}'] = [
+                ''.join(generator.choice(letters) for _ in range(generator.randint(4, 8)))
+                for _ in range(15)
+            ]
+        tables.append((f'extended +{extra_intents} intents', extended_patterns))
+
+    for name, patterns in tables:
+        keyword_count = sum(len(keywords) for keywords in patterns.values())
+        results = benchmark(patterns, sample_messages)
+        print(f"{name} ({keyword_count} keywords)")
+        print(f"  linear:   {results['linear']:.2f} µs/message")
+        print(f"  compiled: {results['compiled']:.2f} µs/message")
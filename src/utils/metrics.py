@@ -0,0 +1,190 @@
+"""
+قياس كل طلب: عدد استعلامات SQL وزمنها، زمن المعالجة وحجم الرد — ترويسات في وضع التطوير
+ومدرجات تكرارية لكل مسار في /metrics بصيغة Prometheus
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# عدد الاستعلامات الذي يُسجل بعده تحذير (مؤشر N+1)
+DEFAULT_STATEMENT_WARNING = 100
+
+class Histogram:
+    """مدرج تكراري بحدود ثابتة: عدد القيم في كل حد، مجموعها وعددها"""
+
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """إضافة قيمة"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        """(الحد، العدد التراكمي) بما فيها +Inf"""
+        running = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            running += count
+            yield bound, running
+
+METRICS = {
+    'http_request_duration_seconds': ('زمن معالجة الطلب حتى تجهيز الرد', DURATION_BUCKETS),
+    'http_request_db_seconds': ('الزمن التراكمي لاستعلامات SQL في الطلب', DURATION_BUCKETS),
+    'http_request_sql_statements': ('عدد استعلامات SQL في الطلب', STATEMENT_BUCKETS),
+    'http_response_size_bytes': ('حجم الرد (الردود المتدفقة غير محسوبة)', SIZE_BUCKETS)
+}
+
+def escape_label(value):
+    """ترميز قيمة label حسب صيغة Prometheus"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class RequestMetrics:
+    """قياس الطلبات على مستوى التطبيق (كل الـ blueprints)
+
+    أحداث before/after_cursor_execute على كل المحركات تجمع عدد الاستعلامات وزمنها في flask.g،
+    وبعد كل طلب تُضاف القيم لمدرجات مفتاحها (المسار، الطريقة). في وضع التطوير أو عند
+    تفعيل METRICS_HEADERS تُضاف ترويسات X-SQL-Statements و X-DB-Time-ms و X-Handler-Time-ms.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._requests = {}
+        self._engine_listeners = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """تسجيل أحداث SQL ودورة الطلب ومسار /metrics في التطبيق"""
+        app.config.setdefault('METRICS_HEADERS', False)
+        app.config.setdefault('METRICS_ENDPOINT', '/metrics')
+        app.config.setdefault('METRICS_STATEMENT_WARNING', DEFAULT_STATEMENT_WARNING)
+
+        if not self._engine_listeners:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(Engine, 'handle_error', self._handle_error)
+            self._engine_listeners = True
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule(app.config['METRICS_ENDPOINT'], 'request_metrics', self.metrics_view)
+        app.extensions['request_metrics'] = self
+
+    # أحداث SQL
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('metrics_query_start')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        if has_request_context() and '_request_metrics' in g:
+            metrics = g._request_metrics
+            metrics['statements'] += 1
+            metrics['db_seconds'] += elapsed
+
+    def _handle_error(self, exception_context):
+        # الاستعلام الفاشل لا يمر بـ after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('metrics_query_start'):
+            connection.info['metrics_query_start'].pop()
+
+    # دورة الطلب
+
+    def _start_request(self):
+        """بداية قياس الطلب"""
+        g._request_metrics = {'started': time.perf_counter(), 'statements': 0, 'db_seconds': 0.0}
+
+    def _finish_request(self, response):
+        """تسجيل قياسات الطلب في المدرجات وإضافة الترويسات"""
+        metrics = g.pop('_request_metrics', None)
+        if metrics is None or request.endpoint == 'request_metrics':
+            return response
+
+        handler_seconds = time.perf_counter() - metrics['started']
+        endpoint = request.endpoint or 'unmatched'
+        size = None if response.is_streamed else response.calculate_content_length()
+
+        key = (endpoint, request.method)
+        with self._lock:
+            histograms = self._histograms.get(key)
+            if histograms is None:
+                histograms = self._histograms[key] = {
+                    name: Histogram(buckets) for name, (_, buckets) in METRICS.items()
+                }
+            histograms['http_request_duration_seconds'].observe(handler_seconds)
+            histograms['http_request_db_seconds'].observe(metrics['db_seconds'])
+            histograms['http_request_sql_statements'].observe(metrics['statements'])
+            if size is not None:
+                histograms['http_response_size_bytes'].observe(size)
+            status_key = key + (response.status_code,)
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+
+        if metrics['statements'] >= current_app.config['METRICS_STATEMENT_WARNING']:
+            current_app.logger.warning(
+                '%s %s: %d SQL statements (%.1f ms DB)',
+                request.method, request.path, metrics['statements'], metrics['db_seconds'] * 1000
+            )
+
+        if current_app.debug or current_app.config['METRICS_HEADERS']:
+            response.headers['X-SQL-Statements'] = str(metrics['statements'])
+            response.headers['X-DB-Time-ms'] = f"{metrics['db_seconds'] * 1000:.2f}"
+            response.headers['X-Handler-Time-ms'] = f'{handler_seconds * 1000:.2f}'
+            if size is not None:
+                response.headers['X-Response-Size'] = str(size)
+        return response
+
+    # العرض
+
+    def render(self):
+        """كل المقاييس بصيغة Prometheus النصية"""
+        with self._lock:
+            lines = [
+                '# HELP http_requests_total عدد الطلبات حسب المسار والطريقة والحالة',
+                '# TYPE http_requests_total counter'
+            ]
+            for (endpoint, method, status), count in sorted(self._requests.items()):
+                lines.append(
+                    f'http_requests_total{{endpoint="{escape_label(endpoint)}",method="{method}",status="{status}"}} {count}'
+                )
+
+            for name, (description, _) in METRICS.items():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for (endpoint, method), histograms in sorted(self._histograms.items()):
+                    histogram = histograms[name]
+                    labels = f'endpoint="{escape_label(endpoint)}",method="{method}"'
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.total:.6f}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        """مسار /metrics"""
+        return Response(self.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    def reset(self):
+        """تصفير كل المقاييس"""
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,237 @@
+"""
+فهرس أسماء الطالبات في الذاكرة: كلمات الاسم المطبعة -> المعرفات مع بحث تقريبي بالمقاطع الثلاثية
+"""
+
+import re
+import threading
+import time
+from collections import namedtuple
+from difflib import SequenceMatcher
+
+NameCandidate = namedtuple('NameCandidate', ['student_id', 'name', 'score'])
+
+DEFAULT_MAX_AGE_SECONDS = 600
+MIN_SCORE = 0.75  # أقل تشابه مقبول للمرشح
+MIN_TRIGRAM_OVERLAP = 0.4  # نسبة المقاطع الثلاثية المشتركة لدخول المرشح مرحلة المقارنة
+MAX_FUZZY_CANDIDATES = 50
+
+NON_WORD = re.compile(r'[^\w]+')
+
+def name_tokens(name, normalize=str.lower):
+    """كلمات الاسم بعد التطبيع وحذف علامات الترقيم"""
+    if not name:
+        return ()
+    return tuple(NON_WORD.sub(' ', normalize(str(name))).split())
+
+def trigrams(token):
+    """المقاطع الثلاثية للكلمة مع حدود الكلمة (فالكلمات القصيرة لها مقاطع أيضاً)"""
+    padded = f' {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def token_similarity(query_token, token):
+    """تشابه كلمتين: 1 للتطابق، ثم البادئة، ثم نسبة مسافة التحرير"""
+    if query_token == token:
+        return 1.0
+    if token.startswith(query_token) and len(query_token) >= 3:
+        # كتابة جزء من الاسم (مثل contains السابقة) أقل قليلاً من التطابق
+        return 0.9
+    return SequenceMatcher(None, query_token, token).ratio()
+
+def discard(index, key, student_id):
+    """حذف معرف من قائمة مفتاح وحذف المفتاح إذا فرغت"""
+    ids = index.get(key)
+    if ids is not None:
+        ids.discard(student_id)
+        if not ids:
+            del index[key]
+
+class StudentNameIndex:
+    """فهرس أسماء الطالبات
+
+    لكل اسم كلماته المطبعة (توحيد الهمزات والتاء المربوطة والياء) في قاموس كلمة -> معرفات،
+    ولكل كلمة مقاطعها الثلاثية في قاموس مقطع -> معرفات للأخطاء الإملائية. البحث يجمع
+    المرشحين من القاموسين ثم يرتبهم بتشابه الكلمات، دون أي استعلام. يُبنى عند أول بحث
+    باستعلام واحد ويُحدَّث من تغييرات الطالبات بعد الـ commit؛ الإدراج المجمع أو مرور
+    max_age يؤدي لإعادة البناء.
+    """
+
+    def __init__(self, model, normalize=str.lower, max_age=DEFAULT_MAX_AGE_SECONDS):
+        self.model = model
+        self.normalize = normalize
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._stale = True
+        self._built_at = 0.0
+        self._version = 0
+        self._names = {}
+        self._tokens_of = {}
+        self._full_names = {}
+        self._token_ids = {}
+        self._trigram_ids = {}
+
+    def invalidate(self):
+        """طلب إعادة البناء عند البحث التالي"""
+        with self._lock:
+            self._stale = True
+
+    def rebuild(self):
+        """بناء الفهرس من قاعدة البيانات باستعلام واحد"""
+        version = self._version
+        rows = self.model.query.with_entities(self.model.id, self.model.name).all()
+
+        with self._lock:
+            self._names = {}
+            self._tokens_of = {}
+            self._full_names = {}
+            self._token_ids = {}
+            self._trigram_ids = {}
+            for student_id, name in rows:
+                self._add(student_id, name)
+            self._built_at = time.monotonic()
+            # تغييرات تأكدت أثناء القراءة قد لا تظهر في الصفوف المقروءة
+            self._stale = version != self._version
+
+    def ensure_fresh(self):
+        """إعادة البناء إذا كان الفهرس قديماً"""
+        if self._stale or time.monotonic() - self._built_at > self.max_age:
+            self.rebuild()
+
+    def _add(self, student_id, name):
+        """إضافة اسم للقواميس"""
+        tokens = name_tokens(name, self.normalize)
+        self._names[student_id] = name
+        self._tokens_of[student_id] = tokens
+        self._full_names.setdefault(' '.join(tokens), set()).add(student_id)
+        for token in set(tokens):
+            self._token_ids.setdefault(token, set()).add(student_id)
+            for trigram in trigrams(token):
+                self._trigram_ids.setdefault(trigram, set()).add(student_id)
+
+    def _remove(self, student_id):
+        """حذف اسم من القواميس"""
+        tokens = self._tokens_of.pop(student_id, None)
+        self._names.pop(student_id, None)
+        if tokens is None:
+            return
+        discard(self._full_names, ' '.join(tokens), student_id)
+        for token in set(tokens):
+            discard(self._token_ids, token, student_id)
+            for trigram in trigrams(token):
+                discard(self._trigram_ids, trigram, student_id)
+
+    def apply_changes(self, changes):
+        """تحديث الفهرس من تغييرات الطالبات المؤكدة (مستمع بعد الـ commit)"""
+        with self._lock:
+            self._version += 1
+            if self._stale:
+                return
+            for change in changes:
+                if change.id is None or change.action not in ('insert', 'update', 'delete'):
+                    self._stale = True
+                    return
+                if change.action == 'delete':
+                    self._remove(change.id)
+                elif 'name' in change.values:
+                    self._remove(change.id)
+                    self._add(change.id, change.values['name'])
+
+    def search(self, name, limit=5):
+        """المرشحون مرتبون حسب التشابه (NameCandidate) — التطابق التام للاسم المطبع أولاً"""
+        query_tokens = name_tokens(name, self.normalize)
+        if not query_tokens:
+            return []
+
+        self.ensure_fresh()
+        with self._lock:
+            scores = dict.fromkeys(self._full_names.get(' '.join(query_tokens), ()), 1.0)
+            # الأسماء التي تحتوي كل كلمات البحث لا تحتاج مقارنة تقريبية؛ غيرها فقط عند عدم وجودها
+            token_matches = self._token_matches(query_tokens)
+            candidates = token_matches or self._fuzzy_candidates(query_tokens)
+            for student_id in candidates:
+                if student_id not in scores:
+                    score = self._score(query_tokens, self._tokens_of[student_id], student_id in token_matches)
+                    if score >= MIN_SCORE:
+                        scores[student_id] = score
+
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return [
+                NameCandidate(student_id, self._names[student_id], round(score, 3))
+                for student_id, score in ranked
+            ]
+
+    def _token_matches(self, query_tokens):
+        """المعرفات التي تحتوي أسماؤها كل كلمات البحث (تقاطع القوائم بدءاً بالأقصر)"""
+        postings = sorted((self._token_ids.get(token, set()) for token in set(query_tokens)), key=len)
+        matches = set(postings[0])
+        for ids in postings[1:]:
+            matches &= ids
+        return matches
+
+    def _fuzzy_candidates(self, query_tokens):
+        """المعرفات التي تشترك مع كلمات البحث في نسبة كافية من المقاطع الثلاثية (الأكثر اشتراكاً أولاً)"""
+        overlap = {}
+        query_trigrams = set()
+        for token in query_tokens:
+            query_trigrams |= trigrams(token)
+        for trigram in query_trigrams:
+            for student_id in self._trigram_ids.get(trigram, ()):
+                overlap[student_id] = overlap.get(student_id, 0) + 1
+
+        threshold = max(1, MIN_TRIGRAM_OVERLAP * len(query_trigrams))
+        similar = [student_id for student_id, count in overlap.items() if count >= threshold]
+        if len(similar) > MAX_FUZZY_CANDIDATES:
+            similar = sorted(similar, key=lambda student_id: -overlap[student_id])[:MAX_FUZZY_CANDIDATES]
+        return similar
+
+    def _score(self, query_tokens, tokens, all_tokens_match=False):
+        """متوسط أفضل تشابه لكل كلمة بحث، مع تفضيل الأسماء الأقرب في عدد الكلمات وترتيبها"""
+        if not tokens:
+            return 0.0
+        if all_tokens_match:
+            score = 1.0
+        else:
+            best = [max(token_similarity(query_token, token) for token in tokens) for query_token in query_tokens]
+            score = sum(best) / len(best)
+        # "فاطمة" تطابق "فاطمة" أكثر من "فاطمة أحمد"، والاسم الأول أهم من اسم العائلة
+        score *= 0.95 + 0.05 * min(1.0, len(query_tokens) / len(tokens))
+        if not tokens[0].startswith(query_tokens[0]):
+            score *= 0.97
+        return min(score, 0.999)
+
+    def resolve(self, name, limit=5):
+        """(معرف الطالبة، المرشحون) للكتابة (المدفوعات والاستيراد)
+
+        المعرف فقط عند تطابق تام وحيد للاسم المطبع، أو عند عدم وجوده لاسم وحيد يحتوي كل كلمات
+        البحث. التشابه التقريبي لا يُقبل تلقائياً ("سارة محمد" ليست "سارة أحمد")؛ يُعاد None
+        مع المرشحين ليختار المستخدم.
+        """
+        query_tokens = name_tokens(name, self.normalize)
+        if not query_tokens:
+            return None, []
+
+        candidates = self.search(name, limit)
+        with self._lock:
+            matches = self._full_names.get(' '.join(query_tokens)) or self._token_matches(query_tokens)
+            if len(matches) == 1:
+                return next(iter(matches)), candidates
+        return None, candidates
+
+    def name_key(self, name):
+        """الاسم المطبع الكامل (مفتاح التطابق التام)"""
+        return ' '.join(name_tokens(name, self.normalize))
+
+    def has_exact(self, name):
+        """هل يوجد اسم مطابق بعد التطبيع"""
+        self.ensure_fresh()
+        with self._lock:
+            return self.name_key(name) in self._full_names
+
+    def stats(self):
+        """حجم الفهرس"""
+        with self._lock:
+            return {
+                'students': len(self._names),
+                'tokens': len(self._token_ids),
+                'trigrams': len(self._trigram_ids),
+                'stale': self._stale
+            }
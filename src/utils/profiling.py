@@ -0,0 +1,279 @@
+"""
+تحليل أداء الطلبات عند الطلب (cProfile أو عينات المكدس) وسجل لأبطأ الطلبات بعينات خفيفة دائمة
+"""
+
+import cProfile
+import heapq
+import io
+import itertools
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+from flask import Response, current_app, g, jsonify, request, session
+
+PROFILE_MODES = ('cprofile', 'sample')
+PROFILER_ENDPOINTS = ('profiles_list', 'profiles_download', 'profiles_summary')
+DEFAULT_SAMPLE_INTERVAL = 0.01
+DEFAULT_KEEP_PROFILES = 20
+DEFAULT_SLOWEST = 20
+MAX_STACK_DEPTH = 64
+
+def frame_label(frame):
+    """اسم الإطار في المكدس: الدالة (الملف:السطر)"""
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+def collapsed_stack(frame):
+    """المكدس بصيغة collapsed (الأعلى آخراً) المستخدمة في flamegraph.pl و speedscope"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+def render_collapsed(stacks):
+    """عدادات المكدسات كنص collapsed: سطر لكل مكدس متبوعاً بعدد العينات"""
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+class StackSampler(threading.Thread):
+    """خيط يأخذ عينات من مكدسات خيوط محددة كل فترة ثابتة
+
+    لا يضيف أي كلفة على الخيوط المقاسة نفسها؛ الكلفة في خيط العينات فقط.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._targets = {}
+        self._stop_event = threading.Event()
+
+    def watch(self, thread_id):
+        """بدء جمع العينات لخيط وإرجاع عداد مكدساته"""
+        stacks = Counter()
+        with self._lock:
+            self._targets[thread_id] = stacks
+        return stacks
+
+    def unwatch(self, thread_id):
+        """إيقاف جمع العينات لخيط"""
+        with self._lock:
+            return self._targets.pop(thread_id, None)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            with self._lock:
+                if not self._targets:
+                    continue
+                targets = list(self._targets.items())
+            frames = sys._current_frames()
+            for thread_id, stacks in targets:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[collapsed_stack(frame)] += 1
+
+    def stop(self):
+        self._stop_event.set()
+
+class RequestProfiler:
+    """تحليل أداء الطلبات
+
+    عند تفعيل PROFILING_ENABLED يمكن للمسؤول (جلسة مسجلة الدخول) طلب تحليل أي طلب
+    بمعامل ?_profile=cprofile|sample أو ترويسة X-Profile. نتيجة cProfile بصيغة pstats
+    (snakeviz، pstats)، ونتيجة العينات بصيغة collapsed (flamegraph، speedscope)، وتُحفظ في
+    الذاكرة (وفي PROFILING_DIR إن حُدد) ويُعاد معرفها في ترويسة X-Profile-Id.
+    عند تفعيل PROFILING_SAMPLER تُسجل أبطأ PROFILING_SLOWEST طلبات مع عينات مكدساتها.
+    إذا كان الاثنان معطلين فكلفة الطلب فحص قيمتين في الإعدادات، ولا يبدأ خيط العينات.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._profiles = OrderedDict()
+        self._slowest = []
+        self._sequence = itertools.count()
+        self._sampler = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """تسجيل خطافات الطلب ومسارات /profiles في التطبيق"""
+        app.config.setdefault('PROFILING_ENABLED', False)
+        app.config.setdefault('PROFILING_DIR', None)
+        app.config.setdefault('PROFILING_KEEP', DEFAULT_KEEP_PROFILES)
+        app.config.setdefault('PROFILING_SAMPLE_INTERVAL', DEFAULT_SAMPLE_INTERVAL)
+        app.config.setdefault('PROFILING_SAMPLER', False)
+        app.config.setdefault('PROFILING_SLOWEST', DEFAULT_SLOWEST)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/profiles', 'profiles_list', self.list_view)
+        app.add_url_rule('/profiles/<profile_id>', 'profiles_download', self.download_view)
+        app.add_url_rule('/profiles/<profile_id>/summary', 'profiles_summary', self.summary_view)
+        app.extensions['request_profiler'] = self
+
+    # دورة الطلب
+
+    def _start_request(self):
+        """بدء التحليل المطلوب لهذا الطلب (إن وُجد)"""
+        config = current_app.config
+        if not (config['PROFILING_ENABLED'] or config['PROFILING_SAMPLER']) or request.endpoint in PROFILER_ENDPOINTS:
+            return
+
+        state = {'started': time.perf_counter()}
+        mode = request.args.get('_profile') or request.headers.get('X-Profile')
+        if mode and config['PROFILING_ENABLED'] and session.get('logged_in') and mode in PROFILE_MODES:
+            state['mode'] = mode
+            if mode == 'cprofile':
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                    state['profile'] = profile
+                except ValueError:
+                    # محلل آخر يعمل على نفس الخيط: يُحلل الطلب بالعينات بدلاً منه
+                    state['mode'] = 'sample'
+        if config['PROFILING_SAMPLER'] or state.get('mode') == 'sample':
+            state['stacks'] = self._get_sampler(config['PROFILING_SAMPLE_INTERVAL']).watch(threading.get_ident())
+        g._request_profiler = state
+
+    def _finish_request(self, response):
+        """إيقاف التحليل وحفظ النتيجة وتسجيل الطلب في قائمة الأبطأ"""
+        state = g.pop('_request_profiler', None)
+        if state is None:
+            return response
+
+        duration = time.perf_counter() - state['started']
+        if 'profile' in state:
+            state['profile'].disable()
+        if 'stacks' in state:
+            self._sampler.unwatch(threading.get_ident())
+
+        meta = {
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'recorded_at': datetime.utcnow().isoformat()
+        }
+
+        if 'mode' in state:
+            if 'profile' in state:
+                state['profile'].create_stats()
+                data = marshal.dumps(state['profile'].stats)
+            else:
+                data = render_collapsed(state['stacks'])
+            profile_id = self._store(state['mode'], data, meta)
+            response.headers['X-Profile-Id'] = profile_id
+        elif current_app.config['PROFILING_SAMPLER']:
+            self._record_slow(duration, meta, state['stacks'])
+        return response
+
+    def _get_sampler(self, interval):
+        """خيط العينات (يبدأ عند أول استخدام)"""
+        with self._lock:
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = StackSampler(interval)
+                self._sampler.start()
+            return self._sampler
+
+    def _store(self, mode, data, meta):
+        """حفظ نتيجة تحليل في الذاكرة (آخر PROFILING_KEEP) وفي PROFILING_DIR إن حُدد"""
+        profile_id = uuid.uuid4().hex[:12]
+        meta = dict(meta, id=profile_id, mode=mode)
+        directory = current_app.config['PROFILING_DIR']
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            extension = 'prof' if mode == 'cprofile' else 'folded'
+            with open(os.path.join(directory, f'{profile_id}.{extension}'), 'wb') as dump:
+                dump.write(data if isinstance(data, bytes) else data.encode('utf-8'))
+
+        with self._lock:
+            self._profiles[profile_id] = (meta, data)
+            while len(self._profiles) > current_app.config['PROFILING_KEEP']:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def _record_slow(self, duration, meta, stacks):
+        """إبقاء أبطأ N طلب (كومة صغرى: الأسرع بينها يخرج أولاً)"""
+        limit = current_app.config['PROFILING_SLOWEST']
+        with self._lock:
+            if len(self._slowest) >= limit and duration <= self._slowest[0][0]:
+                return
+            entry = (duration, next(self._sequence), dict(meta, samples=sum(stacks.values())), stacks)
+            if len(self._slowest) < limit:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heapreplace(self._slowest, entry)
+
+    # المسارات
+
+    def _forbidden(self):
+        """رد الرفض لغير المسؤول"""
+        if not session.get('logged_in'):
+            return jsonify({'success': False, 'message': 'يجب تسجيل الدخول أولاً'}), 401
+        return None
+
+    def list_view(self):
+        """التحليلات المحفوظة وأبطأ الطلبات"""
+        denied = self._forbidden()
+        if denied:
+            return denied
+        with self._lock:
+            profiles = [meta for meta, _ in reversed(self._profiles.values())]
+            slowest = sorted(self._slowest, key=lambda entry: -entry[0])
+            slowest = [dict(meta, top_stacks=render_collapsed(Counter(dict(stacks.most_common(5)))).splitlines())
+                       for _, _, meta, stacks in slowest]
+        return jsonify({'success': True, 'data': {'profiles': profiles, 'slowest': slowest}})
+
+    def download_view(self, profile_id):
+        """ملف التحليل: pstats لـ cProfile و collapsed للعينات"""
+        denied = self._forbidden()
+        if denied:
+            return denied
+        with self._lock:
+            entry = self._profiles.get(profile_id)
+        if entry is None:
+            return jsonify({'success': False, 'message': 'التحليل غير موجود'}), 404
+        meta, data = entry
+        if meta['mode'] == 'cprofile':
+            return Response(data, mimetype='application/octet-stream', headers={
+                'Content-Disposition': f'attachment; filename={profile_id}.prof'
+            })
+        return Response(data, mimetype='text/plain; charset=utf-8')
+
+    def summary_view(self, profile_id):
+        """ملخص نصي: أعلى الدوال لـ cProfile (sort و limit) أو أكثر المكدسات عينات"""
+        denied = self._forbidden()
+        if denied:
+            return denied
+        with self._lock:
+            entry = self._profiles.get(profile_id)
+        if entry is None:
+            return jsonify({'success': False, 'message': 'التحليل غير موجود'}), 404
+        meta, data = entry
+        limit = request.args.get('limit', 40, type=int)
+        if meta['mode'] == 'sample':
+            lines = data.splitlines()[:limit]
+            return Response('\n'.join(lines) + '\n', mimetype='text/plain; charset=utf-8')
+
+        output = io.StringIO()
+        stats = pstats.Stats(StatsSource(marshal.loads(data)), stream=output)
+        stats.sort_stats(request.args.get('sort', 'cumulative')).print_stats(limit)
+        return Response(output.getvalue(), mimetype='text/plain; charset=utf-8')
+
+class StatsSource:
+    """مصدر لـ pstats.Stats من جدول إحصائيات محفوظ (نفس واجهة cProfile.Profile بعد create_stats)"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+request_profiler = RequestProfiler()
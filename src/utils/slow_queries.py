@@ -0,0 +1,249 @@
+"""
+سجل الاستعلامات البطيئة: كل استعلام يتجاوز الحد مع معاملاته ومكان استدعائه ومخطط تنفيذه (EXPLAIN QUERY PLAN)
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from flask import has_request_context, jsonify, request, session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_THRESHOLD_MS = 100
+DEFAULT_KEEP = 200
+DEFAULT_LOG_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_LOG_BACKUPS = 3
+MAX_PARAMETER_LENGTH = 200
+MAX_PARAMETERS = 50
+
+# مجلد المصدر: أول إطار داخله في المكدس هو مكان الاستدعاء
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def format_parameters(parameters):
+    """المعاملات كقائمة نصوص مختصرة (القيم الطويلة تُقص)"""
+    if parameters is None:
+        return []
+    if isinstance(parameters, dict):
+        values = [f'{key}={value!r}' for key, value in parameters.items()]
+    else:
+        values = [repr(value) for value in parameters]
+    return [
+        value if len(value) <= MAX_PARAMETER_LENGTH else value[:MAX_PARAMETER_LENGTH] + '…'
+        for value in values[:MAX_PARAMETERS]
+    ]
+
+def call_site():
+    """أول إطار في كود النظام (خارج هذا الملف والمكتبات): الملف:السطر (الدالة)"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(SOURCE_ROOT) and filename != __file__ and 'site-packages' not in filename:
+            return f'{os.path.relpath(filename, SOURCE_ROOT)}:{frame.f_lineno} ({frame.f_code.co_name})'
+        frame = frame.f_back
+    return None
+
+def full_scans(plan):
+    """خطوات المخطط التي تمسح جدولاً كاملاً دون فهرس (جداول FTS5 الافتراضية لها فهرسها الخاص)"""
+    return [
+        detail for detail in plan
+        if detail.startswith('SCAN ') and ' USING ' not in detail and ' VIRTUAL TABLE ' not in detail
+    ]
+
+class SlowQueryLog:
+    """سجل الاستعلامات البطيئة لمحرك SQLAlchemy
+
+    أحداث before/after_cursor_execute تقيس كل استعلام، وما يتجاوز SLOW_QUERY_THRESHOLD_MS يُسجل
+    بمعاملاته ومساره (عند وجود طلب) والدالة المستدعية، ولاستعلامات SELECT مخطط التنفيذ على
+    نفس الاتصال. السجل سطر JSON لكل استعلام في ملف دوار، وآخر SLOW_QUERY_KEEP منها في الذاكرة
+    عبر /admin/slow-queries. الكلفة على الاستعلامات السريعة قراءتان للوقت فقط.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=DEFAULT_KEEP)
+        self._logger = None
+        self._log_path = None
+        self._threshold = None
+        self._explain = True
+        self._engine_listeners = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """قراءة الإعدادات وتسجيل أحداث SQL ومسار العرض"""
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', DEFAULT_THRESHOLD_MS)
+        app.config.setdefault('SLOW_QUERY_EXPLAIN', True)
+        app.config.setdefault('SLOW_QUERY_KEEP', DEFAULT_KEEP)
+        app.config.setdefault('SLOW_QUERY_LOG', os.path.join(app.instance_path, 'slow_queries.log'))
+        app.config.setdefault('SLOW_QUERY_LOG_MAX_BYTES', DEFAULT_LOG_MAX_BYTES)
+        app.config.setdefault('SLOW_QUERY_LOG_BACKUPS', DEFAULT_LOG_BACKUPS)
+        app.config.setdefault('SLOW_QUERY_ENDPOINT', '/admin/slow-queries')
+
+        # حد فارغ أو صفري يعطل السجل
+        threshold = app.config['SLOW_QUERY_THRESHOLD_MS']
+        self._threshold = threshold / 1000 if threshold else None
+        self._explain = app.config['SLOW_QUERY_EXPLAIN']
+        self._log_path = app.config['SLOW_QUERY_LOG']
+        self._log_settings = (app.config['SLOW_QUERY_LOG_MAX_BYTES'], app.config['SLOW_QUERY_LOG_BACKUPS'])
+        with self._lock:
+            self._entries = deque(self._entries, maxlen=app.config['SLOW_QUERY_KEEP'])
+
+        if not self._engine_listeners:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(Engine, 'handle_error', self._handle_error)
+            self._engine_listeners = True
+
+        app.add_url_rule(app.config['SLOW_QUERY_ENDPOINT'], 'slow_queries', self.list_view, methods=['GET', 'DELETE'])
+        app.extensions['slow_query_log'] = self
+
+    # أحداث SQL
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._threshold is not None:
+            conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('slow_query_start')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        if elapsed >= self._threshold:
+            self.record(conn, statement, parameters, executemany, elapsed)
+
+    def _handle_error(self, exception_context):
+        # الاستعلام الفاشل لا يمر بـ after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('slow_query_start'):
+            connection.info['slow_query_start'].pop()
+
+    # التسجيل
+
+    def record(self, conn, statement, parameters, executemany, elapsed):
+        """تسجيل استعلام بطيء في الذاكرة والملف"""
+        plan = self.explain(conn, statement, parameters) if self._explain and not executemany else []
+        entry = {
+            'recorded_at': datetime.utcnow().isoformat(),
+            'duration_ms': round(elapsed * 1000, 2),
+            'statement': statement.strip(),
+            'parameters': [] if executemany else format_parameters(parameters),
+            'executemany': len(parameters) if executemany else None,
+            'call_site': call_site(),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'path': f'{request.method} {request.path}' if has_request_context() else None,
+            'plan': plan,
+            'full_scans': full_scans(plan)
+        }
+        with self._lock:
+            self._entries.append(entry)
+        logger = self._get_logger()
+        if logger is not None:
+            logger.warning(json.dumps(entry, ensure_ascii=False, default=str))
+
+    def explain(self, conn, statement, parameters):
+        """مخطط تنفيذ استعلام SELECT (SQLite فقط) بمؤشر منفصل على نفس الاتصال"""
+        keyword = statement.lstrip()[:6].upper()
+        if conn.dialect.name != 'sqlite' or not keyword.startswith(('SELECT', 'WITH')):
+            return []
+        try:
+            # مؤشر DBAPI مباشر لا يمر بأحداث المحرك فلا يُقاس ولا يُسجل
+            cursor = conn.connection.dbapi_connection.cursor()
+            try:
+                cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ())
+                return [row[-1] for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except Exception as e:
+            return [f'تعذر الحصول على المخطط: {str(e)}']
+
+    def _get_logger(self):
+        """سجل الملف الدوار (يُنشأ مع مجلده عند أول استعلام بطيء)"""
+        if self._logger is not None or not self._log_path:
+            return self._logger
+        with self._lock:
+            if self._logger is None:
+                try:
+                    os.makedirs(os.path.dirname(os.path.abspath(self._log_path)), exist_ok=True)
+                    max_bytes, backups = self._log_settings
+                    handler = RotatingFileHandler(self._log_path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+                    handler.setFormatter(logging.Formatter('%(message)s'))
+                    logger = logging.getLogger('housing.slow_queries')
+                    logger.propagate = False
+                    logger.handlers = [handler]
+                    self._logger = logger
+                except OSError as e:
+                    print(f'تعذر فتح سجل الاستعلامات البطيئة: {str(e)}')
+                    self._log_path = None
+        return self._logger
+
+    # العرض
+
+    def entries(self, full_scan_only=False, table=None):
+        """الاستعلامات المسجلة (الأحدث أولاً) مع تصفية اختيارية"""
+        with self._lock:
+            entries = list(reversed(self._entries))
+        if full_scan_only:
+            entries = [entry for entry in entries if entry['full_scans']]
+        if table:
+            pattern = re.compile(rf'\b{re.escape(table)}\b')
+            entries = [entry for entry in entries if pattern.search(entry['statement'])]
+        return entries
+
+    def summary(self, entries):
+        """تجميع الاستعلامات حسب نصها: العدد والزمن الكلي والأقصى ومخطط آخر تنفيذ وأماكن الاستدعاء"""
+        groups = {}
+        for entry in entries:
+            group = groups.get(entry['statement'])
+            if group is None:
+                group = groups[entry['statement']] = {
+                    'statement': entry['statement'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'plan': entry['plan'], 'full_scans': entry['full_scans'], 'call_sites': []
+                }
+            group['count'] += 1
+            group['total_ms'] = round(group['total_ms'] + entry['duration_ms'], 2)
+            group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+            site = ' @ '.join(filter(None, (entry['endpoint'], entry['call_site'])))
+            if site and site not in group['call_sites']:
+                group['call_sites'].append(site)
+        return sorted(groups.values(), key=lambda group: -group['total_ms'])
+
+    def list_view(self):
+        """مسار /admin/slow-queries: GET للعرض (full_scan، table، limit) و DELETE للتصفير"""
+        if not session.get('logged_in'):
+            return jsonify({'success': False, 'message': 'يجب تسجيل الدخول أولاً'}), 401
+        try:
+            if request.method == 'DELETE':
+                self.reset()
+                return jsonify({'success': True, 'message': 'تم تصفير سجل الاستعلامات البطيئة'})
+
+            entries = self.entries(
+                full_scan_only=request.args.get('full_scan') in ('1', 'true'),
+                table=request.args.get('table', '').strip() or None
+            )
+            limit = request.args.get('limit', 50, type=int)
+            return jsonify({
+                'success': True,
+                'data': {
+                    'threshold_ms': self._threshold * 1000 if self._threshold is not None else None,
+                    'log_file': self._log_path,
+                    'total': len(entries),
+                    'statements': self.summary(entries)[:limit],
+                    'recent': entries[:limit]
+                }
+            })
+        except Exception as e:
+            return jsonify({'success': False, 'message': f'خطأ في جلب الاستعلامات البطيئة: {str(e)}'})
+
+    def reset(self):
+        """تفريغ الاستعلامات المحفوظة في الذاكرة"""
+        with self._lock:
+            self._entries.clear()
+
+slow_query_log = SlowQueryLog()
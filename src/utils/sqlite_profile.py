@@ -0,0 +1,92 @@
+"""
+إعدادات أداء SQLite: أوامر PRAGMA عند فتح كل اتصال (WAL، الذاكرة المؤقتة، مهلة الانتظار) وإعدادات مجمع الاتصالات
+"""
+
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+# بالترتيب: مهلة الانتظار أولاً حتى لا يفشل تحويل journal_mode إذا كان ملف القاعدة مقفلاً
+DEFAULT_SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,          # انتظار القفل بالمللي ثانية بدلاً من خطأ database is locked فوراً
+    'journal_mode': 'WAL',         # القراءة لا تنتظر الكتابة والكتابة لا تنتظر القراءة
+    'synchronous': 'NORMAL',       # آمن مع WAL (لا تلف)؛ قد تضيع آخر معاملة عند انقطاع الكهرباء فقط
+    'foreign_keys': 'ON',
+    'cache_size': -32000,          # بالكيلوبايت عند السالب: ~32MB لكل اتصال
+    'mmap_size': 268435456,        # قراءة الملف عبر الذاكرة حتى 256MB
+    'temp_store': 'MEMORY'         # الجداول المؤقتة للترتيب والتجميع في الذاكرة
+}
+
+# SQLAlchemy 2 يستخدم QueuePool لملفات SQLite؛ الاتصالات تبقى مفتوحة فلا تبدأ ذاكرتها فارغة
+DEFAULT_SQLITE_POOL = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+    'pool_pre_ping': False
+}
+
+def is_file_database(uri):
+    """هل الرابط لقاعدة SQLite في ملف (لا في الذاكرة)"""
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite':
+        return False
+    return bool(url.database) and url.database != ':memory:' and url.query.get('mode') != 'memory'
+
+def merge_settings(defaults, overrides):
+    """دمج الإعدادات الافتراضية مع إعدادات التطبيق؛ القيمة None تلغي الإعداد"""
+    settings = dict(defaults)
+    settings.update(overrides or {})
+    return {key: value for key, value in settings.items() if value is not None}
+
+def apply_pragmas(dbapi_connection, pragmas):
+    """تنفيذ أوامر PRAGMA على اتصال sqlite3"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+def read_pragmas(connection, names=None):
+    """القيم الفعلية لأوامر PRAGMA على اتصال SQLAlchemy (للتحقق والعرض)"""
+    return {
+        name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+        for name in (names or DEFAULT_SQLITE_PRAGMAS)
+    }
+
+class SQLiteProfile:
+    """ملف أداء SQLite للتطبيق
+
+    يُستدعى init_app قبل db.init_app لأنه يضيف إعدادات المجمع إلى SQLALCHEMY_ENGINE_OPTIONS
+    (لقواعد الملفات فقط؛ قواعد الذاكرة لها مجمعها الخاص). أوامر PRAGMA تُنفذ في حدث connect
+    لكل اتصال جديد، وتُخصص بـ SQLITE_PRAGMAS و SQLITE_POOL في إعدادات التطبيق.
+    """
+
+    def __init__(self, app=None):
+        self.pragmas = dict(DEFAULT_SQLITE_PRAGMAS)
+        self._connect_listener = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """قراءة الإعدادات وإضافة خيارات المحرك وتسجيل حدث الاتصال"""
+        self.pragmas = merge_settings(DEFAULT_SQLITE_PRAGMAS, app.config.get('SQLITE_PRAGMAS'))
+        pool = merge_settings(DEFAULT_SQLITE_POOL, app.config.get('SQLITE_POOL'))
+
+        uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+        if uri and is_file_database(uri):
+            # الخيارات المحددة صراحة في التطبيق لها الأولوية
+            options = dict(pool)
+            options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+        if not self._connect_listener:
+            event.listen(Engine, 'connect', self._on_connect)
+            self._connect_listener = True
+        app.extensions['sqlite_profile'] = self
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            apply_pragmas(dbapi_connection, self.pragmas)
+
+sqlite_profile = SQLiteProfile()
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from setup_new_system import create_app
+from models.user import db
+from models.core import setup_initial_data
+from models.cache import reference_cache
+from models.student_names import student_names
+from routes.dashboard_advanced import dashboard_advanced_bp
+from routes.archive_system import archive_system_bp
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'SLOW_QUERY_THRESHOLD_MS': 0,
+        'TESTING': True
+    })
+    app.register_blueprint(dashboard_advanced_bp, url_prefix='/api')
+    app.register_blueprint(archive_system_bp, url_prefix='/api')
+    with app.app_context():
+        db.create_all()
+        setup_initial_data()
+        # ذاكرات العملية مشتركة بين الاختبارات
+        reference_cache.clear()
+        student_names.invalidate()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+    return client
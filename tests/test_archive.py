@@ -0,0 +1,101 @@
+from datetime import date
+from models.user import db
+from models.core import Archive, Bed, BedAssignment, Payment, Student
+
+def add_resident(name='سارة علي', phone='0501112233', national_id='1098765432', **fields):
+    bed = Bed.query.filter_by(status='available').order_by(Bed.id).first()
+    student = Student(name=name, phone=phone, national_id=national_id, status='active', **fields)
+    db.session.add(student)
+    db.session.flush()
+    db.session.add(BedAssignment(student_id=student.id, bed_id=bed.id, room_id=bed.room_id,
+                                 start_date=date(2025, 1, 1), status='active'))
+    bed.status = 'occupied'
+    db.session.commit()
+    return student.id, bed.id
+
+def test_archive_student(client):
+    student_id, bed_id = add_resident()
+
+    response = client.post('/api/archive/student', json={
+        'student_id': student_id, 'departure_date': '2025-03-01', 'departure_reason': 'تخرج'
+    }).get_json()
+
+    assert response['success'], response['message']
+    record = db.session.get(Archive, response['archive_id'])
+    bed = db.session.get(Bed, bed_id)
+    assert record.bed_code == bed.bed_code
+    assert record.phone == '0501112233'
+    assert record.national_id == '1098765432'
+    assert record.reason_for_leaving == 'تخرج'
+    assert bed.status == 'available'
+    assert db.session.get(Student, student_id).status == 'archived'
+    assert BedAssignment.query.filter_by(student_id=student_id).one().status == 'completed'
+
+def test_archive_student_without_assignment(client):
+    student = Student(name='منى', phone='0500000000', status='active')
+    db.session.add(student)
+    db.session.commit()
+
+    response = client.post('/api/archive/student', json={'student_id': student.id}).get_json()
+
+    assert response['success'], response['message']
+    assert db.session.get(Archive, response['archive_id']).bed_code == ''
+
+def add_payment(student_id, amount, payment_type, payment_date):
+    db.session.add(Payment(student_id=student_id, amount=amount, payment_type=payment_type,
+                           payment_date=payment_date, month_year=payment_date.strftime('%Y-%m'),
+                           status='confirmed'))
+
+def test_archive_student_stores_final_balance(client):
+    # ثلاثة أشهر (يناير - مارس) بإيجار 55 = 165؛ دُفع 110 إيجاراً و100 تأميناً
+    student_id, _ = add_resident(contract_start=date(2025, 1, 1), rent_amount=55.0)
+    add_payment(student_id, 55, 'rent', date(2025, 1, 1))
+    add_payment(student_id, 55, 'rent', date(2025, 2, 1))
+    add_payment(student_id, 100, 'deposit', date(2025, 1, 1))
+    db.session.commit()
+
+    response = client.post('/api/archive/student', json={
+        'student_id': student_id, 'departure_date': '2025-03-01'
+    }).get_json()
+
+    assert response['success'], response['message']
+    record = db.session.get(Archive, response['archive_id'])
+    # العجز 55 يُخصم من التأمين فيُرد 45
+    assert record.total_due == 165
+    assert record.total_paid == 210
+    assert record.final_balance == 0
+    assert record.refund_amount == 45
+    assert response['financial_summary']['refund_amount'] == 45
+
+def test_archive_student_with_credit(client):
+    student_id, _ = add_resident(contract_start=date(2025, 1, 1), rent_amount=55.0)
+    add_payment(student_id, 220, 'rent', date(2025, 1, 1))
+    add_payment(student_id, 100, 'deposit', date(2025, 1, 1))
+    db.session.commit()
+
+    response = client.post('/api/archive/student', json={
+        'student_id': student_id, 'departure_date': '2025-03-01'
+    }).get_json()
+
+    assert response['success'], response['message']
+    record = db.session.get(Archive, response['archive_id'])
+    assert record.final_balance == 55
+    assert record.refund_amount == 100
+
+def test_archive_student_with_string_id(client):
+    student_id, _ = add_resident(contract_start=date(2025, 1, 1), rent_amount=55.0)
+    add_payment(student_id, 100, 'deposit', date(2025, 1, 1))
+    db.session.commit()
+
+    response = client.post('/api/archive/student', json={
+        'student_id': str(student_id), 'departure_date': '2025-01-20'
+    }).get_json()
+
+    assert response['success'], response['message']
+    assert db.session.get(Archive, response['archive_id']).refund_amount == 45
+
+def test_archive_student_rejects_invalid_id(client):
+    for student_id in ('abc', [1], None):
+        response = client.post('/api/archive/student', json={'student_id': student_id})
+        assert response.status_code == 400
+        assert not response.get_json()['success']
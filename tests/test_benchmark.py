@@ -0,0 +1,61 @@
+import json
+from sqlalchemy import func
+from models.user import db
+from models.core import Archive, Bed, Payment, Student, reconcile_occupancy_counters
+from setup_new_system import (
+    BENCHMARK_REQUESTS, SYNTHETIC_SCALES, compare_benchmark_reports, create_app,
+    generate_synthetic_data, run_benchmark_suite
+)
+
+SCALE = {'buildings': 2, 'rooms': 4, 'beds_per_room': 2, 'residents': 30, 'years': 1}
+
+def synthetic_fingerprint(tmp_path, name, seed):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / name)})
+    with app.app_context():
+        db.create_all()
+        counts = generate_synthetic_data(seed=seed, **SCALE)
+        fingerprint = (
+            counts,
+            [name for name, in db.session.execute(db.select(Student.name).order_by(Student.id))],
+            db.session.execute(db.select(func.sum(Payment.amount))).scalar(),
+            reconcile_occupancy_counters(repair=False)
+        )
+        db.session.remove()
+        db.engine.dispose()
+    return fingerprint
+
+def test_synthetic_data_is_deterministic(tmp_path):
+    first = synthetic_fingerprint(tmp_path, 'first.db', seed=7)
+    second = synthetic_fingerprint(tmp_path, 'second.db', seed=7)
+    other = synthetic_fingerprint(tmp_path, 'other.db', seed=8)
+
+    assert first == second
+    assert first[1] != other[1]
+    counts, _, _, drift = first
+    assert counts['beds'] == 16 and counts['students'] == 30
+    assert counts['archives'] == 30 - counts['active_students']
+    assert drift == []
+
+def test_synthetic_data_occupies_beds(app):
+    counts = generate_synthetic_data(**SCALE)
+
+    occupied = Bed.query.filter(Bed.bed_code.like('S%'), Bed.status == 'occupied').count()
+    assert occupied == counts['active_students']
+    assert Archive.query.filter(Archive.bed_code == '').count() == 0
+    assert Student.query.filter_by(status='archived').count() == counts['archives']
+
+def test_benchmark_report(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(SYNTHETIC_SCALES, 'tiny', SCALE)
+    monkeypatch.setattr('setup_new_system.BENCHMARK_IMPORT_ROWS', 20)
+    report_path = tmp_path / 'report.json'
+
+    report = run_benchmark_suite(str(report_path), scale='tiny', repeat=1)
+
+    assert json.loads(report_path.read_text(encoding='utf-8'))['cases'] == report['cases']
+    names = {case['name'] for case in report['cases']}
+    assert {name for name, *_ in BENCHMARK_REQUESTS} <= names
+    assert {'get_system_statistics', 'import_payments', 'archive_student'} <= names
+    assert [case['name'] for case in report['cases'] if case['status'] not in (200, 'ok')] == []
+    assert report['dataset']['students'] == SCALE['residents']
+    assert compare_benchmark_reports(report, report) == []
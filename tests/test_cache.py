@@ -0,0 +1,37 @@
+from flask import g
+from models.user import db
+from models.core import Room
+from models.cache import get_room, reference_cache
+
+def test_cache_hit_keeps_pending_edit(app):
+    room = Room.query.first()
+    get_room(room.id)
+    db.session.expunge_all()
+    # المدخل في ذاكرة العملية الآن؛ طلب جديد يعدل السجل ثم يقرؤه عبر الذاكرة
+    g.pop('_reference_cache', None)
+
+    room = db.session.get(Room, room.id)
+    original = room.total_beds
+    room.total_beds = original + 3
+    hits = reference_cache.hits
+
+    cached = get_room(room.id)
+
+    assert cached is room
+    assert cached.total_beds == original + 3
+    assert room in db.session.dirty
+    assert reference_cache.hits == hits
+    db.session.commit()
+    assert db.session.get(Room, room.id).total_beds == original + 3
+
+def test_cache_hit_without_session_row(app):
+    room_id = Room.query.first().id
+    get_room(room_id)
+    db.session.expunge_all()
+    g.pop('_reference_cache', None)
+    hits = reference_cache.hits
+
+    room = get_room(room_id)
+
+    assert room.id == room_id
+    assert reference_cache.hits == hits + 1
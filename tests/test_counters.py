@@ -0,0 +1,58 @@
+from models.user import db
+from models.core import (Bed, Building, Room, add_bed_to_room, get_system_statistics,
+                         reconcile_occupancy_counters, remove_bed_from_room)
+
+def counters(model, object_id):
+    obj = db.session.get(model, object_id)
+    return obj.total_beds, obj.occupied_beds, obj.available_beds
+
+def test_orm_bed_insert_and_delete_update_totals(app):
+    room = Room.query.first()
+    building_id = room.building_id
+    room_before = counters(Room, room.id)
+    building_before = counters(Building, building_id)
+    total_before = get_system_statistics()['total_beds']
+
+    bed = Bed(bed_code='TEST-1', building_id=building_id, room_id=room.id,
+              bed_number=99, price=55.0, status='available')
+    db.session.add(bed)
+    db.session.commit()
+
+    assert counters(Room, room.id) == (room_before[0] + 1, room_before[1], room_before[2] + 1)
+    assert counters(Building, building_id) == (building_before[0] + 1, building_before[1], building_before[2] + 1)
+    assert db.session.get(Room, room.id).monthly_revenue == (room_before[0] + 1) * room.price_per_bed
+    assert get_system_statistics()['total_beds'] == total_before + 1
+
+    db.session.delete(bed)
+    db.session.commit()
+
+    assert counters(Room, room.id) == room_before
+    assert counters(Building, building_id) == building_before
+    assert get_system_statistics()['total_beds'] == total_before
+    assert reconcile_occupancy_counters(repair=False) == []
+
+def test_moving_bed_between_rooms(app):
+    first, second = Room.query.order_by(Room.id).limit(2).all()
+    first_before, second_before = counters(Room, first.id), counters(Room, second.id)
+
+    bed = Bed.query.filter_by(room_id=first.id, status='available').first()
+    bed.room_id = second.id
+    db.session.commit()
+
+    assert counters(Room, first.id) == (first_before[0] - 1, first_before[1], first_before[2] - 1)
+    assert counters(Room, second.id) == (second_before[0] + 1, second_before[1], second_before[2] + 1)
+    assert reconcile_occupancy_counters(repair=False) == []
+
+def test_bed_helpers_count_once(app):
+    room = Room.query.first()
+    room_before = counters(Room, room.id)
+
+    success, message = add_bed_to_room(room.id)
+    assert success, message
+    assert counters(Room, room.id)[0] == room_before[0] + 1
+
+    bed = Bed.query.filter_by(room_id=room.id).order_by(Bed.bed_number.desc()).first()
+    success, message = remove_bed_from_room(bed.id)
+    assert success, message
+    assert counters(Room, room.id) == room_before
+    assert reconcile_occupancy_counters(repair=False) == []
@@ -0,0 +1,77 @@
+import csv
+import io
+from datetime import date
+from sqlalchemy import event
+from models.user import db
+from models.core import Bed, BedAssignment, Payment, Student
+
+def seed_students(count):
+    beds = Bed.query.filter_by(status='available').order_by(Bed.id).limit(count).all()
+    for i, bed in enumerate(beds):
+        student = Student(name=f'طالبة {i}', phone=f'05{i:08d}', status='active')
+        db.session.add(student)
+        db.session.flush()
+        db.session.add(BedAssignment(student_id=student.id, bed_id=bed.id, room_id=bed.room_id,
+                                     start_date=date(2025, 1, 1), status='active'))
+        bed.status = 'occupied'
+        db.session.add(Payment(student_id=student.id, amount=55, payment_type='rent',
+                               payment_date=date(2025, 1, 1), month_year='2025-01', status='confirmed'))
+        db.session.add(Payment(student_id=student.id, amount=100, payment_type='deposit',
+                               payment_date=date(2025, 1, 1), month_year='2025-01', status='pending'))
+    # طالبة دون سرير ولا مدفوعات
+    db.session.add(Student(name='دون سرير', status='active'))
+    db.session.commit()
+    db.session.expunge_all()
+
+def export_students(client):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get('/api/dashboard/export/students?format=csv')
+        body = response.get_data(as_text=True)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    return list(csv.reader(io.StringIO(body.lstrip('﻿')))), statements
+
+def test_students_export_rows(client):
+    seed_students(3)
+    rows, _ = export_students(client)
+
+    assert len(rows) == 5
+    first = rows[1]
+    bed = Bed.query.order_by(Bed.id).first()
+    assert first[0] == 'طالبة 0'
+    assert first[6] == bed.bed_code
+    assert float(first[11]) == 55
+    assert rows[-1][0] == 'دون سرير'
+    assert rows[-1][6] == '' and float(rows[-1][11]) == 0
+
+def test_students_export_constant_queries(client):
+    seed_students(2)
+    _, few = export_students(client)
+    seed_students(20)
+    _, many = export_students(client)
+
+    assert len(many) == len(few)
+
+def test_xlsx_export_is_streamed(client, monkeypatch):
+    from openpyxl import load_workbook
+    import routes.dashboard_advanced as dashboard
+    monkeypatch.setattr(dashboard, 'EXPORT_BATCH_SIZE', 5)
+    seed_students(12)
+
+    response = client.get('/api/dashboard/export/beds?format=xlsx')
+    assert response.is_streamed
+    chunks = list(response.response)
+    assert len(chunks) > 3
+
+    workbook = load_workbook(io.BytesIO(b''.join(chunks)), read_only=True)
+    rows = list(workbook.active.iter_rows(values_only=True))
+    bed = Bed.query.order_by(Bed.id).first()
+    assert workbook.sheetnames == ['الأسرة']
+    assert rows[0][0] == 'رقم السرير'
+    assert len(rows) == Bed.query.count() + 1
+    assert rows[1][0] == bed.bed_code
+    assert rows[1][4] == bed.price
+    assert rows[1][6] == 'طالبة 0'
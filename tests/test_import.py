@@ -0,0 +1,71 @@
+from datetime import date
+import pandas as pd
+from models.user import db
+from models.core import Expense, Payment, Student
+from models.snapshot import get_dashboard_snapshot
+from routes.dashboard_advanced import (
+    process_expenses_excel, process_payments_excel, process_students_excel
+)
+
+# صيغ مختلفة في نفس العمود كما في ملفات Excel الفعلية، وقيمة غير صالحة واحدة
+MIXED_DATES = ['2025-01-05', '05/02/2025', '2025-03-10 00:00:00', 'ليس تاريخاً']
+PARSED_DATES = [date(2025, 1, 5), date(2025, 5, 2), date(2025, 3, 10)]
+
+def test_expenses_mixed_date_formats(app):
+    result = process_expenses_excel(pd.DataFrame({
+        'description': ['كهرباء', 'ماء', 'صيانة', 'تنظيف'],
+        'amount': [10, 20, 30, 40],
+        'expense_date': MIXED_DATES
+    }))
+
+    assert result['success'], result['message']
+    assert result['processed'] == 3
+    assert len(result['errors']) == 1
+    assert [expense.expense_date for expense in Expense.query.order_by(Expense.id)] == PARSED_DATES
+
+def test_payments_mixed_date_formats(app):
+    db.session.add(Student(name='هند سالم', phone='0501234567', status='active'))
+    db.session.commit()
+
+    result = process_payments_excel(pd.DataFrame({
+        'student_name': ['هند سالم'] * 4,
+        'amount': [55] * 4,
+        'payment_date': MIXED_DATES
+    }))
+
+    assert result['success'], result['message']
+    assert result['processed'] == 3
+    payments = Payment.query.order_by(Payment.id).all()
+    assert [payment.payment_date for payment in payments] == PARSED_DATES
+    assert [payment.month_year for payment in payments] == ['2025-01', '2025-05', '2025-03']
+
+def test_students_mixed_date_formats(app):
+    result = process_students_excel(pd.DataFrame({
+        'name': ['أمل', 'بشرى', 'جود', 'دانة'],
+        'phone': ['0500000001', '0500000002', '0500000003', '0500000004'],
+        'contract_start': MIXED_DATES
+    }))
+
+    assert result['success'], result['message']
+    assert result['processed'] == 3
+    assert [student.contract_start for student in Student.query.order_by(Student.id)] == PARSED_DATES
+
+def test_imports_invalidate_dashboard_snapshot(app):
+    db.session.add(Student(name='هند سالم', phone='0501234567', status='active'))
+    db.session.commit()
+    today = date.today().isoformat()
+    before, _ = get_dashboard_snapshot()
+
+    result = process_payments_excel(pd.DataFrame({
+        'student_name': ['هند سالم'], 'amount': [55], 'payment_date': [today]
+    }))
+    assert result['success'], result['message']
+    after_payments, _ = get_dashboard_snapshot()
+    assert after_payments['payment_summary']['total_amount'] == before['payment_summary']['total_amount'] + 55
+
+    result = process_expenses_excel(pd.DataFrame({
+        'description': ['كهرباء'], 'amount': [30], 'category': ['utilities'], 'expense_date': [today]
+    }))
+    assert result['success'], result['message']
+    after_expenses, _ = get_dashboard_snapshot()
+    assert after_expenses['expense_summary']['total_amount'] == before['expense_summary']['total_amount'] + 30
@@ -0,0 +1,15 @@
+from utils.metrics import request_metrics
+
+def test_blueprint_route_is_measured(app, client):
+    app.config['METRICS_HEADERS'] = True
+    request_metrics.reset()
+
+    response = client.get('/api/dashboard/beds/available')
+
+    assert response.status_code == 200
+    assert int(response.headers['X-SQL-Statements']) > 0
+    assert 'X-DB-Time-ms' in response.headers
+
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total{endpoint="dashboard_advanced.get_available_beds",method="GET",status="200"} 1' in metrics
+    assert 'http_request_sql_statements_count{endpoint="dashboard_advanced.get_available_beds",method="GET"} 1' in metrics
@@ -0,0 +1,50 @@
+import pandas as pd
+from models.user import db
+from models.core import Payment, Student
+from models.student_names import find_students, resolve_student
+from routes.dashboard_advanced import process_payments_excel
+
+def add_students(*names):
+    students = [Student(name=name, phone=f'05000000{i:02d}', status='active') for i, name in enumerate(names)]
+    db.session.add_all(students)
+    db.session.commit()
+    return [student.id for student in students]
+
+def test_fuzzy_match_is_only_a_candidate(app):
+    sara_ahmed, = add_students('سارة أحمد')
+
+    student_id, candidates = resolve_student('سارة محمد')
+
+    assert student_id is None
+    assert [candidate.student_id for candidate in candidates] == [sara_ahmed]
+    # البحث والاقتراحات تبقى تقريبية
+    assert find_students('سارة محمد')[0].student_id == sara_ahmed
+
+def test_exact_and_all_token_matches_resolve(app):
+    sara_ahmed, fatima_ali = add_students('سارة أحمد', 'فاطمة علي الزهراني')
+
+    assert resolve_student('ساره احمد')[0] == sara_ahmed
+    assert resolve_student('فاطمة الزهراني')[0] == fatima_ali
+
+def test_shared_tokens_stay_ambiguous(app):
+    add_students('نورة خالد', 'نورة سعد')
+
+    student_id, candidates = resolve_student('نورة')
+
+    assert student_id is None
+    assert len(candidates) == 2
+
+def test_payments_import_rejects_fuzzy_names(app):
+    add_students('سارة أحمد')
+
+    result = process_payments_excel(pd.DataFrame({
+        'student_name': ['سارة محمد', 'سارة أحمد'],
+        'amount': [55, 55],
+        'payment_date': ['2025-01-05', '2025-01-05']
+    }))
+
+    assert result['success'], result['message']
+    assert result['processed'] == 1
+    assert len(result['errors']) == 1
+    assert 'سارة أحمد' in str(result['errors'][0])
+    assert Payment.query.count() == 1
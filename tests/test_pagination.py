@@ -0,0 +1,30 @@
+import base64
+import json
+from datetime import date
+import pytest
+from models.core import Payment
+from models.pagination import decode_cursor, encode_cursor
+
+def raw_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+KEY = [Payment.payment_date, Payment.id]
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor([date(2025, 3, 1), 7]), KEY) == [date(2025, 3, 1), 7]
+
+@pytest.mark.parametrize('values', [
+    [5, 1],                 # رقم مكان تاريخ
+    ['2025-03-01', 'abc'],  # نص مكان رقم
+    ['2025-03-01', True],
+    [{'a': 1}, 1],
+    ['not-a-date', 1],
+    ['2025-03-01'],
+])
+def test_invalid_cursor_values(values):
+    with pytest.raises(ValueError, match='مؤشر الصفحة غير صالح'):
+        decode_cursor(raw_cursor(values), KEY)
+
+def test_invalid_cursor_encoding():
+    with pytest.raises(ValueError, match='مؤشر الصفحة غير صالح'):
+        decode_cursor('***', KEY)
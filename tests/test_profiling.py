@@ -0,0 +1,16 @@
+def test_profile_blueprint_route(app, client):
+    app.config['PROFILING_ENABLED'] = True
+
+    response = client.get('/api/dashboard/beds/available?_profile=cprofile')
+
+    assert response.status_code == 200
+    profile_id = response.headers['X-Profile-Id']
+
+    summary = client.get(f'/profiles/{profile_id}/summary?limit=10')
+    assert summary.status_code == 200
+    assert summary.mimetype == 'text/plain'
+    assert 'get_available_beds' in summary.get_data(as_text=True)
+
+    profiles = client.get('/profiles').get_json()['data']['profiles']
+    assert profiles[0]['id'] == profile_id
+    assert profiles[0]['endpoint'] == 'dashboard_advanced.get_available_beds'